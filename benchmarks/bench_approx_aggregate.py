@@ -0,0 +1,40 @@
+"""Exact vs approximate aggregate of a high-cardinality column.
+
+Runs process_upload with operation=aggregate on the key column of
+make_table_csv at several cardinalities, exactly (a dict of every value)
+and with approximate=true (HyperLogLog + Space-Saving top-K). Reports the
+time of an untraced run, the peak traced allocation of a second run and
+the size of the JSON response.
+
+    python benchmarks/bench_approx_aggregate.py [rows]
+"""
+import io
+import json
+import sys
+import time
+
+from common import make_table_csv, measure
+
+import main
+
+
+def main_(rows):
+    print(f"{rows} rows, python engine")
+    print(f"{'keys':>9} {'mode':<12} {'seconds':>8} {'peak MiB':>9} {'response':>10} {'distinct':>9}")
+    for cardinality in (100, 10_000, rows):
+        payload = make_table_csv(rows, cardinality=cardinality)
+        for mode, approximate in (("exact", False), ("approximate", True)):
+            params = main.OperationParams(
+                operation="aggregate", filter_column="key", engine="python", approximate=approximate
+            )
+            start = time.perf_counter()
+            body = main.process_upload(io.BytesIO(payload), params)
+            seconds = time.perf_counter() - start
+            _, _, peak = measure(main.process_upload, io.BytesIO(payload), params)
+            result = json.loads(body)
+            distinct = result["distinct"] if approximate else len(result["aggregation"])
+            print(f"{cardinality:>9} {mode:<12} {seconds:>8.3f} {peak / 2**20:>9.1f} {len(body) / 1024:>8.0f}KB {distinct:>9}")
+
+
+if __name__ == "__main__":
+    main_(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
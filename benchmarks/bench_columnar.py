@@ -0,0 +1,108 @@
+"""Memory and latency of List[Dict] rows vs the columnar CSVTable.
+
+The "dicts" side reproduces the previous implementation: DictReader into a
+list of dicts and pure-Python loops that call str() on every cell. The
+"table" side parses into a CSVTable and runs the columnar operations.
+
+    python benchmarks/bench_columnar.py [rows]
+"""
+import csv
+import gc
+import io
+import sys
+import time
+
+from common import make_csv_bytes, measure, mib
+
+from main import (
+    CSVTable,
+    filter_table,
+    process_csv_aggregate,
+    process_csv_view,
+    read_csv_stream,
+    sort_table,
+    transform_table,
+)
+
+
+def dict_parse(payload):
+    return list(csv.DictReader(io.StringIO(payload.decode("utf-8"))))
+
+
+def dict_filter(rows):
+    return [row for row in rows if str(row.get("city", "")) == "Paris"]
+
+
+def dict_transform(rows):
+    for row in rows:
+        row["name"] = str(row.get("name", "")).upper()
+    return rows
+
+
+def dict_aggregate(rows):
+    counts = {}
+    for row in rows:
+        key = str(row.get("city", ""))
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def dict_sort(rows):
+    return sorted(rows, key=lambda x: str(x.get("city", "")))
+
+
+def table_parse(payload):
+    return CSVTable.from_stream(read_csv_stream(io.BytesIO(payload)))
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def run_cases(cases):
+    """Time each case in isolation and return {name: seconds}"""
+    timings = {}
+    for name, case in cases:
+        gc.collect()
+        timings[name] = timed(case)
+    return timings
+
+
+def main(rows):
+    payload = make_csv_bytes(rows)
+    print(f"{rows} rows, {len(payload) / 1e6:.1f} MB CSV")
+
+    # Each side runs with only its own data resident, so GC work on one
+    # representation does not skew the other's timings
+    dict_rows, _, dict_mem = measure(dict_parse, payload)
+    dict_times = run_cases([
+        ("parse", lambda: dict_parse(payload)),
+        ("filter", lambda: dict_filter(dict_rows)),
+        ("aggregate", lambda: dict_aggregate(dict_rows)),
+        ("sort", lambda: dict_sort(dict_rows)),
+        ("transform", lambda: dict_transform(dict_rows)),
+        ("view (to rows)", lambda: dict_rows),
+    ])
+    del dict_rows
+
+    table, _, table_mem = measure(table_parse, payload)
+    table_times = run_cases([
+        ("parse", lambda: table_parse(payload)),
+        ("filter", lambda: filter_table(table, "city", "Paris")),
+        ("aggregate", lambda: process_csv_aggregate(table, "city")),
+        ("sort", lambda: sort_table(table, "city")),
+        ("transform", lambda: transform_table(table, "name", "uppercase")),
+        ("view (to rows)", lambda: process_csv_view(table)),
+    ])
+
+    print(f"{'':<22} {'dicts':>14} {'table':>14}")
+    print(f"{'resident after parse':<22} {mib(dict_mem):>14} {mib(table_mem):>14}")
+    print("latency (s); table operations return tables, view includes the conversion back to row dicts")
+    for name in dict_times:
+        print(f"{name:<22} {dict_times[name]:>14.3f} {table_times[name]:>14.3f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
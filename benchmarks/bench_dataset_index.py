@@ -0,0 +1,55 @@
+"""Repeated filters and sorts on a stored dataset, with and without column indexes.
+
+Parses one upload into a table, then runs the same queries against a plain
+copy (a scan per query) and an indexed one (what the dataset store keeps):
+equality filters on different values of one column, a numeric range and
+a sort. The first indexed query includes building the index.
+
+    python benchmarks/bench_dataset_index.py [rows]
+"""
+import io
+import sys
+import time
+
+from common import make_csv_bytes
+
+import main
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main_(rows):
+    table = main.CSVTable.from_stream(main.read_csv_stream(io.BytesIO(make_csv_bytes(rows))))
+    ages = [str(age) for age in range(18, 38)]
+    cases = [
+        ("filter age=<value> x20", [
+            lambda source, age=age: main.filter_table(source, "age", age, "python") for age in ages
+        ]),
+        ("score between x5", [
+            lambda source, low=low: main.filter_table_expression(
+                source, {"column": "score", "op": "between", "value": [low, low + 1]}, "python"
+            ) for low in range(0, 50, 10)
+        ]),
+        ("sort score desc x5", [
+            lambda source: main.sort_table(source, "score", "python", "numeric", True)
+        ] * 5),
+    ]
+    print(f"{rows} rows, python engine; seconds for the first query / the rest")
+    print(f"{'case':<24} {'scan first':>10} {'scan rest':>10} {'index first':>12} {'index rest':>11}")
+    for name, queries in cases:
+        timings = []
+        for indexed in (False, True):
+            source = main.CSVTable(table.columns, table.data)
+            source.indexed = indexed
+            first = timed(lambda: queries[0](source))
+            rest = sum(timed(lambda query=query: query(source)) for query in queries[1:])
+            timings += [first, rest]
+        print(f"{name:<24} {timings[0]:>10.3f} {timings[1]:>10.3f} {timings[2]:>12.3f} {timings[3]:>11.3f}")
+
+
+if __name__ == "__main__":
+    main_(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
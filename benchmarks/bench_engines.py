@@ -0,0 +1,42 @@
+"""Throughput of the python, numpy and arrow engines on a CSVTable.
+
+"cold" includes building the engine's column vector, "warm" reuses the
+vector cached on the table.
+
+    python benchmarks/bench_engines.py [rows]
+"""
+import io
+import sys
+import time
+
+from common import make_csv_bytes
+
+from main import ENGINES, CSVTable, count_values, filter_table, read_csv_stream, sort_table
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main(rows):
+    table = CSVTable.from_stream(read_csv_stream(io.BytesIO(make_csv_bytes(rows))))
+    cases = [
+        ("filter", lambda t, e: filter_table(t, "city", "Paris", e)),
+        ("aggregate", lambda t, e: count_values(t, "city", e)),
+        ("sort", lambda t, e: sort_table(t, "city", e)),
+    ]
+    print(f"{rows} rows; engines installed: {', '.join(sorted(ENGINES))}")
+    print(f"{'operation':<10} {'engine':<8} {'cold (s)':>9} {'warm (s)':>9} {'rows/s':>12}")
+    for name, case in cases:
+        for engine in sorted(ENGINES):
+            # A fresh table per engine so no vector is cached yet
+            fresh = CSVTable(table.columns, table.data)
+            cold = timed(lambda: case(fresh, engine))
+            warm = timed(lambda: case(fresh, engine))
+            print(f"{name:<10} {engine:<8} {cold:>9.3f} {warm:>9.3f} {rows / warm:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,63 @@
+"""Filter cost with and without predicate pushdown, against a full parse.
+
+Each case streams the upload (best of three runs). "parse" only parses every record;
+the filter cases parse and filter, either parsing every line or letting
+prefilter_lines drop lines that cannot match before csv.reader sees them.
+
+    python benchmarks/bench_filter_pushdown.py [rows]
+"""
+import io
+import json
+import sys
+import time
+
+from common import make_csv_bytes
+
+import main
+
+
+def run(payload, params, pushdown):
+    stream = main.read_csv_stream(io.BytesIO(payload), pushdown=main.filter_pushdown(params) if pushdown else None)
+    if params.operation == "filter":
+        stream = main.apply_filter(stream, params)
+    return sum(1 for _ in stream.records)
+
+
+def timed(payload, params, pushdown=False, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = run(payload, params, pushdown)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, count
+
+
+def main_(rows):
+    payload = make_csv_bytes(rows)
+    compound = {"and": [
+        {"column": "city", "op": "in", "value": ["Paris", "Rome"]},
+        {"column": "age", "op": "between", "value": [30, 40]},
+        {"column": "score", "op": ">", "value": 90}
+    ]}
+    cases = [
+        ("parse", main.OperationParams(operation="view")),
+        ("name = user4242", main.OperationParams(operation="filter", filter_column="name", filter_value="user4242")),
+        ("city = Paris", main.OperationParams(operation="filter", filter_column="city", filter_value="Paris")),
+        ("compound", main.OperationParams(operation="filter", filter_expression=json.dumps(compound))),
+        ("score > 99 (numeric)", main.OperationParams(
+            operation="filter", filter_expression=json.dumps({"column": "score", "op": ">", "value": 99})
+        )),
+    ]
+    print(f"{rows} rows ({len(payload) / 1e6:.1f} MB), python engine")
+    print(f"{'case':<22} {'rows':>8} {'no pushdown (s)':>16} {'pushdown (s)':>13}")
+    for name, params in cases:
+        params.engine = "python"
+        plain, count = timed(payload, params)
+        pushed, pushed_count = timed(payload, params, pushdown=True)
+        assert pushed_count == count
+        print(f"{name:<22} {count:>8} {plain:>16.2f} {pushed:>13.2f}")
+
+
+if __name__ == "__main__":
+    main_(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,77 @@
+"""/health latency while heavy uploads are being processed.
+
+Starts the app under uvicorn, measures /health latency on an idle server,
+then again while several clients keep posting a large sort job. With the
+processing on worker threads/processes the event loop keeps answering
+/health; 503 responses show the WORKER_MAX_PENDING bound kicking in.
+
+    python benchmarks/bench_health_latency.py [rows] [clients] [seconds]
+"""
+import statistics
+import sys
+import threading
+import time
+
+import httpx
+
+from common import ServerThread, make_csv_bytes, percentile
+
+
+def probe_health(url, seconds, interval=0.02):
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    with httpx.Client(timeout=None) as client:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            client.get(f"{url}/health").raise_for_status()
+            latencies.append((time.perf_counter() - start) * 1000)
+            time.sleep(interval)
+    return latencies
+
+
+def heavy_client(url, payload, stop, statuses):
+    data = {"operation": "sort", "filter_column": "score", "sort_type": "numeric"}
+    with httpx.Client(timeout=None) as client:
+        while not stop.is_set():
+            response = client.post(f"{url}/api/process/csv", files={"file": ("bench.csv", payload, "text/csv")}, data=data)
+            statuses.append(response.status_code)
+            if response.status_code == 503:
+                time.sleep(0.1)
+
+
+def report(label, latencies):
+    print(
+        f"{label:<8} n={len(latencies):<5} p50={statistics.median(latencies):7.1f} ms "
+        f"p99={percentile(latencies, 0.99):7.1f} ms max={max(latencies):7.1f} ms"
+    )
+
+
+def main(rows, clients, seconds):
+    import main as app_module
+
+    # Every distinct payload misses the cache, so the jobs really run
+    app_module.RESULT_CACHE.max_bytes = 0
+    payload = make_csv_bytes(rows)
+    with ServerThread() as server:
+        print(f"{rows} rows ({len(payload) / 1e6:.1f} MB) x {clients} clients, {seconds}s per phase")
+        report("idle", probe_health(server.url, seconds))
+
+        stop = threading.Event()
+        statuses = []
+        workers = [
+            threading.Thread(target=heavy_client, args=(server.url, payload, stop, statuses), daemon=True)
+            for _ in range(clients)
+        ]
+        for worker in workers:
+            worker.start()
+        time.sleep(0.5)
+        report("loaded", probe_health(server.url, seconds))
+        stop.set()
+        for worker in workers:
+            worker.join()
+        print(f"heavy jobs: {statuses.count(200)} ok, {statuses.count(503)} rejected with 503")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [200_000, 4, 10][len(args):]))
@@ -0,0 +1,50 @@
+"""Appending chunks to an aggregation state vs re-aggregating the whole file.
+
+A log grows by one chunk at a time; after each chunk the full-file column
+re-aggregates everything seen so far (what a client had to do before),
+the append column parses only the chunk and merges it into a state that
+is snapshotted to a temporary directory.
+
+    python benchmarks/bench_incremental_aggregate.py [chunk_rows] [chunks] [cardinality]
+"""
+import io
+import os
+import sys
+import tempfile
+import time
+
+from common import make_table_csv
+
+import main
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main_(chunk_rows, chunks, cardinality):
+    params = main.OperationParams(
+        operation="aggregate", group_by=["key"], value_columns=["value"], aggregations=["count", "mean", "p95"]
+    )
+    header, _, _ = make_table_csv(1).partition(b"\n")
+    payloads = [make_table_csv(chunk_rows, cardinality=cardinality, seed=seed) for seed in range(chunks)]
+    print(f"{chunks} chunks of {chunk_rows} rows, {cardinality} keys, group-by count/mean/p95")
+    print(f"{'rows so far':>12} {'full file':>10} {'append':>8} {'snapshot':>10}")
+    with tempfile.TemporaryDirectory() as state_dir:
+        store = main.AggregationStore(state_dir)
+        state = store.create("bench", params)
+        whole = b""
+        for index, payload in enumerate(payloads):
+            whole += payload if not whole else payload[len(header) + 1:]
+            _, full = timed(lambda: main.process_upload(io.BytesIO(whole), params))
+            partial, parse = timed(lambda: main.aggregate_chunk(io.BytesIO(payload), params))
+            _, merge = timed(lambda: store.append(state, partial))
+            size = os.path.getsize(os.path.join(state_dir, "bench.json"))
+            print(f"{(index + 1) * chunk_rows:>12} {full:>9.3f}s {parse + merge:>7.3f}s {size / 1024:>8.0f} KB")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:4]]
+    main_(*(args + [50_000, 8, 1000][len(args):]))
@@ -0,0 +1,54 @@
+"""Peak memory of the buffered vs streaming ingest path.
+
+The buffered path mirrors the old ``process_csv``: read the whole upload,
+decode it, wrap it in StringIO and materialize every row. The streaming path
+reads the spooled upload in chunks through ``iter_csv_rows``. Peak memory of
+the streaming aggregate should stay flat as the file grows.
+
+    python benchmarks/bench_ingest_memory.py [rows ...]
+"""
+import csv
+import io
+import sys
+import tempfile
+
+from common import make_csv_bytes, measure, mib
+
+from main import iter_csv_rows, process_csv_aggregate, process_csv_filter
+
+
+def buffered_aggregate(spooled):
+    spooled.seek(0)
+    contents = spooled.read()
+    rows = list(csv.DictReader(io.StringIO(contents.decode("utf-8"))))
+    return process_csv_aggregate(rows, "city")
+
+
+def streaming_aggregate(spooled):
+    spooled.seek(0)
+    return process_csv_aggregate(iter_csv_rows(spooled), "city")
+
+
+def streaming_filter(spooled):
+    spooled.seek(0)
+    return process_csv_filter(iter_csv_rows(spooled), "name", "user7")
+
+
+def main(sizes):
+    print(f"{'rows':>10} {'payload':>12} {'buffered agg':>14} {'streaming agg':>14} {'streaming filter':>16}")
+    for rows in sizes:
+        payload = make_csv_bytes(rows)
+        # Same storage UploadFile uses: spills to disk above 1 MB
+        with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as spooled:
+            spooled.write(payload)
+            del payload
+            size = spooled.tell()
+            buffered, _, buffered_peak = measure(buffered_aggregate, spooled)
+            streamed, _, streamed_peak = measure(streaming_aggregate, spooled)
+            _, _, filter_peak = measure(streaming_filter, spooled)
+            assert buffered == streamed
+        print(f"{rows:>10} {mib(size):>12} {mib(buffered_peak):>14} {mib(streamed_peak):>14} {mib(filter_peak):>16}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 500_000])
@@ -0,0 +1,47 @@
+"""Hash join of a large upload against a small lookup file: in memory vs spilled.
+
+Joins make_table_csv rows (the probe side) with a lookup CSV of one row
+per key (the build side) on the key column, with the build side held in
+memory and with a memory budget small enough to force the partitioned
+join through spill files. Reports the time of an untraced run and the
+peak traced allocation of a second one.
+
+    python benchmarks/bench_join.py [rows] [keys]
+"""
+import io
+import sys
+import time
+
+from common import make_table_csv, measure
+
+import main
+
+
+def lookup_csv(keys: int) -> bytes:
+    lines = ["key,label,weight\n"] + [f"k{i},label{i},{i % 97}\n" for i in range(keys)]
+    return "".join(lines).encode("utf-8")
+
+
+def run(probe: bytes, build: bytes, memory_budget: int) -> int:
+    left = main.read_csv_stream(io.BytesIO(probe))
+    right = main.read_csv_stream(io.BytesIO(build))
+    joined = main.hash_join(left, right, ["key"], ["key"], "inner", "right", memory_budget=memory_budget)
+    return sum(1 for _ in joined.records)
+
+
+def main_(rows, keys):
+    probe, build = make_table_csv(rows, cardinality=keys), lookup_csv(keys)
+    print(f"{rows} probe rows ({len(probe) / 1e6:.1f} MB) x {keys} build rows ({len(build) / 1e6:.1f} MB)")
+    print(f"{'mode':<10} {'seconds':>8} {'rows/s':>10} {'peak MiB':>9}")
+    for mode, budget in (("memory", main.JOIN_MEMORY_BUDGET), ("spilled", 64 * 1024)):
+        # tracemalloc slows the join down several times, so time an untraced run
+        start = time.perf_counter()
+        count = run(probe, build, budget)
+        seconds = time.perf_counter() - start
+        _, _, peak = measure(lambda: run(probe, build, budget))
+        print(f"{mode:<10} {seconds:>8.3f} {count / seconds / 1e6:>9.2f}M {peak / 2**20:>9.1f}")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:3]]
+    main_(*(args + [500_000, 10_000][len(args):]))
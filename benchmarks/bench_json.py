@@ -0,0 +1,45 @@
+"""Serialize time and payload size of a big view result.
+
+Compares the stdlib json module (what JSONResponse uses) against orjson,
+for the default row-oriented shape and the opt-in shape="columns". Times
+include building the result dict from the table (best of three runs).
+
+    python benchmarks/bench_json.py [rows]
+"""
+import io
+import sys
+import time
+
+from common import make_csv_bytes
+
+import main
+
+
+def timed(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, body
+
+
+def main_(rows):
+    table = main.CSVTable.from_stream(main.read_csv_stream(io.BytesIO(make_csv_bytes(rows))))
+    serializers = [("stdlib", False)]
+    if main.orjson is not None:
+        serializers.append(("orjson", True))
+    else:
+        print("orjson is not installed, only the stdlib is measured")
+    print(f"{rows} rows x {len(table.columns)} columns")
+    print(f"{'serializer':<10} {'shape':<8} {'seconds':>8} {'payload':>10}")
+    for name, use_orjson in serializers:
+        main.USE_ORJSON = use_orjson
+        for shape in main.RESULT_SHAPES:
+            seconds, body = timed(lambda: main.encode_json(main.table_result(table, shape)))
+            print(f"{name:<10} {shape:<8} {seconds:>8.3f} {len(body) / 1e6:>8.1f}MB")
+
+
+if __name__ == "__main__":
+    main_(int(sys.argv[1]) if len(sys.argv) > 1 else 500_000)
@@ -0,0 +1,57 @@
+"""Overhead of per-stage timing, and the stage breakdown it reports.
+
+Runs process_upload with and without a StageTimer (what MetricsMiddleware
+installs for every request) and prints the best of three runs for each,
+plus the stages recorded by the timed run.
+
+    python benchmarks/bench_metrics.py [rows]
+"""
+import io
+import sys
+import time
+
+from common import make_csv_bytes
+
+import main
+
+
+def timed(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(payload, params, timer=None):
+    token = main.STAGE_TIMER.set(timer)
+    try:
+        with main.stage("process"):
+            main.process_upload(io.BytesIO(payload), params)
+    finally:
+        main.STAGE_TIMER.reset(token)
+
+
+def main_(rows):
+    payload = make_csv_bytes(rows)
+    cases = [
+        ("view", main.OperationParams(operation="view", engine="python")),
+        ("filter", main.OperationParams(operation="filter", filter_column="city", filter_value="Paris", engine="python")),
+        ("aggregate", main.OperationParams(operation="aggregate", group_by=["city"], value_columns=["score"], engine="python")),
+        ("sort", main.OperationParams(operation="sort", sort_columns=["score"], sort_type="numeric", engine="python")),
+    ]
+    print(f"{rows} rows ({len(payload) / 1e6:.1f} MB), python engine")
+    print(f"{'operation':<10} {'untimed':>8} {'timed':>8} {'overhead':>9}  stages (ms)")
+    for name, params in cases:
+        plain = timed(lambda: run(payload, params))
+        with_timer = timed(lambda: run(payload, params, main.StageTimer()))
+        timer = main.StageTimer()
+        run(payload, params, timer)
+        stages = " ".join(f"{stage}={value * 1000:.0f}" for stage, value in timer.seconds.items() if value)
+        print(f"{name:<10} {plain:>8.3f} {with_timer:>8.3f} {(with_timer / plain - 1) * 100:>8.1f}%  {stages}")
+
+
+if __name__ == "__main__":
+    main_(int(sys.argv[1]) if len(sys.argv) > 1 else 500_000)
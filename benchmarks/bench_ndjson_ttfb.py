@@ -0,0 +1,47 @@
+"""Time-to-first-byte of the JSON vs streamed NDJSON output.
+
+Starts the app under uvicorn and posts the same upload with and without
+format=ndjson, timing the first body chunk and the full response.
+
+    python benchmarks/bench_ndjson_ttfb.py [rows]
+"""
+import sys
+import time
+
+import httpx
+
+from common import ServerThread, make_csv_bytes
+
+
+def timed_post(client, url, payload, data):
+    start = time.perf_counter()
+    first = None
+    size = 0
+    with client.stream("POST", url, files={"file": ("bench.csv", payload, "text/csv")}, data=data) as response:
+        response.raise_for_status()
+        for chunk in response.iter_raw():
+            if first is None:
+                first = time.perf_counter() - start
+            size += len(chunk)
+    return first, time.perf_counter() - start, size
+
+
+def main(rows):
+    payload = make_csv_bytes(rows)
+    cases = [
+        ("view", {"operation": "view"}),
+        ("transform", {"operation": "transform", "transform_column": "name", "transform_operation": "uppercase"}),
+        ("filter", {"operation": "filter", "filter_column": "city", "filter_value": "Paris"}),
+    ]
+    with ServerThread() as server, httpx.Client(timeout=None) as client:
+        url = f"{server.url}/api/process/csv"
+        print(f"{rows} rows, {len(payload) / 1e6:.1f} MB upload")
+        print(f"{'operation':<10} {'format':<7} {'ttfb (s)':>9} {'total (s)':>10} {'bytes':>12}")
+        for name, data in cases:
+            for fmt in ("json", "ndjson"):
+                ttfb, total, size = timed_post(client, url, payload, dict(data, format=fmt))
+                print(f"{name:<10} {fmt:<7} {ttfb:>9.3f} {total:>10.3f} {size:>12}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
@@ -0,0 +1,57 @@
+"""Serial vs chunked map/reduce processing of a large upload.
+
+Times filter and aggregate on one process (process_upload_file) against
+the chunked path (process_upload_parallel) with 1..N worker processes.
+Speedup is bounded by the CPUs available to the container, see
+main.available_cpus().
+
+    python benchmarks/bench_parallel_parse.py [rows] [max_processes]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from common import make_csv_bytes
+
+import main
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main_(rows, max_processes):
+    cases = [
+        ("filter", main.OperationParams(operation="filter", filter_column="city", filter_value="Paris")),
+        ("aggregate", main.OperationParams(operation="aggregate", filter_column="city")),
+        ("group-by", main.OperationParams(
+            operation="aggregate", group_by=["city"], value_columns=["score"], aggregations=["mean", "p95"]
+        )),
+    ]
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    with os.fdopen(fd, "wb") as f:
+        f.write(make_csv_bytes(rows))
+    try:
+        print(f"{rows} rows ({os.path.getsize(path) / 1e6:.1f} MB), {main.available_cpus()} CPUs available")
+        print(f"{'operation':<10} {'serial (s)':>11}" + "".join(f" {f'{n} proc (s)':>11}" for n in range(1, max_processes + 1)))
+        for name, params in cases:
+            timings = [timed(main.process_upload_file, path, params)]
+            for processes in range(1, max_processes + 1):
+                main.EXECUTOR = main.OperationExecutor(1, processes, 0, 4)
+                # Warm the pool so worker start-up is not measured
+                main.EXECUTOR.map_processes(main.available_cpus, [()] * processes)
+                timings.append(timed(main.process_upload_parallel, path, params))
+                main.EXECUTOR.shutdown()
+            print(f"{name:<10}" + "".join(f" {seconds:>11.2f}" for seconds in timings))
+    finally:
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    main_(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else max(2, main.available_cpus())
+    )
@@ -0,0 +1,43 @@
+"""Cost of a wide upload with and without a columns= selection.
+
+Builds a CSV with many columns and runs view and sort through
+process_upload, once returning every column and once with columns=
+selecting two of them, so the parser only extracts the fields it needs.
+
+    python benchmarks/bench_projection.py [rows] [width]
+"""
+import io
+import random
+import sys
+
+from common import measure, mib
+
+import main
+
+
+def make_wide_csv(rows, width, seed=42):
+    rng = random.Random(seed)
+    lines = [",".join(f"col{i}" for i in range(width)) + "\n"]
+    for _ in range(rows):
+        lines.append(",".join(str(rng.randint(0, 10**6)) for _ in range(width)) + "\n")
+    return "".join(lines).encode("utf-8")
+
+
+def main_(rows, width):
+    payload = make_wide_csv(rows, width)
+    cases = [
+        ("view", dict(operation="view")),
+        ("sort", dict(operation="sort", sort_columns=["col1"], sort_type="numeric")),
+    ]
+    print(f"{rows} rows x {width} columns ({len(payload) / 1e6:.1f} MB), python engine")
+    print(f"{'case':<18} {'seconds':>8} {'peak':>13} {'response':>10}")
+    for name, fields in cases:
+        for label, columns in (("all columns", []), ("2 columns", ["col0", "col1"])):
+            params = main.OperationParams(engine="python", columns=columns, **fields)
+            body, seconds, peak = measure(main.process_upload, io.BytesIO(payload), params)
+            print(f"{name + ', ' + label:<18} {seconds:>8.2f} {mib(peak)} {len(body) / 1e6:>8.1f}MB")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    main_(*(args + [50_000, 100][len(args):]))
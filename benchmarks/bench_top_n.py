@@ -0,0 +1,33 @@
+"""Full sort against a limited (top_n / paged) sort, plus response size.
+
+Runs a numeric sort through process_upload returning every row, the first
+100 rows with top_n (bounded heap) and one page with offset/limit.
+
+    python benchmarks/bench_top_n.py [rows]
+"""
+import io
+import sys
+
+from common import make_csv_bytes, measure, mib
+
+import main
+
+
+def main_(rows):
+    payload = make_csv_bytes(rows)
+    sort = dict(operation="sort", sort_columns=["score"], sort_type="numeric", descending=True, engine="python")
+    cases = [
+        ("full sort", main.OperationParams(**sort)),
+        ("top_n=100", main.OperationParams(top_n=100, **sort)),
+        ("offset=1000 limit=100", main.OperationParams(offset=1000, limit=100, **sort)),
+        ("view limit=100", main.OperationParams(operation="view", limit=100)),
+    ]
+    print(f"{rows} rows ({len(payload) / 1e6:.1f} MB), python engine")
+    print(f"{'case':<22} {'seconds':>8} {'peak':>13} {'response':>10}")
+    for name, params in cases:
+        body, seconds, peak = measure(main.process_upload, io.BytesIO(payload), params)
+        print(f"{name:<22} {seconds:>8.2f} {mib(peak)} {len(body) / 1e6:>8.2f}MB")
+
+
+if __name__ == "__main__":
+    main_(int(sys.argv[1]) if len(sys.argv) > 1 else 500_000)
@@ -0,0 +1,106 @@
+"""Shared helpers for the benchmark scripts.
+
+Run the scripts from the repository root, e.g. ``python benchmarks/bench_ingest_memory.py``.
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# main.py mounts STATIC_DIR relative to the working directory
+os.chdir(ROOT)
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+CITIES = ["New York", "London", "Paris", "Berlin", "Tokyo", "Madrid", "Rome", "Sydney"]
+
+
+def make_csv_bytes(rows: int, seed: int = 42) -> bytes:
+    """Generate a synthetic people CSV with a low-cardinality city column"""
+    rng = random.Random(seed)
+    lines = ["id,name,age,city,score\n"]
+    for i in range(rows):
+        lines.append(f"{i},user{i},{rng.randint(18, 90)},{rng.choice(CITIES)},{rng.random() * 100:.3f}\n")
+    return "".join(lines).encode("utf-8")
+
+
+def make_table_csv(rows: int, width: int = 5, cardinality: int = 8, seed: int = 42) -> bytes:
+    """
+    Generate a CSV with an id column, a text key column with `cardinality`
+    distinct values, a float value column and width - 3 integer columns
+    """
+    rng = random.Random(seed)
+    extra = [f"n{i}" for i in range(max(0, width - 3))]
+    lines = [",".join(["id", "key", "value"] + extra) + "\n"]
+    for i in range(rows):
+        cells = [str(i), f"k{rng.randrange(cardinality)}", f"{rng.random() * 1000:.3f}"]
+        cells.extend(str(rng.randrange(10**6)) for _ in extra)
+        lines.append(",".join(cells) + "\n")
+    return "".join(lines).encode("utf-8")
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def peak_rss_bytes(children: bool = False) -> int:
+    """Peak resident set size of this process (or of its largest finished child)"""
+    import resource
+
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    return usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+
+
+def measure(func, *args, **kwargs):
+    """Run func and return (result, seconds, peak traced bytes)"""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def mib(value: int) -> str:
+    return f"{value / (1024 * 1024):8.1f} MiB"
+
+
+class ServerThread:
+    """Run the FastAPI app under uvicorn in a background thread for HTTP benchmarks"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        import socket
+        import threading
+
+        import uvicorn
+
+        from main import app
+
+        if not port:
+            with socket.socket() as sock:
+                sock.bind((host, 0))
+                port = sock.getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        self.server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+        # uvicorn installs its own signal handlers, which only works in the main thread
+        self.server.install_signal_handlers = lambda: None
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
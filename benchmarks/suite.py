@@ -0,0 +1,238 @@
+"""Benchmark suite: parsing and process_csv_* micro-benchmarks plus an ASGI load test.
+
+Generates synthetic CSVs of different sizes, widths and key cardinalities,
+then:
+
+- micro: times parsing and each process_csv_* function on the columnar
+  table (best of --repeat runs) and records the peak traced allocation of
+  one extra run;
+- load: posts uploads to /api/process/csv through an in-process ASGI
+  client with --concurrency requests in flight, reporting rows/s, p50/p99
+  latency, the mean Server-Timing stages and peak RSS. Each load case runs
+  in a fresh process so its RSS peak is its own.
+
+Results are printed and written as JSON; --compare prints the change
+against an earlier results file.
+
+    python benchmarks/suite.py [--quick] [--only micro|load] [--output FILE] [--compare FILE]
+"""
+import argparse
+import asyncio
+import functools
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+
+from common import ROOT, make_table_csv, measure, peak_rss_bytes, percentile
+
+import main
+
+# name: (rows, width, cardinality); --quick divides the rows by 10
+DATASETS = {
+    "narrow": (200_000, 5, 8),
+    "wide": (50_000, 50, 8),
+    "high-cardinality": (200_000, 5, 50_000),
+}
+
+MICRO_CASES = [
+    ("view", lambda table, engine: main.process_csv_view(table)),
+    ("filter", lambda table, engine: main.process_csv_filter(table, "key", "k1", engine)),
+    ("transform", lambda table, engine: main.process_csv_transform(table, "key", "uppercase")),
+    ("aggregate", lambda table, engine: main.process_csv_aggregate(table, "key", engine)),
+    ("group_aggregate", lambda table, engine: main.process_csv_group_aggregate(table, ["key"], ["value"], ["count", "mean", "p95"])),
+    ("sort", lambda table, engine: main.process_csv_sort(table, "value", engine, "numeric")),
+]
+
+LOAD_CASES = [
+    ("view", {"operation": "view", "limit": "100"}),
+    ("filter", {"operation": "filter", "filter_column": "key", "filter_value": "k1"}),
+    ("aggregate", {"operation": "aggregate", "group_by": "key", "value_columns": "value", "aggregations": "count,mean"}),
+    ("sort", {"operation": "sort", "sort_columns": "value", "sort_type": "numeric", "top_n": "100"}),
+]
+
+
+def best_of(func, repeat, setup=None):
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def parse_table(payload):
+    return main.CSVTable.from_stream(main.read_csv_stream(io.BytesIO(payload)))
+
+
+def parse_records(payload):
+    deque(main.read_csv_stream(io.BytesIO(payload)).records, maxlen=0)
+
+
+def run_micro(name, payload, rows, repeat, engine):
+    results = [("parse_records", lambda: parse_records(payload)), ("parse_table", lambda: parse_table(payload))]
+    table = parse_table(payload)
+    results += [(case, functools.partial(func, table, engine)) for case, func in MICRO_CASES]
+    report = []
+    for case, func in results:
+        # Cached numeric/engine views would make repeated runs look cheaper than a first run
+        seconds = best_of(func, repeat, setup=table._cache.clear)
+        table._cache.clear()
+        _, _, peak = measure(func)
+        report.append({
+            "dataset": name,
+            "case": case,
+            "rows": rows,
+            "seconds": round(seconds, 6),
+            "rows_per_sec": round(rows / seconds),
+            "peak_traced_bytes": peak,
+        })
+        print(f"  {case:<16} {seconds:>8.3f}s {rows / seconds / 1e6:>7.2f}M rows/s {peak / 2**20:>8.1f} MiB")
+    return report
+
+
+async def post_uploads(payload, data, requests, concurrency):
+    import httpx
+
+    transport = httpx.ASGITransport(app=main.app)
+    latencies, statuses, stages = [], [], {}
+    remaining = iter(range(requests))
+
+    async def worker(client):
+        for _ in remaining:
+            start = time.perf_counter()
+            response = await client.post("/api/process/csv", files={"file": ("bench.csv", payload, "text/csv")}, data=data)
+            latencies.append(time.perf_counter() - start)
+            statuses.append(response.status_code)
+            for part in response.headers.get("server-timing", "").split(","):
+                stage, _, duration = part.strip().partition(";dur=")
+                if duration and stage != "total":
+                    stages[stage] = stages.get(stage, 0.0) + float(duration)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+    return latencies, statuses, stages, wall
+
+
+def run_load_case(name, dataset, rows, width, cardinality, data, requests, concurrency):
+    """Runs in a fresh process: one load case against the app, returning its report"""
+    # Every request would be a cache hit after the first otherwise
+    main.RESULT_CACHE.max_bytes = 0
+    payload = make_table_csv(rows, width, cardinality)
+    latencies, statuses, stages, wall = asyncio.run(post_uploads(payload, data, requests, concurrency))
+    main.EXECUTOR.shutdown()
+    ok = statuses.count(200)
+    return {
+        "dataset": dataset,
+        "case": name,
+        "rows": rows,
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": len(statuses) - ok,
+        "seconds": round(wall, 6),
+        "rows_per_sec": round(rows * ok / wall),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "stages_ms": {stage: round(total / len(statuses), 2) for stage, total in stages.items()},
+        "peak_rss_bytes": peak_rss_bytes(),
+        "worker_peak_rss_bytes": peak_rss_bytes(children=True),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Print the change in time (micro) or p50 latency (load) of each case against a baseline file"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} ({baseline['meta'].get('revision')})")
+    for section, metric in (("micro", "seconds"), ("load", "p50_ms")):
+        before = {(item["dataset"], item["case"]): item for item in baseline.get(section, [])}
+        for item in results.get(section, []):
+            old = before.get((item["dataset"], item["case"]))
+            if old is None or not old[metric]:
+                continue
+            change = (item[metric] / old[metric] - 1) * 100
+            print(f"  {section:<5} {item['dataset']:<17} {item['case']:<16} {metric} {change:+7.1f}%")
+
+
+def main_(args):
+    scale = 10 if args.quick else 1
+    results = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": main.available_cpus(),
+            "engine": args.engine,
+            "json_serializer": "orjson" if main.USE_ORJSON else "stdlib",
+            "quick": args.quick,
+        }
+    }
+    datasets = {name: (rows // scale, width, cardinality) for name, (rows, width, cardinality) in DATASETS.items()}
+
+    if args.only in (None, "micro"):
+        results["micro"] = []
+        for name, (rows, width, cardinality) in datasets.items():
+            payload = make_table_csv(rows, width, cardinality)
+            print(f"micro: {name}, {rows} rows x {width} columns, {cardinality} keys ({len(payload) / 1e6:.1f} MB)")
+            results["micro"] += run_micro(name, payload, rows, args.repeat, args.engine)
+
+    if args.only in (None, "load"):
+        results["load"] = []
+        rows, width, cardinality = datasets["narrow"]
+        print(f"load: narrow, {rows} rows, {args.requests} requests, {args.concurrency} in flight")
+        for name, data in LOAD_CASES:
+            with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+                report = pool.submit(
+                    run_load_case, name, "narrow", rows, width, cardinality, data, args.requests, args.concurrency
+                ).result()
+            results["load"].append(report)
+            print(
+                f"  {name:<10} {report['rows_per_sec'] / 1e6:>6.2f}M rows/s p50={report['p50_ms']:>8.1f} ms "
+                f"p99={report['p99_ms']:>8.1f} ms rss={report['peak_rss_bytes'] / 2**20:>7.1f} MiB "
+                f"errors={report['errors']}"
+            )
+
+    output = args.output or os.path.join(
+        ROOT, "benchmarks", "results", f"suite-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nWrote {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="a tenth of the rows, for smoke runs")
+    parser.add_argument("--only", choices=("micro", "load"))
+    parser.add_argument("--repeat", type=int, default=3, help="runs per micro-benchmark (best is kept)")
+    parser.add_argument("--engine", default="python", help="engine for the micro-benchmarks")
+    parser.add_argument("--requests", type=int, default=20, help="requests per load case")
+    parser.add_argument("--concurrency", type=int, default=4, help="requests in flight during the load test")
+    parser.add_argument("--output", help="results file (default benchmarks/results/suite-<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    sys.exit(main_(parser.parse_args()))
@@ -1,18 +1,70 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Header, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse, RedirectResponse
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterable, Iterator, BinaryIO, Tuple
+import asyncio
+import bisect
+import codecs
+import contextvars
 import csv
+import functools
+import gzip
+import hashlib
+import heapq
+import math
+import operator
 import json
 import io
+import itertools
+import multiprocessing
 import tempfile
 import os
+import re
+import shutil
 import signal
 import sys
-from datetime import datetime
+import threading
+import time
+import uuid
+import zipfile
+import zlib
+from array import array
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import asdict, dataclass, field, replace
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 
+# Optional vectorized engines
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pragma: no cover - pyarrow is optional
+    pa = None
+    pc = None
+
+# Optional fast JSON serializer
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+# Optional zstd decompression for uploads
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard is optional
+    zstandard = None
+
 # Load environment variables
 load_dotenv()
 
@@ -22,8 +74,327 @@ PORT = int(os.getenv("PORT", "8000"))
 DEBUG = os.getenv("DEBUG", "False").lower() == "true"
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "*").split(",") if os.getenv("CORS_ORIGINS") != "*" else ["*"]
 STATIC_DIR = os.getenv("STATIC_DIR", "static")
+READ_CHUNK_SIZE = int(os.getenv("READ_CHUNK_SIZE", "65536"))
+NDJSON_FLUSH_BYTES = int(os.getenv("NDJSON_FLUSH_BYTES", "65536"))
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+CSV_ENGINE = os.getenv("CSV_ENGINE", "auto")
+ENGINE_BATCH_ROWS = int(os.getenv("ENGINE_BATCH_ROWS", "65536"))
+SORT_MEMORY_BUDGET = int(os.getenv("SORT_MEMORY_BUDGET", str(64 * 1024 * 1024)))
+SPILL_DIR = os.getenv("SPILL_DIR", "")
+JOIN_MEMORY_BUDGET = int(os.getenv("JOIN_MEMORY_BUDGET", str(64 * 1024 * 1024)))
+JOIN_SPILL_PARTITIONS = int(os.getenv("JOIN_SPILL_PARTITIONS", "16"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "")
+RESULT_CACHE_DISK_MAX_BYTES = int(os.getenv("RESULT_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024)))
+APPROX_ERROR = float(os.getenv("APPROX_ERROR", "0.01"))
+APPROX_TOP_K = int(os.getenv("APPROX_TOP_K", "100"))
+NUMPY_MAX_STR_WIDTH = int(os.getenv("NUMPY_MAX_STR_WIDTH", "64"))
+DATASET_MAX_BYTES = int(os.getenv("DATASET_MAX_BYTES", str(256 * 1024 * 1024)))
+DATASET_TTL_SECONDS = int(os.getenv("DATASET_TTL_SECONDS", "900"))
+DATASET_INDEXES = os.getenv("DATASET_INDEXES", "true").lower() == "true"
+AGGREGATION_STATE_DIR = os.getenv("AGGREGATION_STATE_DIR", "")
+AGGREGATION_MAX_STATES = int(os.getenv("AGGREGATION_MAX_STATES", "64"))
+CSV_WRITE_CHUNK_BYTES = int(os.getenv("CSV_WRITE_CHUNK_BYTES", "65536"))
+DOWNLOAD_GZIP = os.getenv("DOWNLOAD_GZIP", "true").lower() == "true"
+DOWNLOAD_GZIP_LEVEL = int(os.getenv("DOWNLOAD_GZIP_LEVEL", "5"))
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "4"))
+WORKER_PROCESSES = os.getenv("WORKER_PROCESSES", "auto")
+PROCESS_POOL_MIN_BYTES = int(os.getenv("PROCESS_POOL_MIN_BYTES", str(4 * 1024 * 1024)))
+WORKER_MAX_PENDING = int(os.getenv("WORKER_MAX_PENDING", "16"))
+WORKER_RETRY_AFTER_SECONDS = int(os.getenv("WORKER_RETRY_AFTER_SECONDS", "5"))
+PARALLEL_PARSE_MIN_BYTES = int(os.getenv("PARALLEL_PARSE_MIN_BYTES", str(16 * 1024 * 1024)))
+PARSE_CHUNK_BYTES = int(os.getenv("PARSE_CHUNK_BYTES", str(4 * 1024 * 1024)))
+PARALLEL_OPERATIONS = ("filter", "aggregate")
+CSV_SNIFF_BYTES = int(os.getenv("CSV_SNIFF_BYTES", "32768"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "16"))
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", "0.5"))
+JSON_SERIALIZER = os.getenv("JSON_SERIALIZER", "auto")
+USE_ORJSON = orjson is not None and JSON_SERIALIZER in ("auto", "orjson")
+RESULT_SHAPES = ("rows", "columns")
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+STAGES = ("upload", "read", "decode", "parse", "process", "serialize", "wait")
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TIMED_PARSE_BATCH = 512
+
+
+class StageTimer:
+    """
+    Per-request wall time of each processing stage. Time is exclusive: a
+    stage entered inside another (read inside parse, say) is subtracted
+    from the enclosing one. Stages are entered per chunk or per batch of
+    records, never per row, so the timer stays cheap.
+    """
+    
+    __slots__ = ("seconds", "rows", "operation", "_stack", "_mark")
+    
+    def __init__(self):
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.rows = 0
+        self.operation = ""
+        self._stack = []
+        self._mark = 0.0
+    
+    def enter(self, name: str) -> None:
+        now = time.perf_counter()
+        if self._stack:
+            self.seconds[self._stack[-1]] += now - self._mark
+        self._stack.append(name)
+        self._mark = now
+    
+    def exit(self) -> None:
+        now = time.perf_counter()
+        self.seconds[self._stack.pop()] += now - self._mark
+        self._mark = now
+    
+    def merge(self, seconds: Dict[str, float], rows: int) -> None:
+        """Add the stages timed in a worker process (summed across workers, so they may exceed wall time)"""
+        for name, value in seconds.items():
+            self.seconds[name] += value
+        self.rows += rows
+    
+    def server_timing(self, total: float) -> str:
+        parts = [f"{name};dur={value * 1000:.1f}" for name, value in self.seconds.items() if value]
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+STAGE_TIMER: contextvars.ContextVar[Optional[StageTimer]] = contextvars.ContextVar("stage_timer", default=None)
+
+
+@contextmanager
+def stage(name: str):
+    """Attribute the time spent in the block to a stage of the current request, if it is timed"""
+    timer = STAGE_TIMER.get()
+    if timer is None:
+        yield
+        return
+    timer.enter(name)
+    try:
+        yield
+    finally:
+        timer.exit()
+
+
+def staged_call(name: str, func, *args):
+    with stage(name):
+        return func(*args)
+
+
+def staged_iter(name: str, chunks: Iterable) -> Iterator:
+    """Attribute the work of producing each item of a lazy iterator (e.g. a response body) to a stage"""
+    chunks = iter(chunks)
+    while True:
+        with stage(name):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def timed_records(records: Iterable[List[str]]) -> Iterator[List[str]]:
+    """Parse records in batches under the parse stage and count them"""
+    timer = STAGE_TIMER.get()
+    if timer is None:
+        yield from records
+        return
+    records = iter(records)
+    while True:
+        timer.enter("parse")
+        try:
+            batch = list(itertools.islice(records, TIMED_PARSE_BATCH))
+        finally:
+            timer.exit()
+        if not batch:
+            return
+        timer.rows += len(batch)
+        yield from batch
+
+
+def run_timed(func, *args):
+    """
+    Process-pool entry point: run func(*args) with a fresh StageTimer and
+    return its result with the stage seconds and rows for the parent's timer.
+    """
+    timer = StageTimer()
+    token = STAGE_TIMER.set(timer)
+    try:
+        with stage("process"):
+            result = func(*args)
+        return result, timer.seconds, timer.rows
+    finally:
+        STAGE_TIMER.reset(token)
+
+
+class Metric:
+    """A Prometheus counter, gauge or histogram with labels, rendered in the text exposition format"""
+    
+    def __init__(self, name: str, kind: str, help_text: str, labels: tuple = (), buckets: tuple = ()):
+        self.name = name
+        self.kind = kind
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, label_values: tuple = (), amount: float = 1) -> None:
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+    
+    def set(self, label_values: tuple, value: float) -> None:
+        with self._lock:
+            self.values[label_values] = value
+    
+    def observe(self, label_values: tuple, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self.values.get(label_values)
+            if state is None:
+                # Per-bucket counts (the last one is +Inf), then the sum
+                state = self.values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+    
+    def _label_text(self, label_values: tuple, extra: str = "") -> str:
+        pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(self.labels, label_values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted((key, list(value) if isinstance(value, list) else value) for key, value in self.values.items())
+        for label_values, value in items:
+            if self.kind != "histogram":
+                lines.append(f"{self.name}{self._label_text(label_values)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), value):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else repr(float(bound))
+                labels = self._label_text(label_values, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(label_values)} {value[-1]}")
+            lines.append(f"{self.name}_count{self._label_text(label_values)} {cumulative}")
+        return lines
+
+
+def escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+REQUESTS_TOTAL = Metric(
+    "csv_requests_total", "counter", "HTTP requests by route, method, status and operation",
+    ("route", "method", "status", "operation")
+)
+REQUEST_SECONDS = Metric(
+    "csv_request_duration_seconds", "histogram", "Request latency until the response body is sent",
+    ("route", "operation"), DURATION_BUCKETS
+)
+STAGE_SECONDS = Metric(
+    "csv_stage_duration_seconds", "histogram", "Time per request spent in each processing stage",
+    ("stage", "operation"), DURATION_BUCKETS
+)
+ROWS_TOTAL = Metric("csv_rows_processed_total", "counter", "CSV records parsed", ("operation",))
+BYTES_IN_TOTAL = Metric("csv_request_bytes_total", "counter", "Request body bytes received", ("route",))
+BYTES_OUT_TOTAL = Metric("csv_response_bytes_total", "counter", "Response body bytes sent (after compression)", ("route",))
+IN_FLIGHT = Metric("csv_requests_in_flight", "gauge", "Requests being handled")
+JOBS_IN_FLIGHT = Metric("csv_jobs_in_flight", "gauge", "Jobs queued or running on the worker pools")
+JOBS_REJECTED = Metric("csv_jobs_rejected_total", "counter", "Jobs refused with 503 because every worker slot was busy")
+BACKGROUND_JOBS = Metric("csv_background_jobs", "gauge", "Background jobs (/api/jobs) kept, by status", ("status",))
+METRICS = (
+    REQUESTS_TOTAL, REQUEST_SECONDS, STAGE_SECONDS, ROWS_TOTAL, BYTES_IN_TOTAL, BYTES_OUT_TOTAL,
+    IN_FLIGHT, JOBS_IN_FLIGHT, JOBS_REJECTED, BACKGROUND_JOBS
+)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that times every HTTP request with a StageTimer (made
+    available to the handler and its workers through STAGE_TIMER), adds a
+    Server-Timing header with the stages finished before the response
+    starts, and records the request in the Prometheus metrics once the
+    body has been sent.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        timer = StageTimer()
+        token = STAGE_TIMER.set(timer)
+        start = time.perf_counter()
+        state = {"status": 500, "bytes_in": 0, "bytes_out": 0}
+        
+        async def timed_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                state["bytes_in"] += len(message.get("body", b""))
+                if not message.get("more_body", False):
+                    # Receiving and multipart parsing happen as the body arrives
+                    timer.seconds["upload"] = time.perf_counter() - start
+            return message
+        
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timer.server_timing(time.perf_counter() - start).encode("latin-1")))
+                message = dict(message, headers=headers)
+            elif message["type"] == "http.response.body":
+                state["bytes_out"] += len(message.get("body", b""))
+            await send(message)
+        
+        IN_FLIGHT.inc((), 1)
+        try:
+            await self.app(scope, timed_receive, timed_send)
+        finally:
+            IN_FLIGHT.inc((), -1)
+            STAGE_TIMER.reset(token)
+            record_request(scope, timer, state, time.perf_counter() - start)
+
+
+def record_request(scope, timer: StageTimer, state: Dict[str, int], seconds: float) -> None:
+    route = getattr(scope.get("route"), "path", None) or ("/static" if scope["path"].startswith("/static/") else "other")
+    operation = timer.operation
+    REQUESTS_TOTAL.inc((route, scope["method"], str(state["status"]), operation))
+    REQUEST_SECONDS.observe((route, operation), seconds)
+    for name, value in timer.seconds.items():
+        if value:
+            STAGE_SECONDS.observe((name, operation), value)
+    if timer.rows:
+        ROWS_TOTAL.inc((operation,), timer.rows)
+    BYTES_IN_TOTAL.inc((route,), state["bytes_in"])
+    BYTES_OUT_TOTAL.inc((route,), state["bytes_out"])
+
+
+def set_request_operation(operation: str) -> None:
+    """
+    Label the current request's metrics with its operation. The value comes
+    from the form, so anything unknown is labelled "other" rather than
+    adding a series per value a client sends.
+    """
+    timer = STAGE_TIMER.get()
+    if timer is not None:
+        timer.operation = operation if operation in METRIC_OPERATIONS else "other"
 
-app = FastAPI(title="CSV Processor", version="1.0.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Stop the worker pools on shutdown"""
+    yield
+    EXECUTOR.shutdown()
+    JOBS.shutdown()
+
+
+app = FastAPI(title="CSV Processor", version="1.0.0", lifespan=lifespan)
 
 # Serve static files
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
@@ -35,8 +406,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # Graceful shutdown flag
 shutdown_event = {"shutdown": False}
 
@@ -64,20 +439,28 @@ async def health_check():
     return {"status": "healthy", "service": "CSV Processor"}
 
 
-def find_column_case_insensitive(rows: List[Dict], target_column: str) -> str:
-    """Find the actual column name in a case-insensitive way"""
-    if not rows:
-        return target_column
-    
-    available_columns = list(rows[0].keys())
-    target_lower = target_column.lower()
-    
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: requests, latency and stage histograms, rows, bytes and worker jobs"""
+    executor = EXECUTOR.metrics()
+    JOBS_IN_FLIGHT.set((), executor["pending"])
+    JOBS_REJECTED.set((), executor["rejected"])
+    job_counts = JOBS.metrics()
+    for status in ("queued", "running", "succeeded", "failed", "cancelled"):
+        BACKGROUND_JOBS.set((status,), job_counts.get(status, 0))
+    lines = [line for metric in METRICS for line in metric.render()]
+    return Response(content="\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+
+def resolve_column(columns: List[str], target_column: str) -> str:
+    """Resolve a column name against a header in a case-insensitive way"""
     # First try exact match
-    if target_column in available_columns:
+    if target_column in columns:
         return target_column
     
     # Then try case-insensitive match
-    for col in available_columns:
+    target_lower = target_column.lower()
+    for col in columns:
         if col.lower() == target_lower:
             return col
     
@@ -85,185 +468,4945 @@ def find_column_case_insensitive(rows: List[Dict], target_column: str) -> str:
     return target_column
 
 
-def process_csv_filter(rows: List[Dict], filter_column: str, filter_value: str) -> Dict[str, Any]:
-    """Filter CSV rows based on column value"""
+def find_column_case_insensitive(rows: List[Dict], target_column: str) -> str:
+    """Find the actual column name in a case-insensitive way"""
     if not rows:
-        return {"rows": [], "count": 0, "columns": []}
+        return target_column
+    
+    return resolve_column(list(rows[0].keys()), target_column)
+
+
+def iter_text_blocks(stream: BinaryIO, encoding: str = "utf-8", chunk_size: int = READ_CHUNK_SIZE) -> Iterator[str]:
+    """Read a binary stream in chunks and yield decoded text blocks that end on a line break"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ""
+    while True:
+        with stage("read"):
+            chunk = stream.read(chunk_size)
+        with stage("decode"):
+            text = pending + decoder.decode(chunk, final=not chunk)
+        if not chunk:
+            if text:
+                yield text
+            return
+        # A trailing line may continue in the next chunk, and a final "\r" may be half of "\r\n"
+        cut = max(text.rfind("\n"), text.rfind("\r", 0, len(text) - 1)) + 1
+        pending = text[cut:]
+        if cut:
+            yield text[:cut]
+
+
+COMPRESSION_MAGIC = (
+    ("gzip", b"\x1f\x8b"),
+    ("zstd", b"\x28\xb5\x2f\xfd"),
+    ("zip", b"PK\x03\x04"),
+)
+# Raised while reading a corrupt or truncated compressed upload
+DECOMPRESSION_ERRORS = (gzip.BadGzipFile, EOFError, zlib.error, zipfile.BadZipFile) + (
+    (zstandard.ZstdError,) if zstandard is not None else ()
+)
+
+
+def upload_compression(stream: BinaryIO) -> Optional[str]:
+    """Detect a gzip, zstd or zip upload from its magic bytes, leaving the stream position unchanged"""
+    position = stream.tell()
+    head = stream.read(4)
+    stream.seek(position)
+    for name, magic in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def zip_csv_member(archive: zipfile.ZipFile) -> zipfile.ZipInfo:
+    """The single CSV file in a zip upload"""
+    members = [
+        member for member in archive.infolist()
+        if not member.is_dir() and not member.filename.startswith("__MACOSX/")
+    ]
+    csv_members = [member for member in members if member.filename.lower().endswith(".csv")] or members
+    if len(csv_members) != 1:
+        raise ValueError("Zip uploads must contain exactly one CSV file")
+    return csv_members[0]
+
+
+def open_upload(stream: BinaryIO) -> BinaryIO:
+    """
+    Return a reader over the CSV bytes of an upload. Compressed uploads
+    (gzip, zstd when zstandard is installed, or a zip holding one CSV) are
+    decompressed as the parser reads them, one chunk at a time; anything
+    else is returned unchanged.
+    """
+    compression = upload_compression(stream)
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=stream, mode="rb")
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd uploads need the optional zstandard package")
+        return zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True)
+    if compression == "zip":
+        archive = zipfile.ZipFile(stream)
+        return archive.open(zip_csv_member(archive))
+    return stream
+
+
+BYTE_ORDER_MARKS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+SNIFF_DELIMITERS = ",;\t|"
+DELIMITER_NAMES = {"comma": ",", "semicolon": ";", "tab": "\t", "\\t": "\t", "pipe": "|"}
+
+
+@dataclass
+class CSVFormat:
+    """Encoding and dialect of an upload, detected or given in the form"""
     
-    # Find the actual column name (case-insensitive)
-    actual_column = find_column_case_insensitive(rows, filter_column)
+    encoding: str = "utf-8"
+    delimiter: str = ","
+    quotechar: str = '"'
     
-    filtered_rows = [row for row in rows if str(row.get(actual_column, "")) == str(filter_value)]
-    return {
-        "rows": filtered_rows,
-        "count": len(filtered_rows),
-        "columns": list(rows[0].keys()) if rows else []
-    }
+    @property
+    def splittable(self) -> bool:
+        """Whether byte ranges can be cut at "\n" with double-quote parity (see split_csv_ranges)"""
+        return self.quotechar == '"' and not codecs.lookup(self.encoding).name.startswith(("utf-16", "utf-32"))
+    
+    def info(self) -> Dict[str, str]:
+        return asdict(self)
 
 
-def process_csv_transform(rows: List[Dict], transform_column: str, transform_operation: str) -> Dict[str, Any]:
-    """Transform CSV column values"""
-    if not rows:
-        return {"rows": [], "count": 0, "columns": []}
+class PrefixedStream:
+    """A binary reader that returns an already read prefix before the rest of a stream"""
     
-    # Find the actual column name (case-insensitive)
-    actual_column = find_column_case_insensitive(rows, transform_column)
+    def __init__(self, prefix: bytes, stream: BinaryIO):
+        self._prefix = prefix
+        self._stream = stream
     
-    for row in rows:
-        value = row.get(actual_column, "")
-        if transform_operation == "uppercase":
-            row[actual_column] = str(value).upper()
-        elif transform_operation == "lowercase":
-            row[actual_column] = str(value).lower()
-        elif transform_operation == "trim":
-            row[actual_column] = str(value).strip()
+    def read(self, size: int = -1) -> bytes:
+        if not self._prefix:
+            return self._stream.read(size)
+        if size is None or size < 0:
+            data, self._prefix = self._prefix + self._stream.read(), b""
+            return data
+        data, self._prefix = self._prefix[:size], self._prefix[size:]
+        return data
+
+
+def detect_encoding(sample: bytes) -> str:
+    """
+    Guess the encoding of a CSV from a prefix: a byte order mark, else NUL
+    bytes in every other position (BOM-less UTF-16), else UTF-8 when the
+    prefix decodes as UTF-8, else Windows-1252 (the usual meaning of
+    "Latin-1"), falling back to ISO-8859-1, which decodes any byte.
+    """
+    for bom, encoding in BYTE_ORDER_MARKS:
+        if sample.startswith(bom):
+            return encoding
+    if len(sample) >= 4:
+        # ASCII text in UTF-16 has a NUL in the high byte of every character
+        half = len(sample) // 2
+        if sample[1::2].count(0) > half * 0.3 and sample[0::2].count(0) < half * 0.05:
+            return "utf-16-le"
+        if sample[0::2].count(0) > half * 0.3 and sample[1::2].count(0) < half * 0.05:
+            return "utf-16-be"
+    try:
+        # final=False: the sample may end inside a multi-byte character
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    try:
+        sample.decode("cp1252")
+        return "cp1252"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+
+def sniff_dialect(text: str):
+    """Guess the delimiter and quote character from complete lines of text with csv.Sniffer"""
+    cut = max(text.rfind("\n"), text.rfind("\r")) + 1
+    sample = text[:cut] or text
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=SNIFF_DELIMITERS)
+    except csv.Error:
+        return ",", '"'
+    # Apostrophes fool the quote guess; only trust single quotes when there are no double quotes
+    quotechar = dialect.quotechar if dialect.quotechar == '"' or '"' not in sample else '"'
+    return dialect.delimiter, quotechar
+
+
+def sniff_upload(stream: BinaryIO, encoding: str = "auto", delimiter: str = "auto", sample_bytes: Optional[int] = None):
+    """
+    Detect the encoding and dialect of an upload from its first
+    CSV_SNIFF_BYTES, unless given. Returns the CSVFormat and a stream that
+    still starts at the beginning of the upload.
+    """
+    with stage("read"):
+        sample = stream.read(sample_bytes or CSV_SNIFF_BYTES)
+    if encoding == "auto":
+        encoding = detect_encoding(sample)
+    else:
+        try:
+            codecs.lookup(encoding)
+        except LookupError:
+            raise ValueError(f"Unknown encoding '{encoding}'")
     
-    return {
-        "rows": rows,
-        "count": len(rows),
-        "columns": list(rows[0].keys()) if rows else []
-    }
+    quotechar = '"'
+    if delimiter == "auto":
+        text = codecs.getincrementaldecoder(encoding)(errors="replace").decode(sample, final=False)
+        delimiter, quotechar = sniff_dialect(text)
+    else:
+        delimiter = DELIMITER_NAMES.get(delimiter.lower(), delimiter)
+        if len(delimiter) != 1 or delimiter in "\r\n\"":
+            raise ValueError(f"Invalid delimiter '{delimiter}'. Use a single character such as ',', ';', '|' or 'tab'")
+    return CSVFormat(encoding, delimiter, quotechar), PrefixedStream(sample, stream)
 
 
-def process_csv_aggregate(rows: List[Dict], filter_column: str) -> Dict[str, Any]:
-    """Aggregate CSV data by column"""
-    if not rows:
-        return {"aggregation": {}, "total_rows": 0, "column": filter_column}
+def format_headers(csv_format: CSVFormat) -> Dict[str, str]:
+    """Response headers reporting the format of an upload, for streamed responses"""
+    return {"X-CSV-Encoding": csv_format.encoding, "X-CSV-Delimiter": csv_format.delimiter, "X-CSV-Quotechar": csv_format.quotechar}
+
+
+def iter_text_lines(stream: BinaryIO, encoding: str = "utf-8", chunk_size: int = READ_CHUNK_SIZE) -> Iterator[str]:
+    """Read a binary stream in chunks and yield decoded lines with their line endings"""
+    for block in iter_text_blocks(stream, encoding, chunk_size):
+        # newline="" splits on \n, \r and \r\n like the csv module expects
+        yield from io.StringIO(block, newline="").readlines()
+
+
+class CSVStream:
+    """A CSV header plus a lazy iterator of records (lists in header order)"""
     
-    # Find the actual column name (case-insensitive)
-    actual_column = find_column_case_insensitive(rows, filter_column)
+    __slots__ = ("columns", "records")
     
-    counts = {}
-    for row in rows:
-        key = str(row.get(actual_column, ""))
-        counts[key] = counts.get(key, 0) + 1
+    def __init__(self, columns: List[str], records: Iterable[List[str]]):
+        self.columns = columns
+        self.records = iter(records)
     
-    return {
-        "aggregation": counts,
-        "total_rows": len(rows),
-        "column": actual_column
-    }
+    def peek(self) -> Optional[List[str]]:
+        """Return the first record without consuming it"""
+        first = next(self.records, None)
+        if first is not None:
+            self.records = itertools.chain((first,), self.records)
+        return first
+    
+    def iter_rows(self) -> Iterator[Dict]:
+        """Yield records as dicts keyed by column name"""
+        columns = self.columns
+        return (dict(zip(columns, record)) for record in self.records)
 
 
-def process_csv_sort(rows: List[Dict], filter_column: str) -> Dict[str, Any]:
-    """Sort CSV rows by column"""
-    if not rows:
-        return {"rows": [], "count": 0, "columns": []}
+class CSVTable:
+    """
+    Column-oriented in-memory table. The header is stored once and every
+    column is a list of cell values, so no per-row dict repeats the keys.
+    Numeric and engine-specific views of a column are built on demand and
+    cached on the table. Tables are never modified in place, so the cache
+    (including the column indexes of indexed tables) never goes stale.
+    """
     
-    # Find the actual column name (case-insensitive)
-    actual_column = find_column_case_insensitive(rows, filter_column)
+    __slots__ = ("columns", "data", "indexed", "index_budget", "_cache")
+    # Held only to check, charge and cache a built index, never while building one
+    _index_lock = threading.Lock()
     
-    sorted_rows = sorted(rows, key=lambda x: str(x.get(actual_column, "")))
-    return {
-        "rows": sorted_rows,
-        "count": len(sorted_rows),
-        "columns": list(rows[0].keys()) if rows else []
-    }
+    def __init__(self, columns: List[str], data: Optional[List[List[str]]] = None):
+        self.columns = [sys.intern(column) for column in columns]
+        self.data = data if data is not None else [[] for _ in columns]
+        # Set for tables that are queried repeatedly (stored datasets), see hash_index and sorted_index
+        self.indexed = False
+        # Called with the estimated bytes of a new index; the index is only cached when it returns True
+        self.index_budget = None
+        self._cache = {}
+    
+    def __len__(self) -> int:
+        return len(self.data[0]) if self.data else 0
+    
+    @classmethod
+    def from_stream(cls, stream: CSVStream, batch_size: int = 512) -> "CSVTable":
+        """Materialize a record stream, transposing it in batches"""
+        table = cls(stream.columns)
+        records = stream.records
+        while True:
+            batch = list(itertools.islice(records, batch_size))
+            if not batch:
+                return table
+            for column, values in zip(table.data, zip(*batch)):
+                column.extend(values)
+    
+    @classmethod
+    def concat(cls, columns: List[str], tables: Iterable["CSVTable"]) -> "CSVTable":
+        """Append tables with the same header, in order"""
+        table = cls(columns)
+        for part in tables:
+            for column, values in zip(table.data, part.data):
+                column.extend(values)
+        return table
+    
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict]) -> "CSVTable":
+        """Build a table from dict rows, taking the header from the first row"""
+        return cls.from_stream(as_stream(rows))
+    
+    def index(self, column: str) -> int:
+        """Return the position of a column, resolved case-insensitively"""
+        return self.columns.index(resolve_column(self.columns, column))
+    
+    def column(self, column: str) -> List[str]:
+        return self.data[self.index(column)]
+    
+    def cached(self, key, build):
+        """Return a derived value for this table, building it on first use"""
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+    
+    def cached_index(self, key, build):
+        """
+        cached() for column indexes, which are kept only if index_budget has
+        room for them. Concurrent requests may build the same index; only
+        the first one finished is charged and cached, the others use it.
+        """
+        if key in self._cache:
+            return self._cache[key]
+        index = build()
+        size = estimate_index_size(index)
+        with self._index_lock:
+            if key in self._cache:
+                return self._cache[key]
+            if self.index_budget is None or self.index_budget(size):
+                self._cache[key] = index
+        return index
+    
+    def numeric(self, column: str) -> array:
+        """Return the column as doubles; cells that are not numbers become NaN"""
+        return self.numeric_at(self.index(column))
+    
+    def numeric_at(self, position: int) -> array:
+        return self.cached(("numeric", position), lambda: array("d", map(parse_number, self.data[position])))
+    
+    def hash_index(self, position: int) -> Dict[str, array]:
+        """Equality index of a column: the rows holding each value, in row order"""
+        def build():
+            index = defaultdict(lambda: array("q"))
+            for row, value in enumerate(self.data[position]):
+                index[value].append(row)
+            return dict(index)
+        return self.cached_index(("hash-index", position), build)
+    
+    def sorted_index(self, position: int, sort_type: str = "string"):
+        """
+        Range index of a column as (keys, rows, unparsed): the cells in
+        ascending order (parsed as numbers or dates unless sort_type is
+        "string"), the row of each key with ties in row order, and the rows
+        whose cell does not parse, ordered by their text.
+        """
+        def build():
+            column = self.data[position]
+            if sort_type == "string":
+                rows = array("q", sorted(range(len(column)), key=column.__getitem__))
+                return list(map(column.__getitem__, rows)), rows, array("q")
+            values = list(map(parse_date if sort_type == "date" else parse_number, column))
+            parsed = [row for row, value in enumerate(values) if value is not None and value == value]
+            parsed.sort(key=values.__getitem__)
+            unparsed = [row for row, value in enumerate(values) if value is None or value != value]
+            unparsed.sort(key=column.__getitem__)
+            return [values[row] for row in parsed], array("q", parsed), array("q", unparsed)
+        return self.cached_index(("sorted-index", position, sort_type), build)
+    
+    def index_info(self) -> List[Dict[str, str]]:
+        """The column indexes built so far"""
+        return [
+            {"column": self.columns[key[1]], "index": key[0][:-len("-index")], **({"sort_type": key[2]} if len(key) > 2 else {})}
+            for key in list(self._cache) if key[0] in ("hash-index", "sorted-index")
+        ]
+    
+    def take(self, indices: List[int]) -> "CSVTable":
+        """Return a new table with the rows at the given positions"""
+        return CSVTable(self.columns, [list(map(column.__getitem__, indices)) for column in self.data])
+    
+    def slice(self, start: int, stop: Optional[int] = None) -> "CSVTable":
+        """Return a new table with the rows [start, stop)"""
+        return CSVTable(self.columns, [column[start:stop] for column in self.data])
+    
+    def select(self, positions: List[int]) -> "CSVTable":
+        """Return a new table with only the columns at the given positions, sharing their data"""
+        return CSVTable([self.columns[position] for position in positions], [self.data[position] for position in positions])
+    
+    def with_column(self, position: int, values: List[str]) -> "CSVTable":
+        """Return a new table sharing every column except the replaced one"""
+        data = list(self.data)
+        data[position] = values
+        return CSVTable(self.columns, data)
+    
+    def stream(self) -> CSVStream:
+        return CSVStream(self.columns, (list(record) for record in zip(*self.data)))
+    
+    def iter_rows(self) -> Iterator[Dict]:
+        columns = self.columns
+        return (dict(zip(columns, record)) for record in zip(*self.data))
+    
+    def to_rows(self) -> List[Dict]:
+        return list(self.iter_rows())
 
 
-def process_csv_view(rows: List[Dict]) -> Dict[str, Any]:
-    """View all CSV rows"""
-    return {
-        "rows": rows,
-        "count": len(rows),
-        "columns": list(rows[0].keys()) if rows else []
-    }
+def parse_number(value: str) -> float:
+    """Parse a cell as a float, returning NaN for anything that is not a number"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
 
 
-@app.post("/api/process/csv")
-async def process_csv(
-    file: UploadFile = File(...),
-    operation: str = Form("view"),
-    filter_column: Optional[str] = Form(None),
-    filter_value: Optional[str] = Form(None),
-    transform_column: Optional[str] = Form(None),
-    transform_operation: Optional[str] = Form(None)
-):
+def normalize_records(records: Iterable[List[str]], width: int) -> Iterator[List[str]]:
+    """Skip blank lines and pad or truncate records to the header width"""
+    for record in records:
+        size = len(record)
+        if size == width:
+            yield record
+        elif size == 0:
+            continue
+        elif size < width:
+            record.extend([""] * (width - size))
+            yield record
+        else:
+            yield record[:width]
+
+
+def keep_positions(header: List[str], keep: Optional[List[str]]) -> Optional[List[int]]:
+    """Header positions of the columns to keep, in header order; None keeps every column"""
+    if keep is None:
+        return None
+    positions = set()
+    for column in keep:
+        actual_column = resolve_column(header, column)
+        # Missing columns are left out; the operation then sees them as missing
+        if actual_column in header:
+            positions.add(header.index(actual_column))
+    # One column is still kept so the records (and the row count) survive
+    return sorted(positions) or [0]
+
+
+def select_fields(records: Iterable[List[str]], width: int, positions: List[int]) -> Iterator[List[str]]:
+    """normalize_records that keeps only the fields at the given positions"""
+    if len(positions) == 1:
+        position = positions[0]
+        return ([record[position] if position < len(record) else ""] for record in records if record)
+    getter = operator.itemgetter(*positions)
+    last = positions[-1]
+    
+    def selected():
+        for record in records:
+            size = len(record)
+            if size > last:
+                yield list(getter(record))
+            elif size:
+                record.extend([""] * (width - size))
+                yield list(getter(record))
+    return selected()
+
+
+def narrow_stream(header: List[str], records: Iterable[List[str]], keep: Optional[List[str]]) -> CSVStream:
+    """Normalize parsed records, extracting only the kept columns by index"""
+    records = timed_records(records)
+    positions = keep_positions(header, keep)
+    if positions is None or len(positions) == len(header):
+        return CSVStream(header, normalize_records(records, len(header)))
+    return CSVStream([header[position] for position in positions], select_fields(records, len(header), positions))
+
+
+def record_line_count(lines: List[str], delimiter: str = ",") -> int:
     """
-    Process CSV files with various operations:
-    - view: View all rows
-    - filter: Filter rows based on column value
-    - transform: Transform column values
-    - aggregate: Aggregate data by column
-    - sort: Sort by column
+    How many of lines (starting outside quotes) the first CSV record spans,
+    as csv.reader reads them; len(lines) + 1 when it is still open after them
     """
+    consumed = 0
+    
+    def feed():
+        nonlocal consumed
+        for line in lines:
+            consumed += 1
+            yield line
+        consumed += 1
+    
     try:
-        # Read CSV file
-        contents = await file.read()
-        text_contents = contents.decode('utf-8')
-        csv_reader = csv.DictReader(io.StringIO(text_contents))
-        rows = list(csv_reader)
-        
-        if not rows:
-            raise HTTPException(status_code=400, detail="CSV file is empty")
-        
-        # Process based on operation
-        if operation == "filter":
-            if not filter_column or filter_value is None:
-                raise HTTPException(status_code=400, detail="filter_column and filter_value required for filter operation")
-            result = process_csv_filter(rows, filter_column, filter_value)
-        
-        elif operation == "transform":
-            if not transform_column or not transform_operation:
-                raise HTTPException(status_code=400, detail="transform_column and transform_operation required")
-            result = process_csv_transform(rows, transform_column, transform_operation)
-        
-        elif operation == "aggregate":
-            if not filter_column:
-                raise HTTPException(status_code=400, detail="filter_column required for aggregate operation")
-            result = process_csv_aggregate(rows, filter_column)
-        
-        elif operation == "sort":
-            if not filter_column:
-                raise HTTPException(status_code=400, detail="filter_column required for sort operation")
-            result = process_csv_sort(rows, filter_column)
-        
-        else:
-            # Default: return all rows
-            result = process_csv_view(rows)
-        
-        return JSONResponse(content=result)
+        next(csv.reader(feed(), delimiter=delimiter), None)
+    except csv.Error:
+        return 0
+    return consumed
+
+
+def prefilter_blocks(blocks: Iterable[str], pushdown: List[frozenset], delimiter: str = ",") -> Iterator[str]:
+    """
+    Predicate pushdown below the CSV parser: yield only the raw lines that
+    contain a needle of every required group (see required_substrings),
+    so csv.reader never splits the others. Blocks without quotes are
+    searched as a whole and only the lines around a hit are cut out;
+    otherwise records with quoted line breaks are kept together: a line
+    with an odd number of quotes is asked of csv.reader whether it opens a
+    quoted field, and the lines up to the next odd one are checked to be
+    one record. Where that check fails (a stray quote inside a field) the
+    rest of the stream is passed through unfiltered.
+    """
+    # One regex alternation per group keeps the scan in C
+    searches = [re.compile("|".join(map(re.escape, sorted(group)))).search for group in pushdown]
+    first, rest = searches[0], searches[1:]
+    matches = functools.reduce(lambda a, b: lambda text: a(text) and b(text), searches)
+    pending = []
+    blocks = iter(blocks)
+    for block in blocks:
+        if not pending and '"' not in block and block.count("\r") == block.count("\r\n"):
+            position = 0
+            while True:
+                hit = first(block, position)
+                if hit is None:
+                    break
+                start = block.rfind("\n", 0, hit.start()) + 1
+                position = block.find("\n", hit.end()) + 1 or len(block)
+                line = block[start:position]
+                if all(search(line) for search in rest):
+                    yield line
+            continue
+        lines = iter(io.StringIO(block, newline="").readlines())
+        for line in lines:
+            odd = line.count('"') & 1
+            if not pending:
+                if odd and record_line_count([line], delimiter) > 1:
+                    pending.append(line)
+                elif matches(line):
+                    yield line
+                continue
+            pending.append(line)
+            if not odd:
+                continue
+            spanned = record_line_count(pending, delimiter)
+            if spanned > len(pending):
+                continue
+            if spanned == len(pending):
+                record = "".join(pending)
+                pending.clear()
+                if matches(record):
+                    yield record
+                continue
+            # Quote parity no longer follows the records: parse the rest as it is
+            yield from pending
+            yield from lines
+            for block in blocks:
+                yield from io.StringIO(block, newline="").readlines()
+            return
+    yield from pending
+
+
+def read_csv_stream(
+    stream: BinaryIO,
+    encoding: str = "utf-8",
+    pushdown: Optional[List[frozenset]] = None,
+    keep: Optional[List[str]] = None,
+    delimiter: str = ",",
+    quotechar: str = '"'
+) -> CSVStream:
+    """
+    Stream CSV records from a binary stream without loading the whole
+    payload. With pushdown (from filter_pushdown), raw lines that cannot
+    match the filter are skipped before they are parsed. With keep (from
+    required_columns), records only hold those columns.
+    """
+    csv_reader = functools.partial(csv.reader, delimiter=delimiter, quotechar=quotechar)
+    # The raw-line prefilter tracks double quotes only
+    if not pushdown or quotechar != '"':
+        reader = csv_reader(iter_text_lines(stream, encoding))
+        header = next((record for record in reader if record), None)
+        if header is None:
+            return CSVStream([], iter(()))
+        return narrow_stream(header, reader, keep)
     
-    except HTTPException:
-        raise
-    except UnicodeDecodeError:
-        raise HTTPException(status_code=400, detail="Invalid file encoding. Please use UTF-8 encoded CSV files.")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing CSV: {str(e)}")
+    blocks = iter_text_blocks(stream, encoding)
+    buffered = deque()
+    
+    def lines():
+        while True:
+            if not buffered:
+                block = next(blocks, None)
+                if block is None:
+                    return
+                buffered.extend(io.StringIO(block, newline="").readlines())
+            yield buffered.popleft()
+    
+    reader = csv_reader(lines())
+    header = next((record for record in reader if record), None)
+    if header is None:
+        return CSVStream([], iter(()))
+    # The first record is parsed unconditionally so an empty file is still told apart from no matches
+    first = next((record for record in reader if record), None)
+    if first is None:
+        return narrow_stream(header, iter(()), keep)
+    rest = itertools.chain(["".join(buffered)] if buffered else [], blocks)
+    records = itertools.chain([first], csv_reader(prefilter_blocks(rest, pushdown, delimiter)))
+    return narrow_stream(header, records, keep)
 
 
-@app.post("/api/download/csv")
-async def download_csv(data: dict):
+def open_csv_upload(
+    upload: BinaryIO,
+    encoding: str = "auto",
+    delimiter: str = "auto",
+    pushdown: Optional[List[frozenset]] = None,
+    keep: Optional[List[str]] = None
+):
+    """Decompress and sniff an upload and start parsing it; returns the CSVStream and its CSVFormat"""
+    csv_format, stream = sniff_upload(open_upload(upload), encoding, delimiter)
+    records = read_csv_stream(stream, csv_format.encoding, pushdown, keep, csv_format.delimiter, csv_format.quotechar)
+    return records, csv_format
+
+
+def iter_csv_rows(stream: BinaryIO, encoding: str = "utf-8") -> Iterator[Dict]:
+    """Stream CSV rows as dicts from a binary stream"""
+    return read_csv_stream(stream, encoding).iter_rows()
+
+
+def read_csv_header(stream: BinaryIO, encoding: str = "utf-8", delimiter: str = ","):
     """
-    Download processed CSV data
+    Parse the header record from the start of a binary stream. Returns the
+    header (None for an empty file) and the byte offset of the first record.
     """
-    try:
-        if "rows" not in data:
-            raise HTTPException(status_code=400, detail="No rows data to convert to CSV. Missing 'rows' key.")
-        if not data["rows"] or len(data["rows"]) == 0:
-            raise HTTPException(status_code=400, detail="No rows data to convert to CSV. Empty rows array.")
-        
-        # Create temporary CSV file
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=data["rows"][0].keys())
-            writer.writeheader()
-            writer.writerows(data["rows"])
-            temp_path = f.name
-        
-        return FileResponse(
-            temp_path,
-            media_type='text/csv',
-            filename=f"processed_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-            headers={"Content-Disposition": f"attachment; filename=processed_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"}
-        )
+    lines = []
+    quoted = False
+    for line in iter(stream.readline, b""):
+        lines.append(line)
+        # An odd number of quotes leaves a quoted field (and the record) open
+        quoted ^= line.count(b'"') & 1
+        if quoted:
+            continue
+        record = next(csv.reader(io.StringIO(b"".join(lines).decode(encoding), newline=""), delimiter=delimiter), [])
+        if record:
+            return record, stream.tell()
+        lines = []
+    return None, stream.tell()
+
+
+def quotes_at_field_starts(block: bytes, quoted: bool, previous: bytes, delimiter: bytes = b",") -> bool:
+    """
+    Whether every quote that quote parity takes as opening a field (starting
+    from quoted, with previous the byte before the block) follows a
+    delimiter, a line break or another quote. Anywhere else, such as 5'10"
+    in an unquoted field, csv.reader reads it as a literal and parity no
+    longer follows the records.
+    """
+    data = previous + block
+    allowed = delimiter + b'\r\n"'
+    if np is not None:
+        opening = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord('"'))[int(quoted)::2]
+        before = np.frombuffer(data, dtype=np.uint8)[opening]
+        return bool(np.isin(before, np.frombuffer(allowed, dtype=np.uint8)).all())
+    parity, last = quoted, len(previous)
+    for match in re.finditer(b"[^" + re.escape(allowed) + b']"', data):
+        quote = match.end() - 1
+        parity ^= data.count(b'"', last, quote) & 1
+        last = quote
+        if not parity:
+            return False
+    return True
+
+
+def split_csv_ranges(
+    stream: BinaryIO,
+    start: int,
+    end: int,
+    chunk_bytes: int,
+    block_size: int = 1024 * 1024,
+    delimiter: bytes = b","
+) -> Optional[List[Tuple[int, int]]]:
+    """
+    Cut the bytes [start, end) of a CSV into ranges of about chunk_bytes
+    that each end on a record boundary: the first "\n" after the target
+    size that is not inside a quoted field, found by tracking quote parity.
+    Returns None when a quote outside a field start makes parity unreliable
+    (see quotes_at_field_starts); the CSV has to be parsed in one pass then.
+    Only valid for ASCII-compatible encodings.
+    """
+    ranges = []
+    stream.seek(start)
+    quoted = False
+    previous = b"\n"
+    chunk_start = position = start
+    target = start + chunk_bytes
+    while position < end:
+        block = stream.read(min(block_size, end - position))
+        if not block:
+            break
+        if not quotes_at_field_starts(block, quoted, previous, delimiter):
+            return None
+        previous = block[-1:]
+        index = 0
+        while index < len(block):
+            if position + index < target:
+                jump = min(target - position, len(block))
+                quoted ^= block.count(b'"', index, jump) & 1
+                index = jump
+                continue
+            newline = block.find(b"\n", index)
+            if newline < 0:
+                quoted ^= block.count(b'"', index) & 1
+                break
+            quoted ^= block.count(b'"', index, newline) & 1
+            index = newline + 1
+            if not quoted:
+                ranges.append((chunk_start, position + index))
+                chunk_start = position + index
+                target = chunk_start + chunk_bytes
+        position += len(block)
+    if chunk_start < end:
+        ranges.append((chunk_start, end))
+    return ranges
+
+
+def as_stream(rows) -> CSVStream:
+    """Accept a CSVTable, a CSVStream or dict rows and return a record stream"""
+    if isinstance(rows, CSVStream):
+        return rows
+    if isinstance(rows, CSVTable):
+        return rows.stream()
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return CSVStream([], iter(()))
+    columns = list(first.keys())
+    records = ([row.get(column, "") for column in columns] for row in itertools.chain((first,), rows))
+    return CSVStream(columns, records)
+
+
+def as_table(rows) -> CSVTable:
+    """Accept a CSVTable, a CSVStream or dict rows and return a table"""
+    if isinstance(rows, CSVTable):
+        return rows
+    return CSVTable.from_stream(as_stream(rows))
+
+
+def table_result(table: CSVTable, shape: str = "rows") -> Dict[str, Any]:
+    """
+    Convert a table to the result returned by the API: one dict per row, or
+    with shape="columns" the header once and one list of values per row.
+    """
+    if shape == "columns":
+        return {
+            "columns": list(table.columns),
+            "data": list(zip(*table.data)),
+            "count": len(table)
+        }
+    return {
+        "rows": table.to_rows(),
+        "count": len(table),
+        "columns": list(table.columns)
+    }
+
+
+TRANSFORMS = {
+    "uppercase": str.upper,
+    "lowercase": str.lower,
+    "trim": str.strip,
+}
+
+
+class PythonEngine:
+    """Pure-Python column kernels; always available and the reference for the others"""
     
-    except HTTPException:
-        # Re-raise HTTPExceptions (like our validation errors)
-        raise
-    except KeyError as e:
-        raise HTTPException(status_code=400, detail=f"Invalid data format. Missing required key: {str(e)}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error creating CSV download: {str(e)}")
+    name = "python"
+    vectorized = False
+    
+    def filter_indices(self, table: CSVTable, position: int, target: str) -> List[int]:
+        column = table.data[position]
+        return list(itertools.compress(range(len(column)), map(target.__eq__, column)))
+    
+    def value_counts(self, table: CSVTable, position: int) -> Dict[str, int]:
+        """Count values in order of first appearance"""
+        return dict(Counter(table.data[position]))
+    
+    def expression_indices(self, table: CSVTable, node) -> List[int]:
+        """
+        Row positions matching a bound filter expression. "and" narrows the
+        candidate rows child by child and "or" only tests rows that have not
+        matched yet, so later conditions read fewer cells.
+        """
+        return list(self._select(table, node, range(len(table))))
+    
+    def _select(self, table: CSVTable, node, candidates):
+        kind = node[0]
+        if kind == "leaf":
+            column, predicate = table.data[node[1]], node[2].predicate
+            cells = column if isinstance(candidates, range) else map(column.__getitem__, candidates)
+            return list(itertools.compress(candidates, map(predicate, cells)))
+        if kind == "const":
+            return candidates if node[1] else []
+        if kind == "not":
+            matched = set(self._select(table, node[1], candidates))
+            return [index for index in candidates if index not in matched]
+        if kind == "and":
+            for child in node[1]:
+                candidates = self._select(table, child, candidates)
+                if not candidates:
+                    break
+            return candidates
+        matched = set()
+        remaining = candidates
+        for child in node[1]:
+            hits = self._select(table, child, remaining)
+            if hits:
+                matched.update(hits)
+                remaining = [index for index in remaining if index not in matched]
+            if not remaining:
+                break
+        return [index for index in candidates if index in matched]
+    
+    def sort_indices(self, table: CSVTable, position: int) -> List[int]:
+        """Stable lexicographic argsort"""
+        column = table.data[position]
+        return sorted(range(len(column)), key=column.__getitem__)
+
+
+class NumpyEngine(PythonEngine):
+    """NumPy kernels: boolean-mask filtering, unique counts and stable argsort"""
+    
+    name = "numpy"
+    vectorized = True
+    
+    def vector(self, table: CSVTable, position: int):
+        def build():
+            column = table.data[position]
+            width = max(map(len, column), default=0)
+            # Fixed-width unicode compares in C but costs 4 bytes per character per cell
+            dtype = f"U{max(width, 1)}" if width <= NUMPY_MAX_STR_WIDTH else object
+            return np.array(column, dtype=dtype)
+        return table.cached(("numpy", position), build)
+    
+    def filter_indices(self, table: CSVTable, position: int, target: str) -> List[int]:
+        return np.flatnonzero(self.vector(table, position) == target).tolist()
+    
+    def expression_indices(self, table: CSVTable, node) -> List[int]:
+        return np.flatnonzero(self.expression_mask(table, node)).tolist()
+    
+    def expression_mask(self, table: CSVTable, node):
+        kind = node[0]
+        if kind == "leaf":
+            return self.condition_mask(table, node[1], node[2])
+        if kind == "const":
+            return np.full(len(table), node[1], dtype=bool)
+        if kind == "not":
+            return ~self.expression_mask(table, node[1])
+        combine = np.logical_and if kind == "and" else np.logical_or
+        return functools.reduce(combine, (self.expression_mask(table, child) for child in node[1]))
+    
+    def condition_mask(self, table: CSVTable, position: int, condition: "FilterCondition"):
+        op, target = condition.op, condition.target
+        if condition.numeric:
+            values = np.frombuffer(table.numeric_at(position), dtype=np.float64)
+        else:
+            values = self.vector(table, position)
+            if op == "regex" or (op == "prefix" and values.dtype == object):
+                return np.fromiter(map(condition.predicate, table.data[position]), dtype=bool, count=len(table))
+            if op == "prefix":
+                return np.char.startswith(values, target)
+        if op == "in":
+            return np.isin(values, target)
+        if op == "between":
+            return (values >= target[0]) & (values <= target[1])
+        mask = COMPARISONS[op](values, target)
+        # NaN != x is true, but cells that are not numbers never match
+        return mask & ~np.isnan(values) if condition.numeric and op == "ne" else mask
+    
+    def value_counts(self, table: CSVTable, position: int) -> Dict[str, int]:
+        values, first_seen, counts = np.unique(self.vector(table, position), return_index=True, return_counts=True)
+        order = np.argsort(first_seen)
+        return dict(zip(values[order].tolist(), counts[order].tolist()))
+    
+    def sort_indices(self, table: CSVTable, position: int) -> List[int]:
+        return np.argsort(self.vector(table, position), kind="stable").tolist()
+
+
+class ArrowEngine(PythonEngine):
+    """pyarrow.compute kernels over Arrow string arrays"""
+    
+    name = "arrow"
+    vectorized = True
+    
+    def vector(self, table: CSVTable, position: int):
+        return table.cached(("arrow", position), lambda: pa.array(table.data[position], type=pa.large_string()))
+    
+    def filter_indices(self, table: CSVTable, position: int, target: str) -> List[int]:
+        return pc.indices_nonzero(pc.equal(self.vector(table, position), target)).to_pylist()
+    
+    def numeric_vector(self, table: CSVTable, position: int):
+        def build():
+            # Zero-copy view of the cached array('d') column
+            values = table.numeric_at(position)
+            return pa.Array.from_buffers(pa.float64(), len(values), [None, pa.py_buffer(values)])
+        return table.cached(("arrow-numeric", position), build)
+    
+    def expression_indices(self, table: CSVTable, node) -> List[int]:
+        return pc.indices_nonzero(self.expression_mask(table, node)).to_pylist()
+    
+    def expression_mask(self, table: CSVTable, node):
+        kind = node[0]
+        if kind == "leaf":
+            return self.condition_mask(table, node[1], node[2])
+        if kind == "const":
+            return pa.array([node[1]] * len(table), type=pa.bool_())
+        if kind == "not":
+            return pc.invert(self.expression_mask(table, node[1]))
+        combine = pc.and_ if kind == "and" else pc.or_
+        return functools.reduce(combine, (self.expression_mask(table, child) for child in node[1]))
+    
+    def condition_mask(self, table: CSVTable, position: int, condition: "FilterCondition"):
+        op, target = condition.op, condition.target
+        if op == "regex":
+            # Python re semantics on every engine (Arrow uses RE2)
+            return pa.array(map(condition.predicate, table.data[position]), type=pa.bool_(), size=len(table))
+        if condition.numeric:
+            values = self.numeric_vector(table, position)
+            value_type = pa.float64()
+        else:
+            values = self.vector(table, position)
+            value_type = pa.large_string()
+        if op == "prefix":
+            return pc.starts_with(values, pattern=target)
+        if op == "in":
+            return pc.is_in(values, value_set=pa.array(target, type=value_type))
+        if op == "between":
+            return pc.and_(pc.greater_equal(values, target[0]), pc.less_equal(values, target[1]))
+        kernel = {"eq": pc.equal, "ne": pc.not_equal, "lt": pc.less, "le": pc.less_equal, "gt": pc.greater, "ge": pc.greater_equal}[op]
+        mask = kernel(values, target)
+        # NaN != x is true, but cells that are not numbers never match
+        return pc.and_(mask, pc.invert(pc.is_nan(values))) if condition.numeric and op == "ne" else mask
+    
+    def value_counts(self, table: CSVTable, position: int) -> Dict[str, int]:
+        # value_counts reports values in order of first appearance
+        counts = pc.value_counts(self.vector(table, position))
+        return dict(zip(counts.field("values").to_pylist(), counts.field("counts").to_pylist()))
+    
+    def sort_indices(self, table: CSVTable, position: int) -> List[int]:
+        # sort_indices is stable and orders UTF-8 bytes, i.e. by code point like str
+        return pc.sort_indices(self.vector(table, position)).to_pylist()
+
+
+ENGINES = {"python": PythonEngine()}
+if np is not None:
+    ENGINES["numpy"] = NumpyEngine()
+if pa is not None:
+    ENGINES["arrow"] = ArrowEngine()
+
+
+def get_engine(name: Optional[str] = None) -> PythonEngine:
+    """
+    Return the execution engine by name ("auto", "python", "numpy" or
+    "arrow"), defaulting to the CSV_ENGINE setting. "auto" picks the fastest
+    installed engine.
+    """
+    name = (name or CSV_ENGINE).lower()
+    if name == "auto":
+        return ENGINES.get("arrow") or ENGINES.get("numpy") or ENGINES["python"]
+    if name in ENGINES:
+        return ENGINES[name]
+    if name in ("numpy", "arrow"):
+        package = "pyarrow" if name == "arrow" else "numpy"
+        raise ValueError(f"Engine '{name}' is not available. Install {package} to use it.")
+    raise ValueError(f"Unknown engine '{name}'. Use one of: auto, python, numpy, arrow")
+
+
+def iter_table_batches(stream: CSVStream, batch_rows: Optional[int] = None) -> Iterator[CSVTable]:
+    """Cut a record stream into tables of at most batch_rows rows"""
+    batch_rows = batch_rows or ENGINE_BATCH_ROWS
+    while True:
+        batch = CSVTable.from_stream(CSVStream(stream.columns, itertools.islice(stream.records, batch_rows)))
+        if not len(batch):
+            return
+        yield batch
+
+
+def filter_stream(stream: CSVStream, filter_column: str, filter_value: str, engine: Optional[str] = None) -> CSVStream:
+    """
+    Lazily keep the records whose column equals the value. Vectorized
+    engines filter the stream in batches so memory stays bounded.
+    """
+    actual_column = resolve_column(stream.columns, filter_column)
+    target = str(filter_value)
+    if actual_column not in stream.columns:
+        # Missing columns compare as empty strings
+        return stream if target == "" else CSVStream(stream.columns, iter(()))
+    position = stream.columns.index(actual_column)
+    
+    kernels = get_engine(engine)
+    if kernels.vectorized:
+        def records():
+            for batch in iter_table_batches(stream):
+                yield from batch.take(kernels.filter_indices(batch, position, target)).stream().records
+        return CSVStream(stream.columns, records())
+    return CSVStream(stream.columns, (record for record in stream.records if record[position] == target))
+
+
+def filter_table(table: CSVTable, filter_column: str, filter_value: str, engine: Optional[str] = None) -> CSVTable:
+    """Filter a table with a scan over the single filter column"""
+    actual_column = resolve_column(table.columns, filter_column)
+    if actual_column not in table.columns:
+        return table if str(filter_value) == "" else table.take([])
+    position = table.columns.index(actual_column)
+    if table.indexed:
+        return table.take(table.hash_index(position).get(str(filter_value), ()))
+    return table.take(get_engine(engine).filter_indices(table, position, str(filter_value)))
+
+
+FILTER_OPERATORS = {
+    "eq": "eq", "=": "eq", "==": "eq",
+    "ne": "ne", "!=": "ne",
+    "lt": "lt", "<": "lt",
+    "le": "le", "<=": "le",
+    "gt": "gt", ">": "gt",
+    "ge": "ge", ">=": "ge",
+    "between": "between",
+    "in": "in",
+    "prefix": "prefix",
+    "regex": "regex"
+}
+COMPARISONS = {"eq": operator.eq, "ne": operator.ne, "lt": operator.lt, "le": operator.le, "gt": operator.gt, "ge": operator.ge}
+
+
+def is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class FilterCondition:
+    """
+    One comparison from a filter expression, e.g.
+    {"column": "age", "op": ">=", "value": 18}. Numeric comparisons (a
+    number value, or "numeric": true) never match cells that are not
+    numbers; string comparisons compare the raw cell text.
+    """
+    
+    __slots__ = ("column", "op", "target", "numeric", "predicate")
+    
+    def __init__(self, column: str, op: str, value: Any, numeric: Optional[bool] = None):
+        if not isinstance(column, str) or not column:
+            raise ValueError("Filter condition needs a column name")
+        if op not in FILTER_OPERATORS:
+            raise ValueError(f"Unknown filter operator '{op}'. Use one of: {', '.join(FILTER_OPERATORS)}")
+        op = FILTER_OPERATORS[op]
+        values = value if isinstance(value, list) else [value]
+        if op in ("between", "in"):
+            if not isinstance(value, list) or (op == "between" and len(value) != 2):
+                raise ValueError(f"'{op}' needs a list value" + (" of [low, high]" if op == "between" else ""))
+        elif isinstance(value, (list, dict)) or value is None:
+            raise ValueError(f"'{op}' needs a single string or number value")
+        if numeric is None:
+            numeric = op not in ("prefix", "regex") and bool(values) and all(map(is_number, values))
+        if numeric and op in ("prefix", "regex"):
+            raise ValueError(f"'{op}' compares text and cannot be numeric")
+        try:
+            targets = [float(item) if numeric else (item if isinstance(item, str) else json.dumps(item)) for item in values]
+        except (TypeError, ValueError):
+            raise ValueError(f"Filter value for '{column}' is not a number")
+        
+        self.column = column
+        self.op = op
+        self.target = targets if isinstance(value, list) else targets[0]
+        self.numeric = bool(numeric)
+        self.predicate = self._cell_predicate()
+    
+    def _cell_predicate(self):
+        """Compile the condition into a function of one cell"""
+        op, target = self.op, self.target
+        if op == "regex":
+            try:
+                search = re.compile(target).search
+            except re.error as e:
+                raise ValueError(f"Invalid regex '{target}': {e}")
+            return lambda cell: search(cell) is not None
+        if op == "prefix":
+            return lambda cell: cell.startswith(target)
+        if not self.numeric:
+            if op == "eq":
+                return target.__eq__
+            if op == "in":
+                return frozenset(target).__contains__
+            if op == "between":
+                low, high = target
+                return lambda cell: low <= cell <= high
+            compare = COMPARISONS[op]
+            return lambda cell: compare(cell, target)
+        # NaN (not a number) compares false with everything
+        if op == "ne":
+            return lambda cell: (value := parse_number(cell)) == value and value != target
+        if op == "in":
+            targets = frozenset(target)
+            return lambda cell: parse_number(cell) in targets
+        if op == "between":
+            low, high = target
+            return lambda cell: low <= parse_number(cell) <= high
+        compare = COMPARISONS[op]
+        return lambda cell: compare(parse_number(cell), target)
+
+
+def parse_filter_expression(expression):
+    """
+    Parse a filter expression (JSON text or an already decoded dict) into
+    a tree of ("and", [nodes]), ("or", [nodes]), ("not", node) and
+    ("leaf", FilterCondition). Raises ValueError when it is malformed.
+    """
+    if isinstance(expression, str):
+        try:
+            expression = json.loads(expression)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"filter_expression is not valid JSON: {e}")
+    if not isinstance(expression, dict):
+        raise ValueError("Filter expressions must be JSON objects")
+    for kind in ("and", "or"):
+        if kind in expression:
+            children = expression[kind]
+            if not isinstance(children, list) or not children:
+                raise ValueError(f"'{kind}' needs a non-empty list of expressions")
+            return (kind, [parse_filter_expression(child) for child in children])
+    if "not" in expression:
+        return ("not", parse_filter_expression(expression["not"]))
+    if "column" not in expression or "op" not in expression:
+        raise ValueError("Filter conditions need 'column', 'op' and 'value' (or and/or/not)")
+    return ("leaf", FilterCondition(expression["column"], expression["op"], expression.get("value"), expression.get("numeric")))
+
+
+def bind_filter(node, columns: List[str]):
+    """
+    Resolve the columns of a parsed expression against a header. Leaves
+    become ("leaf", position, condition); conditions on missing columns
+    compare an empty cell and become ("const", result).
+    """
+    kind = node[0]
+    if kind == "leaf":
+        condition = node[1]
+        actual_column = resolve_column(columns, condition.column)
+        if actual_column not in columns:
+            return ("const", bool(condition.predicate("")))
+        return ("leaf", columns.index(actual_column), condition)
+    if kind == "not":
+        return ("not", bind_filter(node[1], columns))
+    return (kind, [bind_filter(child, columns) for child in node[1]])
+
+
+def compile_row_predicate(node):
+    """Compile a bound expression into one function of a record; and/or short-circuit"""
+    kind = node[0]
+    if kind == "leaf":
+        position, predicate = node[1], node[2].predicate
+        return lambda record: predicate(record[position])
+    if kind == "const":
+        value = node[1]
+        return lambda record: value
+    if kind == "not":
+        inner = compile_row_predicate(node[1])
+        return lambda record: not inner(record)
+    children = [compile_row_predicate(child) for child in node[1]]
+    if kind == "and":
+        return functools.reduce(lambda first, second: lambda record: first(record) and second(record), children)
+    return functools.reduce(lambda first, second: lambda record: first(record) or second(record), children)
+
+
+def is_pushdown_safe(needle: str) -> bool:
+    # A quote is doubled in the raw text and line breaks split the raw record
+    return bool(needle) and '"' not in needle and "\n" not in needle and "\r" not in needle
+
+
+def required_substrings(node) -> List[frozenset]:
+    """
+    Substrings a raw record must contain to possibly match a parsed
+    expression: one group per entry, and at least one needle of every group
+    must occur. An empty list means nothing can be pushed down.
+    """
+    kind = node[0]
+    if kind == "leaf":
+        condition = node[1]
+        if condition.numeric or condition.op not in ("eq", "prefix", "in"):
+            return []
+        needles = condition.target if condition.op == "in" else [condition.target]
+        if needles and all(map(is_pushdown_safe, needles)):
+            return [frozenset(needles)]
+        return []
+    if kind == "and":
+        return [group for child in node[1] for group in required_substrings(child)]
+    if kind == "or":
+        groups = [required_substrings(child) for child in node[1]]
+        if all(groups):
+            return [frozenset().union(*(child_groups[0] for child_groups in groups))]
+    return []
+
+
+def filter_pushdown(params) -> List[frozenset]:
+    """The required substrings of a filter operation (or a pipeline's leading filter), for prefilter_blocks"""
+    if params.pipeline:
+        return filter_pushdown(params.pipeline[0])
+    if params.operation != "filter":
+        return []
+    if params.filter_expression:
+        return required_substrings(parse_filter_expression(params.filter_expression))
+    target = str(params.filter_value)
+    return [frozenset([target])] if is_pushdown_safe(target) else []
+
+
+def expression_columns(node) -> List[str]:
+    """The columns named by a parsed filter expression"""
+    kind = node[0]
+    if kind == "leaf":
+        return [node[1].column]
+    if kind == "not":
+        return expression_columns(node[1])
+    return [column for child in node[1] for column in expression_columns(child)]
+
+
+def step_columns(params) -> List[str]:
+    """The columns one operation reads"""
+    operation = params.operation
+    if operation == "filter":
+        if params.filter_expression:
+            return expression_columns(parse_filter_expression(params.filter_expression))
+        return [params.filter_column]
+    if operation == "transform":
+        return [params.transform_column]
+    if operation == "sort":
+        return params.sort_columns or [params.filter_column]
+    if operation == "aggregate":
+        if params.typed_aggregate:
+            return params.aggregate_group_by + params.value_columns
+        return [params.filter_column]
+    return []
+
+
+def required_columns(params) -> Optional[List[str]]:
+    """
+    The columns the parser has to extract for an operation: what its steps
+    read plus the selected output columns. None when the result includes
+    every column, so nothing can be left out.
+    """
+    steps = params.pipeline or [params]
+    if not (params.columns or any(step.columns for step in steps) or not params.returns_rows):
+        return None
+    needed = list(params.columns)
+    for step in steps:
+        needed.extend(column for column in step_columns(step) if column)
+        needed.extend(step.columns)
+    return list(dict.fromkeys(needed))
+
+
+def filter_stream_expression(stream: CSVStream, expression, engine: Optional[str] = None) -> CSVStream:
+    """Lazily keep the records matching a filter expression"""
+    node = bind_filter(parse_filter_expression(expression), stream.columns)
+    kernels = get_engine(engine)
+    if kernels.vectorized:
+        def records():
+            for batch in iter_table_batches(stream):
+                yield from batch.take(kernels.expression_indices(batch, node)).stream().records
+        return CSVStream(stream.columns, records())
+    return CSVStream(stream.columns, filter(compile_row_predicate(node), stream.records))
+
+
+def filter_table_expression(table: CSVTable, expression, engine: Optional[str] = None) -> CSVTable:
+    """
+    Filter a table by a filter expression, scanning only the columns it
+    uses, or answering it from column indexes when the table is indexed
+    """
+    node = bind_filter(parse_filter_expression(expression), table.columns)
+    rows = indexed_rows(table, node) if table.indexed else None
+    if rows is None:
+        rows = get_engine(engine).expression_indices(table, node)
+    return table.take(rows)
+
+
+def index_lookup(table: CSVTable, position: int, condition: FilterCondition) -> Optional[List[int]]:
+    """
+    Rows matching one condition, in row order, from the hash index (string
+    equality) or the sorted index (ranges, prefixes, numeric comparisons)
+    of its column. None for conditions that need a scan (ne, regex).
+    """
+    op, target = condition.op, condition.target
+    if op in ("ne", "regex"):
+        return None
+    if not condition.numeric and op in ("eq", "in"):
+        index = table.hash_index(position)
+        if op == "eq":
+            return list(index.get(target, ()))
+        return sorted(itertools.chain.from_iterable(index.get(value, ()) for value in set(target)))
+
+    keys, rows, _ = table.sorted_index(position, "numeric" if condition.numeric else "string")
+    if op == "prefix":
+        start = bisect.bisect_left(keys, target)
+        # Cut to the prefix length the keys stay sorted, so the matches are one span
+        spans = [(start, bisect.bisect_right(keys, target, lo=start, key=lambda key: key[:len(target)]))]
+    elif op == "in":
+        spans = [(bisect.bisect_left(keys, value), bisect.bisect_right(keys, value)) for value in set(target)]
+    else:
+        low, high = {"eq": (target, target), "lt": (None, target), "le": (None, target)}.get(op, (target, None))
+        if op == "between":
+            low, high = target
+        start = 0 if low is None else (bisect.bisect_right if op == "gt" else bisect.bisect_left)(keys, low)
+        stop = len(keys) if high is None else (bisect.bisect_left if op == "lt" else bisect.bisect_right)(keys, high)
+        spans = [(start, stop)]
+    return sorted(itertools.chain.from_iterable(rows[start:stop] for start, stop in spans if start < stop))
+
+
+def indexed_rows(table: CSVTable, node) -> Optional[List[int]]:
+    """
+    Rows matching a bound filter expression, answered from column indexes:
+    a condition by lookup, "and" by looking up one child and testing the
+    others on its matches only, "or" when every child can be looked up.
+    None when the expression needs a full scan.
+    """
+    kind = node[0]
+    if kind == "leaf":
+        return index_lookup(table, node[1], node[2])
+    if kind == "and":
+        children = node[1]
+        for i, child in enumerate(children):
+            rows = indexed_rows(table, child)
+            if rows is not None:
+                for other in children[:i] + children[i + 1:]:
+                    rows = ENGINES["python"]._select(table, other, rows)
+                return rows
+        return None
+    if kind == "or":
+        matches = [indexed_rows(table, child) for child in node[1]]
+        if any(rows is None for rows in matches):
+            return None
+        return sorted(set(itertools.chain.from_iterable(matches)))
+    return None
+
+
+def apply_filter(source, params):
+    """Filter a CSVTable or CSVStream by the expression, or the column/value equality, of an operation"""
+    if isinstance(source, CSVTable):
+        if params.filter_expression:
+            return filter_table_expression(source, params.filter_expression, params.engine)
+        return filter_table(source, params.filter_column, params.filter_value, params.engine)
+    if params.filter_expression:
+        return filter_stream_expression(source, params.filter_expression, params.engine)
+    return filter_stream(source, params.filter_column, params.filter_value, params.engine)
+
+
+def transform_stream(stream: CSVStream, transform_column: str, transform_operation: str) -> CSVStream:
+    """Lazily apply a transform operation to one column of every record"""
+    actual_column = resolve_column(stream.columns, transform_column)
+    func = TRANSFORMS.get(transform_operation)
+    if func is None or actual_column not in stream.columns:
+        return stream
+    position = stream.columns.index(actual_column)
+    
+    def transformed():
+        for record in stream.records:
+            record[position] = func(record[position])
+            yield record
+    
+    return CSVStream(stream.columns, transformed())
+
+
+def transform_table(table: CSVTable, transform_column: str, transform_operation: str) -> CSVTable:
+    """Transform a whole column at once"""
+    actual_column = resolve_column(table.columns, transform_column)
+    func = TRANSFORMS.get(transform_operation)
+    if func is None or actual_column not in table.columns:
+        return table
+    position = table.columns.index(actual_column)
+    return table.with_column(position, list(map(func, table.data[position])))
+
+
+def count_values(rows, filter_column: str, engine: Optional[str] = None):
+    """Count occurrences per value of a column, returning (column, counts, total_rows)"""
+    kernels = get_engine(engine)
+    if isinstance(rows, CSVTable):
+        actual_column = resolve_column(rows.columns, filter_column)
+        if actual_column not in rows.columns:
+            return actual_column, ({"": len(rows)} if len(rows) else {}), len(rows)
+        return actual_column, kernels.value_counts(rows, rows.columns.index(actual_column)), len(rows)
+    
+    stream = as_stream(rows)
+    actual_column = resolve_column(stream.columns, filter_column)
+    if actual_column not in stream.columns:
+        total_rows = sum(1 for _ in stream.records)
+        return actual_column, ({"": total_rows} if total_rows else {}), total_rows
+    position = stream.columns.index(actual_column)
+    if kernels.vectorized:
+        # Batches arrive in order, so merged keys keep their first-appearance order
+        counts = Counter()
+        for batch in iter_table_batches(stream):
+            counts.update(kernels.value_counts(batch, position))
+    else:
+        counts = Counter(record[position] for record in stream.records)
+    return actual_column, dict(counts), sum(counts.values())
+
+
+SORT_TYPES = ("string", "numeric", "date")
+DATE_FORMATS = ("%m/%d/%Y", "%Y/%m/%d", "%d.%m.%Y", "%m/%d/%Y %H:%M", "%m/%d/%Y %H:%M:%S")
+
+
+def parse_date(value: str) -> Optional[float]:
+    """Parse ISO 8601 and a few common date formats into a UTC timestamp"""
+    value = value.strip()
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        for date_format in DATE_FORMATS:
+            try:
+                parsed = datetime.strptime(value, date_format)
+                break
+            except ValueError:
+                continue
+        else:
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def make_sort_key(positions: List[int], sort_type: str = "string", descending: bool = False):
+    """
+    Build a record key for one or more column positions. Numeric and date
+    keys put cells that do not parse after every parsed value, in both
+    directions, ordered among themselves as strings.
+    """
+    if sort_type == "string":
+        if len(positions) == 1:
+            return operator.itemgetter(positions[0])
+        return operator.itemgetter(*positions)
+    
+    parse = parse_date if sort_type == "date" else parse_number
+    unparsed_rank = -1 if descending else 1
+    
+    def typed(cell: str):
+        value = parse(cell)
+        if value is None or value != value:
+            return (unparsed_rank, 0.0, cell)
+        return (0, value, "")
+    
+    if len(positions) == 1:
+        position = positions[0]
+        return lambda record: typed(record[position])
+    return lambda record: tuple(typed(record[position]) for position in positions)
+
+
+def estimate_record_size(record: List[str]) -> int:
+    """Rough in-memory size of a record: the list plus one small str per cell"""
+    return 56 + len(record) * 57 + sum(map(len, record))
+
+
+class SpillDirectory:
+    """
+    Temporary directory for spill files, removed as a whole on cleanup.
+    Created under SPILL_DIR (or the system temp directory).
+    """
+    
+    def __init__(self, prefix: str = "csv-spill-"):
+        self.path = tempfile.mkdtemp(prefix=prefix, dir=SPILL_DIR or None)
+        self._files = 0
+    
+    def new_file(self, suffix: str = ".csv") -> str:
+        self._files += 1
+        return os.path.join(self.path, f"{self._files:06d}{suffix}")
+    
+    def cleanup(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
+    
+    def __enter__(self) -> "SpillDirectory":
+        return self
+    
+    def __exit__(self, *exc) -> None:
+        self.cleanup()
+
+
+def write_spill_run(spill: SpillDirectory, records: Iterable[List[str]]) -> str:
+    """Write records to a new CSV file in the spill directory and return its path"""
+    path = spill.new_file()
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows(records)
+    return path
+
+
+def read_spill_run(path: str) -> Iterator[List[str]]:
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from csv.reader(f)
+
+
+def external_sort(
+    first_run: List[List[str]],
+    records: Iterator[List[str]],
+    key,
+    descending: bool,
+    memory_budget: int
+) -> Iterator[List[str]]:
+    """
+    Sort records that do not fit the memory budget: sorted runs of about
+    memory_budget bytes are spilled to CSV files and k-way merged with
+    heapq.merge. The spill directory is removed once the merge finishes.
+    """
+    with SpillDirectory(prefix="csv-sort-") as spill:
+        runs = [write_spill_run(spill, sorted(first_run, key=key, reverse=descending))]
+        first_run.clear()
+        run, size = [], 0
+        for record in records:
+            run.append(record)
+            size += estimate_record_size(record)
+            if size >= memory_budget:
+                runs.append(write_spill_run(spill, sorted(run, key=key, reverse=descending)))
+                run, size = [], 0
+        run.sort(key=key, reverse=descending)
+        yield from heapq.merge(*(read_spill_run(path) for path in runs), run, key=key, reverse=descending)
+
+
+def resolve_sort_positions(columns: List[str], sort_columns: List[str]) -> List[int]:
+    """Positions of the sort columns that exist; unknown columns are ignored"""
+    positions = []
+    for column in sort_columns:
+        actual_column = resolve_column(columns, column)
+        if actual_column in columns:
+            positions.append(columns.index(actual_column))
+    return positions
+
+
+def sort_table(
+    table: CSVTable,
+    sort_column: str,
+    engine: Optional[str] = None,
+    sort_type: str = "string",
+    descending: bool = False,
+    sort_columns: Optional[List[str]] = None
+) -> CSVTable:
+    """Sort a table in memory by one or more columns (stable)"""
+    positions = resolve_sort_positions(table.columns, sort_columns or [sort_column])
+    if not positions:
+        return table
+    if table.indexed and len(positions) == 1:
+        return table.take(indexed_sort_order(table, positions[0], sort_type, descending))
+    if len(positions) == 1 and sort_type == "string" and not descending:
+        return table.take(get_engine(engine).sort_indices(table, positions[0]))
+    
+    key = make_sort_key(positions, sort_type, descending)
+    records = list(zip(*table.data))
+    return table.take(sorted(range(len(records)), key=lambda i: key(records[i]), reverse=descending))
+
+
+def indexed_sort_order(table: CSVTable, position: int, sort_type: str = "string", descending: bool = False) -> List[int]:
+    """
+    The order sort_table gives one column, read from its sorted index:
+    cells that do not parse go last in both directions, and a descending
+    order reverses the index run by run so equal keys keep their row order.
+    """
+    keys, rows, unparsed = table.sorted_index(position, sort_type)
+    if not descending:
+        return list(rows) + list(unparsed)
+    cells = table.data[position]
+    return reversed_runs(keys, rows) + reversed_runs([cells[row] for row in unparsed], unparsed)
+
+
+def reversed_runs(keys: List, rows: array) -> List[int]:
+    """Reverse an ascending order, keeping each run of equal keys in its order (a stable descending order)"""
+    bounds = [0] + [i for i in range(1, len(keys)) if keys[i] != keys[i - 1]] + [len(keys)]
+    order = []
+    for start, stop in zip(reversed(bounds[:-1]), reversed(bounds[1:])):
+        order.extend(rows[start:stop])
+    return order
+
+
+def sort_stream(
+    stream: CSVStream,
+    sort_column: str,
+    engine: Optional[str] = None,
+    sort_type: str = "string",
+    descending: bool = False,
+    sort_columns: Optional[List[str]] = None,
+    memory_budget: Optional[int] = None
+) -> CSVStream:
+    """
+    Sort a record stream. Streams that fit memory_budget (SORT_MEMORY_BUDGET
+    by default) are sorted in memory; larger ones fall back to an external
+    merge sort that spills sorted runs to disk.
+    """
+    positions = resolve_sort_positions(stream.columns, sort_columns or [sort_column])
+    if not positions:
+        return stream
+    memory_budget = memory_budget or SORT_MEMORY_BUDGET
+    
+    run, size = [], 0
+    records = stream.records
+    for record in records:
+        run.append(record)
+        size += estimate_record_size(record)
+        if size >= memory_budget:
+            key = make_sort_key(positions, sort_type, descending)
+            return CSVStream(stream.columns, external_sort(run, records, key, descending, memory_budget))
+    
+    table = CSVTable.from_stream(CSVStream(stream.columns, run))
+    run.clear()
+    return sort_table(table, sort_column, engine, sort_type, descending, sort_columns).stream()
+
+
+def top_sorted(
+    source,
+    n: int,
+    sort_column: str,
+    sort_type: str = "string",
+    descending: bool = False,
+    sort_columns: Optional[List[str]] = None
+):
+    """
+    The first n rows of a sort, picked with a bounded heap (heapq.nsmallest
+    or nlargest, which keep ties in input order like the stable sort) so
+    only n records are held. Returns them as a table with the number of
+    rows ranked.
+    """
+    positions = resolve_sort_positions(source.columns, sort_columns or [sort_column])
+    select = heapq.nlargest if descending else heapq.nsmallest
+    key = make_sort_key(positions, sort_type, descending) if positions else None
+    if isinstance(source, CSVTable):
+        total = len(source)
+        if key is None:
+            return source.slice(0, n), total
+        if source.indexed and len(positions) == 1:
+            return source.take(indexed_sort_order(source, positions[0], sort_type, descending)[:n]), total
+        records = list(zip(*source.data))
+        return source.take(select(n, range(total), key=lambda i: key(records[i]))), total
+    
+    counter = itertools.count()
+    # zip pulls the record first, so the counter ends at the number of records
+    records = (record for record, _ in zip(source.records, counter))
+    if key is None:
+        top = list(itertools.islice(records, n))
+        # Drain the rest, only to count it
+        deque(records, maxlen=0)
+    else:
+        top = select(n, records, key=key)
+    return CSVTable.from_stream(CSVStream(source.columns, top)), next(counter)
+
+
+def process_csv_filter(rows, filter_column: str, filter_value: str, engine: Optional[str] = None) -> Dict[str, Any]:
+    """Filter CSV rows based on column value (rows may be a table, a stream or dicts)"""
+    if isinstance(rows, CSVTable):
+        return table_result(filter_table(rows, filter_column, filter_value, engine))
+    return table_result(CSVTable.from_stream(filter_stream(as_stream(rows), filter_column, filter_value, engine)))
+
+
+def process_csv_transform(rows, transform_column: str, transform_operation: str) -> Dict[str, Any]:
+    """Transform CSV column values"""
+    return table_result(transform_table(as_table(rows), transform_column, transform_operation))
+
+
+def process_csv_aggregate(rows, filter_column: str, engine: Optional[str] = None) -> Dict[str, Any]:
+    """Aggregate CSV data by column (rows may be a table, a stream or dicts)"""
+    if not isinstance(rows, (CSVTable, CSVStream)):
+        rows = as_stream(rows)
+    if not rows.columns:
+        return {"aggregation": {}, "total_rows": 0, "column": filter_column}
+    
+    actual_column, counts, total_rows = count_values(rows, filter_column, engine)
+    return {
+        "aggregation": counts,
+        "total_rows": total_rows,
+        "column": actual_column
+    }
+
+
+def process_csv_sort(
+    rows,
+    filter_column: str,
+    engine: Optional[str] = None,
+    sort_type: str = "string",
+    descending: bool = False,
+    sort_columns: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """Sort CSV rows by one or more columns; streams larger than the memory budget are sorted externally"""
+    if isinstance(rows, CSVTable):
+        return table_result(sort_table(rows, filter_column, engine, sort_type, descending, sort_columns))
+    sorted_stream = sort_stream(as_stream(rows), filter_column, engine, sort_type, descending, sort_columns)
+    return table_result(CSVTable.from_stream(sorted_stream))
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with relative-error guarantees (DDSketch).
+    Values fall into logarithmic buckets, so any quantile is within
+    relative_accuracy of the true value. When more than max_buckets are in
+    use the lowest buckets are collapsed, which keeps memory bounded and
+    only degrades accuracy for the smallest values.
+    """
+    
+    __slots__ = ("relative_accuracy", "max_buckets", "gamma", "log_gamma",
+                 "positive", "negative", "zero_count", "count")
+    
+    def __init__(self, relative_accuracy: float = 0.01, max_buckets: int = 2048):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zero_count = 0
+        self.count = 0
+    
+    def add(self, value: float) -> None:
+        self.count += 1
+        if value > 0:
+            store = self.positive
+        elif value < 0:
+            store = self.negative
+            value = -value
+        else:
+            self.zero_count += 1
+            return
+        index = math.ceil(math.log(value) / self.log_gamma)
+        store[index] = store.get(index, 0) + 1
+        if len(store) > self.max_buckets:
+            self._collapse(store)
+    
+    def _collapse(self, store: Dict[int, int]) -> None:
+        """Fold the lowest-magnitude buckets into one"""
+        indices = sorted(store)
+        excess = len(indices) - self.max_buckets + 1
+        target = indices[excess]
+        store[target] += sum(store.pop(index) for index in indices[:excess])
+    
+    def merge(self, other: "QuantileSketch") -> None:
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for index, count in other_store.items():
+                store[index] = store.get(index, 0) + count
+            if len(store) > self.max_buckets:
+                self._collapse(store)
+        self.zero_count += other.zero_count
+        self.count += other.count
+    
+    def _bucket_value(self, index: int) -> float:
+        return 2 * self.gamma ** index / (self.gamma + 1)
+    
+    def quantile(self, q: float) -> Optional[float]:
+        """Return the approximate q-quantile (0 <= q <= 1)"""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.negative, reverse=True):
+            seen += self.negative[index]
+            if seen > rank:
+                return -self._bucket_value(index)
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.positive):
+            seen += self.positive[index]
+            if seen > rank:
+                return self._bucket_value(index)
+        return self._bucket_value(max(self.positive)) if self.positive else 0.0
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "max_buckets": self.max_buckets,
+            "positive": self.positive,
+            "negative": self.negative,
+            "zero_count": self.zero_count,
+            "count": self.count
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "QuantileSketch":
+        sketch = cls(data["relative_accuracy"], data["max_buckets"])
+        sketch.positive = {int(index): count for index, count in data["positive"].items()}
+        sketch.negative = {int(index): count for index, count in data["negative"].items()}
+        sketch.zero_count = data["zero_count"]
+        sketch.count = data["count"]
+        return sketch
+
+
+NUMERIC_AGGREGATIONS = ("count", "sum", "mean", "min", "max", "stddev")
+DEFAULT_AGGREGATIONS = ["count", "sum", "mean", "min", "max"]
+
+
+def parse_percentile(function: str) -> Optional[float]:
+    """Return q for percentile functions like "p95" or "p99.9", None otherwise"""
+    if len(function) < 2 or function[0] != "p":
+        return None
+    try:
+        percent = float(function[1:])
+    except ValueError:
+        return None
+    return percent / 100 if 0 <= percent <= 100 else None
+
+
+class NumericStats:
+    """Running count/sum/mean/variance/min/max of one numeric column, plus an optional quantile sketch"""
+    
+    __slots__ = ("count", "total", "mean", "m2", "minimum", "maximum", "sketch")
+    
+    def __init__(self, with_sketch: bool = False):
+        self.count = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.sketch = QuantileSketch() if with_sketch else None
+    
+    def add(self, value: float) -> None:
+        # Welford's update keeps the variance numerically stable in one pass
+        self.count += 1
+        self.total += value
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+        if self.sketch is not None:
+            self.sketch.add(value)
+    
+    def merge(self, other: "NumericStats") -> None:
+        if not other.count:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+        self.total += other.total
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        if self.sketch is not None and other.sketch is not None:
+            self.sketch.merge(other.sketch)
+    
+    def result(self, functions: List[str]) -> Dict[str, Any]:
+        has_values = self.count > 0
+        values = {}
+        for function in functions:
+            if function == "count":
+                values["count"] = self.count
+            elif function == "sum":
+                values["sum"] = self.total
+            elif function == "mean":
+                values["mean"] = self.mean if has_values else None
+            elif function == "min":
+                values["min"] = self.minimum if has_values else None
+            elif function == "max":
+                values["max"] = self.maximum if has_values else None
+            elif function == "stddev":
+                values["stddev"] = math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else None
+            else:
+                quantile = self.sketch.quantile(parse_percentile(function)) if has_values else None
+                # Bucket midpoints can overshoot the observed range
+                values[function] = None if quantile is None else min(max(quantile, self.minimum), self.maximum)
+        return values
+    
+    def to_dict(self) -> Dict[str, Any]:
+        has_values = self.count > 0
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.mean,
+            "m2": self.m2,
+            # JSON has no infinity; the bounds only matter once a value was added
+            "minimum": self.minimum if has_values else None,
+            "maximum": self.maximum if has_values else None,
+            "sketch": self.sketch.to_dict() if self.sketch is not None else None
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "NumericStats":
+        stats = cls()
+        stats.count = data["count"]
+        stats.total = data["total"]
+        stats.mean = data["mean"]
+        stats.m2 = data["m2"]
+        if stats.count:
+            stats.minimum = data["minimum"]
+            stats.maximum = data["maximum"]
+        if data["sketch"] is not None:
+            stats.sketch = QuantileSketch.from_dict(data["sketch"])
+        return stats
+
+
+class GroupByAggregator:
+    """Single-pass group-by over records with typed numeric aggregations per value column"""
+    
+    def __init__(self, group_positions: List[int], value_positions: List[int], functions: List[str]):
+        self.group_positions = group_positions
+        self.value_positions = value_positions
+        self.functions = functions
+        self.with_sketch = any(parse_percentile(function) is not None for function in functions)
+        self.groups = {}
+        self.total_rows = 0
+    
+    def _group(self, key: tuple) -> list:
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = [0, [NumericStats(self.with_sketch) for _ in self.value_positions]]
+        return group
+    
+    def add_records(self, records: Iterable[List[str]]) -> None:
+        group_positions = self.group_positions
+        value_positions = list(enumerate(self.value_positions))
+        groups = self.groups
+        total_rows = 0
+        for record in records:
+            total_rows += 1
+            key = tuple([record[position] for position in group_positions])
+            group = groups.get(key)
+            if group is None:
+                group = self._group(key)
+            group[0] += 1
+            stats = group[1]
+            for slot, position in value_positions:
+                cell = record[position]
+                if not cell:
+                    continue
+                try:
+                    value = float(cell)
+                except ValueError:
+                    continue
+                if math.isfinite(value):  # skip NaN and inf, which the stats and sketch cannot hold
+                    stats[slot].add(value)
+        self.total_rows += total_rows
+    
+    def merge(self, other: "GroupByAggregator") -> None:
+        for key, (count, stats) in other.groups.items():
+            group = self._group(key)
+            group[0] += count
+            for mine, theirs in zip(group[1], stats):
+                mine.merge(theirs)
+        self.total_rows += other.total_rows
+    
+    def result(self, group_columns: List[str], value_columns: List[str]) -> Dict[str, Any]:
+        groups = []
+        for key, (count, stats) in self.groups.items():
+            groups.append({
+                "key": dict(zip(group_columns, key)),
+                "count": count,
+                "values": {column: column_stats.result(self.functions)
+                           for column, column_stats in zip(value_columns, stats)}
+            })
+        return {
+            "group_by": group_columns,
+            "value_columns": value_columns,
+            "functions": self.functions,
+            "groups": groups,
+            "group_count": len(groups),
+            "total_rows": self.total_rows
+        }
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "group_positions": self.group_positions,
+            "value_positions": self.value_positions,
+            "functions": self.functions,
+            "groups": [[list(key), count, [column_stats.to_dict() for column_stats in stats]]
+                       for key, (count, stats) in self.groups.items()],
+            "total_rows": self.total_rows
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "GroupByAggregator":
+        aggregator = cls(data["group_positions"], data["value_positions"], data["functions"])
+        aggregator.groups = {
+            tuple(key): [count, [NumericStats.from_dict(column_stats) for column_stats in stats]]
+            for key, count, stats in data["groups"]
+        }
+        aggregator.total_rows = data["total_rows"]
+        return aggregator
+
+
+def validate_aggregations(functions: List[str]) -> None:
+    """Raise ValueError for unknown aggregation functions"""
+    for function in functions:
+        if function not in NUMERIC_AGGREGATIONS and parse_percentile(function) is None:
+            raise ValueError(
+                f"Unknown aggregation '{function}'. Use {', '.join(NUMERIC_AGGREGATIONS)} or a percentile like p95"
+            )
+
+
+def make_group_aggregator(
+    columns: List[str],
+    group_by: List[str],
+    value_columns: List[str],
+    functions: Optional[List[str]] = None
+):
+    """Resolve the group and value columns and return (aggregator, group_columns, value_columns)"""
+    functions = functions or DEFAULT_AGGREGATIONS
+    validate_aggregations(functions)
+    group_columns = [resolve_column(columns, column) for column in group_by]
+    value_names = [resolve_column(columns, column) for column in value_columns]
+    missing = [column for column in group_columns + value_names if column not in columns]
+    if missing:
+        raise ValueError(f"Column not found: {', '.join(missing)}")
+    
+    aggregator = GroupByAggregator(
+        [columns.index(column) for column in group_columns],
+        [columns.index(column) for column in value_names],
+        functions
+    )
+    return aggregator, group_columns, value_names
+
+
+def process_csv_group_aggregate(
+    rows,
+    group_by: List[str],
+    value_columns: List[str],
+    functions: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """
+    Group rows by one or more columns and compute typed aggregations
+    (count, sum, mean, min, max, stddev, pNN percentiles) over numeric value
+    columns in a single streaming pass. Cells that are empty or not numbers
+    are skipped for the value statistics but still counted in the group.
+    """
+    stream = as_stream(rows)
+    aggregator, group_columns, value_names = make_group_aggregator(stream.columns, group_by, value_columns, functions)
+    aggregator.add_records(stream.records)
+    return aggregator.result(group_columns, value_names)
+
+
+APPROX_ERROR_RANGE = (0.001, 0.25)
+HLL_POWERS = [2.0 ** -rank for rank in range(66)]
+FNV_OFFSET = 0xcbf29ce484222325
+FNV_PRIME = 0x100000001b3
+MASK64 = (1 << 64) - 1
+
+
+def mix64(value: int) -> int:
+    """splitmix64 finalizer: spreads FNV's weak high bits over the whole word"""
+    value = (value ^ (value >> 30)) * 0xbf58476d1ce4e5b9 & MASK64
+    value = (value ^ (value >> 27)) * 0x94d049bb133111eb & MASK64
+    return value ^ (value >> 31)
+
+
+def stable_hash64(value: str) -> int:
+    """A 64-bit hash (FNV-1a of the UTF-8 bytes) that is the same in every process, unlike the salted str hash"""
+    hashed = FNV_OFFSET
+    for byte in value.encode("utf-8", "surrogatepass"):
+        hashed = (hashed ^ byte) * FNV_PRIME & MASK64
+    return mix64(hashed)
+
+
+def numpy_stable_hashes(values: List[str]):
+    """
+    stable_hash64 of many values at once: the UTF-8 bytes go into a
+    fixed-width byte matrix and FNV-1a runs column by column, leaving each
+    row alone once its bytes run out. Values wider than NUMPY_MAX_STR_WIDTH
+    bytes are hashed one by one rather than widening the whole matrix.
+    """
+    encoded = [value.encode("utf-8", "surrogatepass") for value in values]
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    long_rows = np.flatnonzero(lengths > NUMPY_MAX_STR_WIDTH)
+    for row in long_rows:
+        encoded[row] = b""
+    width = max(1, int(lengths.max(initial=0, where=lengths <= NUMPY_MAX_STR_WIDTH)))
+    matrix = np.array(encoded, dtype=f"S{width}").view(np.uint8).reshape(len(encoded), width)
+    hashed = np.full(len(encoded), FNV_OFFSET, dtype=np.uint64)
+    prime = np.uint64(FNV_PRIME)
+    with np.errstate(over="ignore"):
+        for position in range(width):
+            np.copyto(hashed, (hashed ^ matrix[:, position]) * prime, where=lengths > position)
+        hashed ^= hashed >> np.uint64(30)
+        hashed *= np.uint64(0xbf58476d1ce4e5b9)
+        hashed ^= hashed >> np.uint64(27)
+        hashed *= np.uint64(0x94d049bb133111eb)
+        hashed ^= hashed >> np.uint64(31)
+    for row in long_rows:
+        hashed[row] = stable_hash64(values[row])
+    return hashed
+
+
+class HyperLogLog:
+    """
+    Distinct-count sketch (HyperLogLog). Each of 2**precision one-byte
+    registers keeps the longest run of leading zero bits among the hashes
+    that fall into it; the estimate has a relative standard error of
+    1.04 / sqrt(2**precision) whatever the cardinality. Sketches of the same
+    precision merge by taking the larger register.
+    """
+    
+    __slots__ = ("precision", "registers")
+    
+    def __init__(self, precision: int = 14):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+    
+    @classmethod
+    def for_error(cls, error: float) -> "HyperLogLog":
+        """The smallest sketch with a standard error of at most error (precision 4 to 18)"""
+        return cls(min(18, max(4, math.ceil(math.log2((1.04 / error) ** 2)))))
+    
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(len(self.registers))
+    
+    def update(self, values: Iterable[str]) -> None:
+        values = list(values)
+        shift = 64 - self.precision
+        if np is not None and values:
+            hashed = numpy_stable_hashes(values)
+            rest = hashed & np.uint64((1 << shift) - 1)
+            # bit_length of the rest, exactly: each 32-bit half fits a float64
+            high, _ = np.divmod(rest, np.uint64(1 << 32))
+            bits = np.where(
+                high > 0, np.frexp(high.astype(np.float64))[1] + 32, np.frexp(rest.astype(np.float64))[1]
+            )
+            ranks = (shift - bits + 1).astype(np.uint8)
+            np.maximum.at(np.frombuffer(self.registers, dtype=np.uint8), (hashed >> np.uint64(shift)).astype(np.intp), ranks)
+            return
+        registers = self.registers
+        mask = (1 << shift) - 1
+        for value in map(stable_hash64, values):
+            index = value >> shift
+            rank = shift - (value & mask).bit_length() + 1
+            if rank > registers[index]:
+                registers[index] = rank
+    
+    def merge(self, other: "HyperLogLog") -> None:
+        self.registers = bytearray(map(max, self.registers, other.registers))
+    
+    def estimate(self) -> int:
+        registers = self.registers
+        size = len(registers)
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(size, 0.7213 / (1 + 1.079 / size))
+        estimate = alpha * size * size / sum(map(HLL_POWERS.__getitem__, registers))
+        zeros = registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            # Linear counting is more accurate while many registers are still empty
+            estimate = size * math.log(size / zeros)
+        return round(estimate)
+
+
+class SpaceSaving:
+    """
+    Heavy hitters in fixed memory (Space-Saving): at most capacity values
+    are counted. A new value arriving when every counter is taken replaces
+    the smallest one and inherits its count as error, so a count is at most
+    total / capacity too high (never too low) and every value occurring
+    more often than that is among the counters. Updates arrive a batch at
+    a time and use the mergeable form, which keeps the same bounds.
+    """
+    
+    __slots__ = ("capacity", "counts", "errors", "total")
+    
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+    
+    def update(self, weights: Dict[str, int]) -> None:
+        """
+        Add weighted occurrences, such as one batch's Counter. The batch is
+        an exact summary, so it merges like one: a value without a counter
+        starts from the floor (and carries it as error), then the capacity
+        largest counts are kept.
+        """
+        floor = self._floor()
+        counts = dict.fromkeys(weights, floor)
+        counts.update(self.counts)
+        for value, weight in weights.items():
+            counts[value] += weight
+        if len(counts) > self.capacity:
+            counts = dict(heapq.nlargest(self.capacity, counts.items(), key=operator.itemgetter(1)))
+        errors = self.errors
+        self.counts = counts
+        self.errors = {value: errors.get(value, floor) for value in counts}
+        self.total += sum(weights.values())
+    
+    def _floor(self) -> int:
+        """The most a value without a counter can have occurred"""
+        return min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+    
+    def merge(self, other: "SpaceSaving") -> None:
+        """Combine two summaries, keeping the capacity largest counts (mergeable Space-Saving)"""
+        floor, other_floor = self._floor(), other._floor()
+        combined = {
+            value: (self.counts.get(value, floor) + other.counts.get(value, other_floor),
+                    self.errors.get(value, floor) + other.errors.get(value, other_floor))
+            for value in itertools.chain(self.counts, other.counts)
+        }
+        kept = heapq.nlargest(self.capacity, combined.items(), key=lambda item: item[1][0])
+        self.counts = {value: count for value, (count, _) in kept}
+        self.errors = {value: error for value, (_, error) in kept}
+        self.total += other.total
+    
+    def top(self, k: int) -> List[Dict[str, Any]]:
+        return [
+            {"value": value, "count": count, "error": self.errors[value]}
+            for value, count in heapq.nlargest(k, self.counts.items(), key=operator.itemgetter(1))
+        ]
+
+
+class ApproximateValueCounts:
+    """
+    Value counts of one column in memory that does not grow with its
+    cardinality: a HyperLogLog distinct count and Space-Saving top-K, both
+    sized from one error bound. Values are first counted exactly per batch
+    of rows, so each distinct value of a batch is hashed and counted once.
+    """
+    
+    def __init__(self, top_k: int, error: float):
+        self.top_k = top_k
+        self.error = error
+        self.distinct = HyperLogLog.for_error(error)
+        self.heavy = SpaceSaving(max(top_k, math.ceil(1 / error)))
+    
+    def add_values(self, values: Iterable[str], batch_rows: int = ENGINE_BATCH_ROWS) -> None:
+        values = iter(values)
+        while True:
+            batch = Counter(itertools.islice(values, batch_rows))
+            if not batch:
+                return
+            self.distinct.update(batch)
+            self.heavy.update(batch)
+    
+    def merge(self, other: "ApproximateValueCounts") -> None:
+        self.distinct.merge(other.distinct)
+        self.heavy.merge(other.heavy)
+    
+    def result(self, column: str) -> Dict[str, Any]:
+        top = self.heavy.top(self.top_k)
+        return {
+            "aggregation": {item["value"]: item["count"] for item in top},
+            "total_rows": self.heavy.total,
+            "column": column,
+            "approximate": True,
+            "distinct": self.distinct.estimate() if self.heavy.total else 0,
+            "distinct_error": round(self.distinct.relative_error, 5),
+            "count_error_bound": self.heavy.total // self.heavy.capacity,
+            "top": top
+        }
+
+
+def approximate_counts(rows, filter_column: str, top_k: Optional[int] = None, error: Optional[float] = None):
+    """Approximate value counts of a column, returning (column, ApproximateValueCounts)"""
+    counts = ApproximateValueCounts(top_k or APPROX_TOP_K, error or APPROX_ERROR)
+    if isinstance(rows, CSVTable):
+        actual_column = resolve_column(rows.columns, filter_column)
+        if actual_column in rows.columns:
+            counts.add_values(rows.data[rows.columns.index(actual_column)])
+        else:
+            counts.add_values(itertools.repeat("", len(rows)))
+        return actual_column, counts
+    stream = as_stream(rows)
+    actual_column = resolve_column(stream.columns, filter_column)
+    if actual_column in stream.columns:
+        counts.add_values(map(operator.itemgetter(stream.columns.index(actual_column)), stream.records))
+    else:
+        # Like count_values: a missing column counts every row as empty
+        counts.add_values("" for _ in stream.records)
+    return actual_column, counts
+
+
+def process_csv_approximate_aggregate(
+    rows,
+    filter_column: str,
+    top_k: Optional[int] = None,
+    error: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Approximate aggregate of a high-cardinality column in fixed memory: the
+    number of distinct values (HyperLogLog) and the top_k most frequent
+    values with their counts (Space-Saving). The distinct count has a
+    relative standard error of about error; counts are at most
+    count_error_bound (error times the rows) too high, and each value's
+    own bound is in top.
+    """
+    if not isinstance(rows, (CSVTable, CSVStream)):
+        rows = as_stream(rows)
+    actual_column, counts = approximate_counts(rows, filter_column, top_k, error)
+    return counts.result(actual_column)
+
+
+def process_csv_view(rows) -> Dict[str, Any]:
+    """View all CSV rows"""
+    return table_result(as_table(rows))
+
+
+JOIN_TYPES = ("inner", "left")
+JOIN_SIDES = ("left", "right")
+
+
+def join_key_positions(columns: List[str], keys: List[str], side: str) -> List[int]:
+    """Positions of the join keys in one side's header, resolved case-insensitively"""
+    actual_columns = [resolve_column(columns, key) for key in keys]
+    missing = [column for column in actual_columns if column not in columns]
+    if missing:
+        raise ValueError(f"Join column not found in the {side} input: {', '.join(missing)}")
+    return [columns.index(column) for column in actual_columns]
+
+
+def join_header(left_columns: List[str], right_columns: List[str], right_keys: List[int]):
+    """
+    The joined header: every left column, then the right columns except its
+    keys. Right columns whose name (in any case) is taken get a "_right"
+    suffix. Returns the header and the positions of the kept right columns.
+    """
+    kept = [position for position in range(len(right_columns)) if position not in right_keys]
+    taken = {column.lower() for column in left_columns}
+    names = []
+    for position in kept:
+        name = right_columns[position]
+        while name.lower() in taken:
+            name += "_right"
+        taken.add(name.lower())
+        names.append(name)
+    return list(left_columns) + names, kept
+
+
+def key_getter(positions: List[int]):
+    """The join key of a record: the cell for one key column, a tuple of cells for several"""
+    return operator.itemgetter(*positions)
+
+
+def records_key_index(records: List[List[str]], key) -> Dict[Any, List[int]]:
+    """Build side hash table: each key's rows, in row order"""
+    index = defaultdict(list)
+    for row, record in enumerate(records):
+        index[key(record)].append(row)
+    return index
+
+
+def table_key_index(table: CSVTable, positions: List[int]) -> Dict[Any, Any]:
+    """
+    Build side hash table of a table. One key column of an indexed (stored)
+    table reuses its cached hash index; otherwise the table is built for
+    this join only and dropped with it.
+    """
+    if len(positions) == 1 and table.indexed:
+        return table.hash_index(positions[0])
+    keys = table.data[positions[0]] if len(positions) == 1 else zip(*(table.data[position] for position in positions))
+    index = defaultdict(lambda: array("q"))
+    for row, key in enumerate(keys):
+        index[key].append(row)
+    return index
+
+
+def probe_join(
+    index: Dict[Any, Any],
+    fetch,
+    build_rows: int,
+    probe: Iterable[List[str]],
+    probe_key,
+    build_is_left: bool,
+    how: str,
+    right_kept: List[int]
+) -> Iterator[List[str]]:
+    """
+    Stream the probe records against a build side hash table (fetch(row)
+    returns a build record), yielding joined records in probe order. A left
+    build side remembers which rows matched, so a left join can emit the
+    unmatched ones at the end.
+    """
+    blanks = [""] * len(right_kept)
+    if build_is_left:
+        matched = bytearray(build_rows) if how == "left" else None
+        for record in probe:
+            rows = index.get(probe_key(record))
+            if rows:
+                right = [record[position] for position in right_kept]
+                for row in rows:
+                    if matched is not None:
+                        matched[row] = 1
+                    yield fetch(row) + right
+        if matched is not None:
+            for row in range(build_rows):
+                if not matched[row]:
+                    yield fetch(row) + blanks
+        return
+    for record in probe:
+        rows = index.get(probe_key(record))
+        if rows:
+            for row in rows:
+                right = fetch(row)
+                yield record + [right[position] for position in right_kept]
+        elif how == "left":
+            yield record + blanks
+
+
+def partition_records(spill: SpillDirectory, records: Iterable[List[str]], key, partitions: int) -> List[str]:
+    """Write records to one spill file per hash partition of their key; returns the paths"""
+    paths = [spill.new_file() for _ in range(partitions)]
+    files = [open(path, "w", newline="", encoding="utf-8") for path in paths]
+    try:
+        writers = [csv.writer(f) for f in files]
+        for record in records:
+            writers[hash(key(record)) % partitions].writerow(record)
+    finally:
+        for f in files:
+            f.close()
+    return paths
+
+
+def grace_join(
+    buffered: List[List[str]],
+    rest: Iterator[List[str]],
+    probe: Iterable[List[str]],
+    build_key,
+    probe_key,
+    partitions: int,
+    join_partition
+) -> Iterator[List[str]]:
+    """
+    Partitioned (Grace) hash join for a build side over the memory budget:
+    both sides are split into spill files by the hash of their key, so each
+    build partition is about 1/partitions of the build side, and the
+    partitions are joined one at a time. The spill directory is removed
+    once the last partition is joined.
+    """
+    with SpillDirectory(prefix="csv-join-") as spill:
+        build_paths = partition_records(spill, itertools.chain(buffered, rest), build_key, partitions)
+        buffered.clear()
+        probe_paths = partition_records(spill, probe, probe_key, partitions)
+        for build_path, probe_path in zip(build_paths, probe_paths):
+            records = list(read_spill_run(build_path))
+            yield from join_partition(records, read_spill_run(probe_path))
+
+
+def hash_join(
+    left,
+    right,
+    left_on: List[str],
+    right_on: List[str],
+    how: str = "inner",
+    build_side: str = "right",
+    memory_budget: int = JOIN_MEMORY_BUDGET,
+    partitions: int = JOIN_SPILL_PARTITIONS
+) -> CSVStream:
+    """
+    Hash join two inputs (CSVStream or CSVTable) on key columns, matching
+    cells exactly. The build side is read into a hash table (a stored table
+    is indexed in place) and the other side is streamed through it as the
+    probe. A streamed build side larger than memory_budget falls back to a
+    partitioned join through spill files.
+    
+    Rows come in probe order, partition by partition after a spill; a left
+    join with a left build side emits the unmatched left rows last.
+    """
+    if how not in JOIN_TYPES:
+        raise ValueError(f"Unknown join type '{how}'. Use one of: {', '.join(JOIN_TYPES)}")
+    if build_side not in JOIN_SIDES:
+        raise ValueError(f"build_side must be one of: {', '.join(JOIN_SIDES)}")
+    if len(left_on) != len(right_on) or not left_on:
+        raise ValueError("Join on the same number of left and right key columns")
+    left_keys = join_key_positions(left.columns, left_on, "left")
+    right_keys = join_key_positions(right.columns, right_on, "right")
+    columns, right_kept = join_header(left.columns, right.columns, right_keys)
+    
+    build_is_left = build_side == "left"
+    build, probe = (left, right) if build_is_left else (right, left)
+    build_key = key_getter(left_keys if build_is_left else right_keys)
+    probe_key = key_getter(right_keys if build_is_left else left_keys)
+    probe_records = probe.stream().records if isinstance(probe, CSVTable) else probe.records
+    
+    def join_partition(records, probe_part):
+        return probe_join(
+            records_key_index(records, build_key), records.__getitem__, len(records),
+            probe_part, probe_key, build_is_left, how, right_kept
+        )
+    
+    if isinstance(build, CSVTable):
+        data = build.data
+        index = table_key_index(build, left_keys if build_is_left else right_keys)
+        
+        def fetch(row):
+            return [column[row] for column in data]
+        return CSVStream(columns, probe_join(index, fetch, len(build), probe_records, probe_key, build_is_left, how, right_kept))
+    
+    # The build side is read here, so a worker pays for it before the first row is sent
+    records, size = [], 0
+    for record in build.records:
+        records.append(record)
+        size += estimate_record_size(record)
+        if size > memory_budget:
+            return CSVStream(columns, grace_join(records, build.records, probe_records, build_key, probe_key, partitions, join_partition))
+    return CSVStream(columns, join_partition(records, probe_records))
+
+
+@dataclass
+class OperationParams:
+    """Parameters of one processing operation, as sent in the upload form"""
+    
+    operation: str = "view"
+    filter_column: Optional[str] = None
+    filter_value: Optional[str] = None
+    transform_column: Optional[str] = None
+    transform_operation: Optional[str] = None
+    engine: Optional[str] = None
+    group_by: List[str] = field(default_factory=list)
+    value_columns: List[str] = field(default_factory=list)
+    aggregations: List[str] = field(default_factory=list)
+    sort_columns: List[str] = field(default_factory=list)
+    sort_type: str = "string"
+    descending: bool = False
+    filter_expression: Optional[str] = None
+    columns: List[str] = field(default_factory=list)
+    pipeline: List["OperationParams"] = field(default_factory=list)
+    shape: str = "rows"
+    encoding: str = "auto"
+    delimiter: str = "auto"
+    offset: int = 0
+    limit: Optional[int] = None
+    top_n: Optional[int] = None
+    approximate: bool = False
+    top_k: Optional[int] = None
+    approx_error: Optional[float] = None
+    
+    @property
+    def paged(self) -> bool:
+        """Whether the response is a window of the result rows"""
+        return self.offset > 0 or self.limit is not None or self.top_n is not None
+    
+    @property
+    def row_window(self):
+        """The (start, stop) of the returned rows; stop is None when the window is open-ended"""
+        stops = [stop for stop in (
+            self.offset + self.limit if self.limit is not None else None,
+            self.top_n
+        ) if stop is not None]
+        return self.offset, min(stops) if stops else None
+    
+    @property
+    def returns_rows(self) -> bool:
+        """Whether the result is rows rather than an aggregate (the last step decides for pipelines)"""
+        last = self.pipeline[-1] if self.pipeline else self
+        return last.operation != "aggregate"
+    
+    @property
+    def typed_aggregate(self) -> bool:
+        """Whether an aggregate uses group-by/numeric functions instead of plain value counts"""
+        return bool(self.group_by or self.value_columns)
+    
+    @property
+    def aggregate_group_by(self) -> List[str]:
+        """Group columns of a typed aggregate; filter_column stands in when group_by is empty"""
+        return self.group_by or ([self.filter_column] if self.filter_column else [])
+
+
+def split_list(value: Optional[str]) -> List[str]:
+    """Split a comma-separated form field into trimmed, non-empty items"""
+    return [item.strip() for item in value.split(",") if item.strip()] if value else []
+
+
+PIPELINE_OPERATIONS = ("view", "filter", "transform", "project", "sort", "aggregate")
+METRIC_OPERATIONS = frozenset(PIPELINE_OPERATIONS + ("pipeline", "join"))
+PIPELINE_LIST_FIELDS = ("group_by", "value_columns", "aggregations", "sort_columns", "columns")
+
+
+def parse_pipeline(text: str, engine: Optional[str] = None) -> List[OperationParams]:
+    """
+    Parse the pipeline form field: a JSON list of steps that take the same
+    fields as the form, e.g. [{"operation": "filter", "filter_column": "city",
+    "filter_value": "Paris"}, {"operation": "sort", "sort_columns": ["age"]}].
+    List fields may be JSON lists or comma-separated strings.
+    """
+    try:
+        steps = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"pipeline is not valid JSON: {e}")
+    if not isinstance(steps, list) or not steps:
+        raise ValueError("pipeline must be a non-empty JSON list of steps")
+    
+    fields = {
+        name for name in OperationParams.__dataclass_fields__
+        if name not in ("engine", "pipeline", "shape", "encoding", "delimiter", "offset", "limit", "top_n")
+    }
+    parsed = []
+    for step in steps:
+        if not isinstance(step, dict) or "operation" not in step:
+            raise ValueError("Every pipeline step must be an object with an operation")
+        unknown = set(step) - fields
+        if unknown:
+            raise ValueError(f"Unknown pipeline step fields: {', '.join(sorted(unknown))}")
+        values = dict(step)
+        for name in PIPELINE_LIST_FIELDS:
+            if isinstance(values.get(name), str):
+                values[name] = split_list(values[name])
+        if isinstance(values.get("filter_expression"), dict):
+            values["filter_expression"] = json.dumps(values["filter_expression"])
+        if values.get("filter_value") is not None and not isinstance(values["filter_value"], str):
+            values["filter_value"] = json.dumps(values["filter_value"])
+        parsed.append(OperationParams(engine=engine, **values))
+    return parsed
+
+
+def validate_operation(params: OperationParams) -> None:
+    """Raise a 400 when the parameters for an operation are missing or invalid"""
+    if params.shape not in RESULT_SHAPES:
+        raise HTTPException(status_code=400, detail=f"Unknown shape '{params.shape}'. Use one of: {', '.join(RESULT_SHAPES)}")
+    if params.offset < 0 or (params.limit is not None and params.limit < 0):
+        raise HTTPException(status_code=400, detail="offset and limit must not be negative")
+    if params.paged and not params.returns_rows:
+        raise HTTPException(status_code=400, detail="offset, limit and top_n only apply to operations that return rows")
+    if params.top_n is not None:
+        if params.operation != "sort":
+            raise HTTPException(status_code=400, detail="top_n is a sort mode; use limit for other operations")
+        if params.top_n < 1:
+            raise HTTPException(status_code=400, detail="top_n must be at least 1")
+    if params.pipeline:
+        for index, step in enumerate(params.pipeline):
+            if step.operation not in PIPELINE_OPERATIONS:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Unknown pipeline operation '{step.operation}'. Use one of: {', '.join(PIPELINE_OPERATIONS)}"
+                )
+            if step.operation == "aggregate" and index != len(params.pipeline) - 1:
+                raise HTTPException(status_code=400, detail="aggregate can only be the last pipeline step")
+            validate_operation(step)
+        return
+    
+    operation = params.operation
+    if operation == "project":
+        if not params.columns:
+            raise HTTPException(status_code=400, detail="columns required for project operation")
+    elif operation == "filter":
+        if params.filter_expression:
+            try:
+                parse_filter_expression(params.filter_expression)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        elif not params.filter_column or params.filter_value is None:
+            raise HTTPException(
+                status_code=400,
+                detail="filter_column and filter_value (or filter_expression) required for filter operation"
+            )
+    elif operation == "transform":
+        if not params.transform_column or not params.transform_operation:
+            raise HTTPException(status_code=400, detail="transform_column and transform_operation required")
+    elif operation == "aggregate":
+        if not params.filter_column and not params.typed_aggregate:
+            raise HTTPException(status_code=400, detail="filter_column required for aggregate operation")
+        if params.approximate and params.typed_aggregate:
+            raise HTTPException(status_code=400, detail="approximate applies to value counts of filter_column, not to group_by/value_columns")
+        if params.top_k is not None and params.top_k < 1:
+            raise HTTPException(status_code=400, detail="top_k must be at least 1")
+        low, high = APPROX_ERROR_RANGE
+        if params.approx_error is not None and not low <= params.approx_error <= high:
+            raise HTTPException(status_code=400, detail=f"approx_error must be between {low} and {high}")
+        try:
+            validate_aggregations(params.aggregations)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    elif operation == "sort":
+        if not params.filter_column and not params.sort_columns:
+            raise HTTPException(status_code=400, detail="filter_column required for sort operation")
+        if params.sort_type not in SORT_TYPES:
+            raise HTTPException(status_code=400, detail=f"sort_type must be one of: {', '.join(SORT_TYPES)}")
+    
+    try:
+        get_engine(params.engine)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def apply_operation(source, params: OperationParams):
+    """
+    Run one operation over a CSVStream or CSVTable. Row-returning operations
+    give back a CSVTable (projected to params.columns), aggregate gives back
+    its JSON result.
+    """
+    operation = params.operation
+    if params.pipeline:
+        if isinstance(source, CSVTable):
+            # Table steps are cheap views (take/with_column), so run them one by one on the engines
+            for step in params.pipeline:
+                source = apply_operation(source, step)
+            result = source
+        else:
+            result = run_pipeline_stream(source, params.pipeline)
+            if not isinstance(result, CSVStream):
+                return result
+            result = CSVTable.from_stream(result)
+        return project_table(result, params.columns)
+    if operation == "aggregate":
+        if params.typed_aggregate:
+            return process_csv_group_aggregate(source, params.aggregate_group_by, params.value_columns, params.aggregations)
+        if params.approximate:
+            return process_csv_approximate_aggregate(source, params.filter_column, params.top_k, params.approx_error)
+        return process_csv_aggregate(source, params.filter_column, params.engine)
+    if not isinstance(source, CSVTable) and operation != "transform":
+        return CSVTable.from_stream(iter_operation_rows(source, params))
+    if operation == "transform":
+        result = transform_table(as_table(source), params.transform_column, params.transform_operation)
+    elif operation == "filter":
+        result = apply_filter(source, params)
+    elif operation == "sort" and params.top_n:
+        result, _ = top_sorted(
+            source, params.top_n, params.filter_column, params.sort_type, params.descending, params.sort_columns
+        )
+    elif operation == "sort":
+        result = sort_table(
+            source, params.filter_column, params.engine, params.sort_type, params.descending, params.sort_columns
+        )
+    else:
+        result = source
+    return project_table(result, params.columns)
+
+
+def resolve_projection(columns: List[str], selected: List[str]) -> List[int]:
+    """Positions of the selected columns, in the requested order"""
+    positions = []
+    for column in selected:
+        actual_column = resolve_column(columns, column)
+        if actual_column not in columns:
+            raise ValueError(f"Column not found: {column}")
+        positions.append(columns.index(actual_column))
+    return positions
+
+
+def compile_record_step(columns: List[str], step: OperationParams):
+    """
+    Compile a streaming step (filter, transform, project or view) into its
+    output header and a function that maps a record to the output record,
+    or to None when the record is dropped. The function is None for steps
+    that leave records unchanged; the step's columns are applied by
+    fuse_steps.
+    """
+    operation = step.operation
+    if operation == "filter":
+        if step.filter_expression:
+            predicate = compile_row_predicate(bind_filter(parse_filter_expression(step.filter_expression), columns))
+        else:
+            actual_column = resolve_column(columns, step.filter_column)
+            target = str(step.filter_value)
+            if actual_column in columns:
+                position = columns.index(actual_column)
+                predicate = lambda record: record[position] == target
+            else:
+                # Missing columns compare as empty strings
+                matches_missing = target == ""
+                predicate = lambda record: matches_missing
+        return columns, lambda record: record if predicate(record) else None
+    if operation == "transform":
+        actual_column = resolve_column(columns, step.transform_column)
+        func = TRANSFORMS.get(step.transform_operation)
+        if func is None or actual_column not in columns:
+            return columns, None
+        position = columns.index(actual_column)
+        
+        def transform(record):
+            record[position] = func(record[position])
+            return record
+        return columns, transform
+    return columns, None
+
+
+def compile_projection(columns: List[str], selected: List[str]):
+    """The projected header and a function that maps a record to the selected fields"""
+    positions = resolve_projection(columns, selected)
+    if len(positions) == 1:
+        position = positions[0]
+        return [columns[position]], lambda record: [record[position]]
+    getter = operator.itemgetter(*positions)
+    return [columns[position] for position in positions], lambda record: list(getter(record))
+
+
+def project_table(table: CSVTable, selected: List[str]) -> CSVTable:
+    """Keep only the selected columns of a table, in the requested order"""
+    if not selected:
+        return table
+    return table.select(resolve_projection(table.columns, selected))
+
+
+def project_stream(stream: CSVStream, selected: List[str]) -> CSVStream:
+    """Lazily keep only the selected columns of a record stream"""
+    if not selected:
+        return stream
+    columns, project = compile_projection(stream.columns, selected)
+    return CSVStream(columns, map(project, stream.records))
+
+
+def fuse_steps(stream: CSVStream, steps: List[OperationParams]) -> CSVStream:
+    """Run adjacent streaming steps as one generator stage, one record at a time"""
+    columns = stream.columns
+    stages = []
+    for step in steps:
+        columns, stage = compile_record_step(columns, step)
+        if stage is not None:
+            stages.append(stage)
+        if step.columns:
+            columns, stage = compile_projection(columns, step.columns)
+            stages.append(stage)
+    if not stages:
+        return CSVStream(columns, stream.records)
+    
+    def records():
+        for record in stream.records:
+            for stage in stages:
+                record = stage(record)
+                if record is None:
+                    break
+            else:
+                yield record
+    
+    return CSVStream(columns, records())
+
+
+def run_pipeline_stream(stream: CSVStream, steps: List[OperationParams]):
+    """
+    Run pipeline steps over a record stream in one pass. Runs of filter,
+    transform and project steps are fused; sort buffers (or spills) its
+    input; a final aggregate returns its JSON result instead of a stream.
+    """
+    pending = []
+    for step in steps:
+        if step.operation not in ("sort", "aggregate"):
+            pending.append(step)
+            continue
+        stream = fuse_steps(stream, pending)
+        pending = []
+        if step.operation == "aggregate":
+            return apply_operation(stream, step)
+        stream = iter_operation_rows(stream, step)
+    return fuse_steps(stream, pending)
+
+
+def page_rows(source, params: OperationParams):
+    """
+    Run a row-returning operation for a paged response. Returns a table
+    holding at least the result rows before the window's end, and the
+    number of rows in the whole result. Streamed rows past the window are
+    only counted; a sort keeps just the first stop rows in a bounded heap.
+    """
+    start, stop = params.row_window
+    if params.operation == "sort" and stop is not None:
+        table, total = top_sorted(
+            source, stop, params.filter_column, params.sort_type, params.descending, params.sort_columns
+        )
+        return project_table(table, params.columns), total
+    if isinstance(source, CSVTable):
+        table = apply_operation(source, params)
+        return table, len(table)
+    stream = iter_operation_rows(source, params)
+    head = list(itertools.islice(stream.records, stop))
+    total = len(head) + sum(1 for _ in stream.records)
+    return CSVTable.from_stream(CSVStream(stream.columns, head)), total
+
+
+def page_result(table: CSVTable, total: int, params: OperationParams) -> Dict[str, Any]:
+    """The JSON result for the window of a table; count is the size of the whole result"""
+    start, stop = params.row_window
+    result = table_result(table.slice(start, stop), params.shape)
+    result["count"] = total
+    result["offset"] = params.offset
+    result["limit"] = params.limit
+    if params.top_n is not None:
+        result["top_n"] = params.top_n
+    return result
+
+
+def run_operation(source, params: OperationParams) -> Dict[str, Any]:
+    """Run one operation over a CSVStream or CSVTable and return the JSON result"""
+    if params.paged and params.returns_rows:
+        return page_result(*page_rows(source, params), params)
+    result = apply_operation(source, params)
+    return table_result(result, params.shape) if isinstance(result, CSVTable) else result
+
+
+def iter_operation_rows(stream: CSVStream, params: OperationParams) -> CSVStream:
+    """Return a lazy record stream for the row-returning operations, projected to params.columns"""
+    operation = params.operation
+    if params.pipeline:
+        stream = run_pipeline_stream(stream, params.pipeline)
+    elif operation == "filter":
+        stream = apply_filter(stream, params)
+    elif operation == "transform":
+        stream = transform_stream(stream, params.transform_column, params.transform_operation)
+    elif operation == "sort":
+        # Sorting needs every row (or every spilled run) before the first one can be emitted
+        stream = sort_stream(
+            stream, params.filter_column, params.engine, params.sort_type, params.descending, params.sort_columns
+        )
+    return project_stream(stream, params.columns)
+
+
+def shaped_rows(source, shape: str = "rows") -> Iterator:
+    """NDJSON rows of a table or stream: dicts, or with shape="columns" lists of values"""
+    if shape == "columns":
+        return iter(source.records) if isinstance(source, CSVStream) else zip(*source.data)
+    return source.iter_rows()
+
+
+def iter_ndjson(
+    columns: List[str],
+    rows: Iterable[Dict],
+    flush_bytes: int = NDJSON_FLUSH_BYTES,
+    total: Optional[int] = None
+) -> Iterator[bytes]:
+    """
+    Serialize a result as newline-delimited JSON: a columns header line, one
+    line per row (an object, or an array with shape="columns") and a
+    trailing count line (total, for a window of a larger result). The header
+    is flushed immediately, rows are batched into chunks of about flush_bytes.
+    """
+    yield encode_json({"columns": columns}) + b"\n"
+    
+    buffer = []
+    buffered = 0
+    count = 0
+    try:
+        for row in rows:
+            line = encode_json(row) + b"\n"
+            buffer.append(line)
+            buffered += len(line)
+            count += 1
+            if buffered >= flush_bytes:
+                yield b"".join(buffer)
+                buffer.clear()
+                buffered = 0
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band
+        buffer.append(encode_json({"error": f"Error processing CSV: {str(e)}"}) + b"\n")
+    else:
+        buffer.append(encode_json({"count": count if total is None else total}) + b"\n")
+    yield b"".join(buffer)
+
+
+class ResultCache:
+    """
+    Content-addressed cache of serialized JSON results. An in-process LRU
+    bounded by total bytes, with an optional on-disk tier (also LRU by
+    bytes) that keeps entries evicted from memory and survives restarts.
+    """
+    
+    def __init__(self, max_bytes: int, disk_dir: str = "", disk_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._disk_entries = None
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = Counter()
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+    
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+    
+    def _load_disk_index(self) -> None:
+        """Index the disk tier on first use, oldest files first"""
+        self._disk_entries = OrderedDict()
+        if not self.disk_dir:
+            return
+        os.makedirs(self.disk_dir, exist_ok=True)
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(".json"):
+                stat = os.stat(os.path.join(self.disk_dir, name))
+                files.append((stat.st_mtime, name[:-len(".json")], stat.st_size))
+        for _, key, size in sorted(files):
+            self._disk_entries[key] = size
+            self._disk_bytes += size
+    
+    def get(self, key: str):
+        """Return (body, tier) for a cached result, or (None, None) on a miss"""
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits_memory"] += 1
+                return body, "memory"
+            if self.disk_dir:
+                if self._disk_entries is None:
+                    self._load_disk_index()
+                if key in self._disk_entries:
+                    try:
+                        with open(self._disk_path(key), "rb") as f:
+                            body = f.read()
+                    except OSError:
+                        self._disk_bytes -= self._disk_entries.pop(key)
+                    else:
+                        self._disk_entries.move_to_end(key)
+                        self._store_memory(key, body)
+                        self.stats["hits_disk"] += 1
+                        return body, "disk"
+            self.stats["misses"] += 1
+            return None, None
+    
+    def put(self, key: str, body: bytes) -> None:
+        with self._lock:
+            self.stats["stores"] += 1
+            self._store_memory(key, body)
+            if self.disk_dir and len(body) <= self.disk_max_bytes:
+                self._store_disk(key, body)
+    
+    def _store_memory(self, key: str, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._bytes -= len(self._entries.pop(key))
+        self._entries[key] = body
+        self._bytes += len(body)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.stats["evictions_memory"] += 1
+    
+    def _store_disk(self, key: str, body: bytes) -> None:
+        if self._disk_entries is None:
+            self._load_disk_index()
+        if key in self._disk_entries:
+            self._disk_entries.move_to_end(key)
+            return
+        path = self._disk_path(key)
+        try:
+            # Write then rename so readers never see a partial file
+            with open(path + ".tmp", "wb") as f:
+                f.write(body)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            return
+        self._disk_entries[key] = len(body)
+        self._disk_bytes += len(body)
+        while self._disk_bytes > self.disk_max_bytes:
+            evicted, size = self._disk_entries.popitem(last=False)
+            self._disk_bytes -= size
+            self.stats["evictions_disk"] += 1
+            try:
+                os.remove(self._disk_path(evicted))
+            except OSError:
+                pass
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._disk_entries:
+                for key in self._disk_entries:
+                    try:
+                        os.remove(self._disk_path(key))
+                    except OSError:
+                        pass
+            self._disk_entries = None
+            self._disk_bytes = 0
+            self.stats.clear()
+    
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.stats["hits_memory"] + self.stats["hits_disk"]
+            lookups = hits + self.stats["misses"]
+            return {
+                "enabled": self.enabled,
+                "hits": hits,
+                "hits_memory": self.stats["hits_memory"],
+                "hits_disk": self.stats["hits_disk"],
+                "misses": self.stats["misses"],
+                "hit_ratio": hits / lookups if lookups else 0.0,
+                "stores": self.stats["stores"],
+                "evictions_memory": self.stats["evictions_memory"],
+                "evictions_disk": self.stats["evictions_disk"],
+                "memory_entries": len(self._entries),
+                "memory_bytes": self._bytes,
+                "memory_max_bytes": self.max_bytes,
+                "disk_entries": len(self._disk_entries or ()),
+                "disk_bytes": self._disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes if self.disk_dir else 0
+            }
+
+
+RESULT_CACHE = ResultCache(RESULT_CACHE_MAX_BYTES, RESULT_CACHE_DIR, RESULT_CACHE_DISK_MAX_BYTES)
+
+
+def hash_upload(stream: BinaryIO, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 of an uploaded file; the stream is rewound afterwards"""
+    digest = hashlib.sha256()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def result_cache_key(content_hash: str, params: OperationParams) -> str:
+    """Key a result by the upload's content hash and the operation parameters"""
+    fields = asdict(params)
+    # Every engine returns identical results, so it is not part of the key
+    fields.pop("engine", None)
+    for step in fields["pipeline"]:
+        step.pop("engine", None)
+    material = json.dumps({"content": content_hash, "params": fields}, sort_keys=True)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def wants_ndjson(response_format: Optional[str], accept: Optional[str]) -> bool:
+    """Check whether the client opted into the streamed NDJSON output"""
+    if response_format:
+        return response_format.lower() == "ndjson"
+    return bool(accept) and NDJSON_MEDIA_TYPE in accept
+
+
+def detach_upload(file: UploadFile) -> BinaryIO:
+    """
+    Take ownership of the upload's spooled file. FastAPI closes form files
+    before a StreamingResponse body runs, so the stream must be detached
+    and closed by the response instead.
+    """
+    stream = file.file
+    file.file = tempfile.SpooledTemporaryFile()
+    return stream
+
+
+def encode_json(result: Any) -> bytes:
+    """
+    Serialize a result as compact UTF-8 JSON, like JSONResponse renders it.
+    orjson is used when it is installed (JSON_SERIALIZER=auto or orjson),
+    the stdlib otherwise or when orjson rejects a value.
+    """
+    if USE_ORJSON:
+        try:
+            return orjson.dumps(result)
+        except TypeError:
+            # e.g. integers beyond 64 bits; the stdlib serializes them
+            pass
+    return json.dumps(result, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def process_upload(stream: BinaryIO, params: OperationParams) -> bytes:
+    """Parse an upload, run one operation and return the serialized JSON result, with the detected csv_format"""
+    stream, csv_format = open_csv_upload(
+        stream, params.encoding, params.delimiter, filter_pushdown(params), required_columns(params)
+    )
+    if stream.peek() is None:
+        raise ValueError("CSV file is empty")
+    result = run_operation(stream, params)
+    result["csv_format"] = csv_format.info()
+    with stage("serialize"):
+        return encode_json(result)
+
+
+def process_upload_file(path: str, params: OperationParams) -> bytes:
+    """process_upload for a spooled copy of the upload, as run in a worker process"""
+    with open(path, "rb") as stream:
+        return process_upload(stream, params)
+
+
+def spool_upload(stream: BinaryIO) -> str:
+    """Copy an upload to a named file that a worker process can open"""
+    fd, path = tempfile.mkstemp(prefix="csv-upload-", suffix=".csv", dir=SPILL_DIR or None)
+    try:
+        with os.fdopen(fd, "wb") as target:
+            shutil.copyfileobj(stream, target, 1024 * 1024)
+    except BaseException:
+        os.unlink(path)
+        raise
+    stream.seek(0)
+    return path
+
+
+def run_chunk(
+    path: str,
+    start: int,
+    end: int,
+    columns: List[str],
+    params: OperationParams,
+    csv_format: Optional[CSVFormat] = None
+):
+    """
+    Map step of the parallel path: parse one byte range of a spooled upload
+    and reduce it to a partial result for combine_chunks.
+    """
+    csv_format = csv_format or CSVFormat()
+    with open(path, "rb") as source:
+        source.seek(start)
+        data = source.read(end - start)
+    pushdown = filter_pushdown(params)
+    if pushdown:
+        lines = prefilter_blocks(iter_text_blocks(io.BytesIO(data), csv_format.encoding), pushdown, csv_format.delimiter)
+    else:
+        lines = iter_text_lines(io.BytesIO(data), csv_format.encoding)
+    records = csv.reader(lines, delimiter=csv_format.delimiter, quotechar=csv_format.quotechar)
+    stream = narrow_stream(columns, records, required_columns(params))
+    if params.operation == "filter":
+        return CSVTable.from_stream(iter_operation_rows(stream, params))
+    if params.operation == "aggregate":
+        if params.typed_aggregate:
+            aggregator, _, _ = make_group_aggregator(
+                stream.columns, params.aggregate_group_by, params.value_columns, params.aggregations
+            )
+            aggregator.add_records(stream.records)
+            return aggregator
+        if params.approximate:
+            return approximate_counts(stream, params.filter_column, params.top_k, params.approx_error)
+        return count_values(stream, params.filter_column, params.engine)
+    return CSVTable.from_stream(stream)
+
+
+def combine_chunks(columns: List[str], params: OperationParams, partials: list) -> Dict[str, Any]:
+    """Reduce step: merge the partial results of run_chunk, in chunk order"""
+    if params.operation == "aggregate":
+        if params.typed_aggregate:
+            aggregator, group_columns, value_names = make_group_aggregator(
+                columns, params.aggregate_group_by, params.value_columns, params.aggregations
+            )
+            for partial in partials:
+                aggregator.merge(partial)
+            return aggregator.result(group_columns, value_names)
+        if params.approximate:
+            column, counts = partials[0]
+            for _, partial in partials[1:]:
+                counts.merge(partial)
+            return counts.result(column)
+        # Chunks are merged in order, so keys keep their first-appearance order
+        counts = Counter()
+        for _, chunk_counts, _ in partials:
+            counts.update(chunk_counts)
+        return {
+            "aggregation": dict(counts),
+            "total_rows": sum(total for _, _, total in partials),
+            "column": resolve_column(columns, params.filter_column)
+        }
+    # Chunks may have been parsed down to the required columns
+    table = CSVTable.concat(partials[0].columns, partials)
+    return page_result(table, len(table), params) if params.paged else table_result(table, params.shape)
+
+
+def runs_in_parallel(params: OperationParams, size: int) -> bool:
+    """Whether an upload is split into chunks that are parsed on several worker processes"""
+    return (
+        EXECUTOR.processes > 1
+        and size >= PARALLEL_PARSE_MIN_BYTES
+        and params.operation in PARALLEL_OPERATIONS
+    )
+
+
+def process_upload_parallel(path: str, params: OperationParams) -> bytes:
+    """
+    Split a spooled upload at record boundaries, run the operation on every
+    chunk in the process pool and combine the partial results. Called from a
+    worker thread, which waits for the chunks.
+    """
+    with open(path, "rb") as source:
+        csv_format, _ = sniff_upload(source, params.encoding, params.delimiter)
+    if not csv_format.splittable:
+        # e.g. UTF-16, where "\n" bytes do not mark line ends; one process parses it all
+        return EXECUTOR.map_processes(process_upload_file, [(path, params)])[0]
+    
+    encoding, delimiter = csv_format.encoding, csv_format.delimiter
+    with open(path, "rb") as source:
+        columns, data_start = read_csv_header(source, encoding, delimiter)
+        first = next((record for record in csv.reader(iter_text_lines(source, encoding), delimiter=delimiter) if record), None)
+        if columns is None or first is None:
+            raise ValueError("CSV file is empty")
+        size = source.seek(0, os.SEEK_END)
+        ranges = split_csv_ranges(source, data_start, size, PARSE_CHUNK_BYTES, delimiter=delimiter.encode(encoding))
+    if ranges is None:
+        # A stray quote: chunk boundaries found by quote parity could cut a record
+        return EXECUTOR.map_processes(process_upload_file, [(path, params)])[0]
+    
+    partials = EXECUTOR.map_processes(run_chunk, [(path, start, end, columns, params, csv_format) for start, end in ranges])
+    result = combine_chunks(columns, params, partials)
+    result["csv_format"] = csv_format.info()
+    with stage("serialize"):
+        return encode_json(result)
+
+
+class ExecutorSaturatedError(Exception):
+    """Raised when every worker slot is taken and the client should retry later"""
+
+
+class OperationExecutor:
+    """
+    Runs CPU-bound processing off the event loop. Jobs whose payload is at
+    least process_min_bytes go to a process pool (when processes > 0) so
+    they do not hold the GIL; everything else runs in a thread pool. At most
+    max_pending jobs are queued or running at once, further submissions fail
+    fast with ExecutorSaturatedError instead of queueing without bound.
+    """
+    
+    def __init__(self, threads: int, processes: int, process_min_bytes: int, max_pending: int):
+        self.threads = threads
+        self.processes = processes
+        self.process_min_bytes = process_min_bytes
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self._thread_pool = None
+        self._process_pool = None
+        self._lock = threading.Lock()
+    
+    def uses_process(self, size: int) -> bool:
+        return self.processes > 0 and size >= self.process_min_bytes
+    
+    def _pool(self, use_process: bool) -> Executor:
+        with self._lock:
+            if use_process:
+                if self._process_pool is None:
+                    # spawn: forking a process that runs threads is unsafe
+                    self._process_pool = ProcessPoolExecutor(
+                        max_workers=self.processes, mp_context=multiprocessing.get_context("spawn")
+                    )
+                return self._process_pool
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="csv-worker")
+            return self._thread_pool
+    
+    def _reserve(self) -> None:
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise ExecutorSaturatedError(f"All {self.max_pending} worker slots are busy")
+            self.pending += 1
+    
+    def _release(self, _future=None) -> None:
+        with self._lock:
+            self.pending -= 1
+    
+    async def run(self, func, *args, size: int = 0):
+        """
+        Run func(*args) in a worker and await its result. size is the payload
+        in bytes and picks the pool; jobs that must share this process's
+        memory (such as stored datasets) pass 0 to stay on a thread.
+        """
+        self._reserve()
+        use_process = self.uses_process(size)
+        try:
+            if use_process:
+                future = self._pool(True).submit(run_timed, func, *args)
+            else:
+                # Threads share the request's StageTimer through a copy of its context
+                future = self._pool(False).submit(contextvars.copy_context().run, staged_call, "process", func, *args)
+        except BaseException:
+            self._release()
+            raise
+        # The slot is held until the job finishes, even if the request is cancelled
+        future.add_done_callback(self._release)
+        try:
+            result = await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            with self._lock:
+                self._process_pool = None
+            raise
+        if not use_process:
+            return result
+        result, seconds, rows = result
+        timer = STAGE_TIMER.get()
+        if timer is not None:
+            timer.merge(seconds, rows)
+        return result
+    
+    def map_processes(self, func, jobs: List[tuple]) -> list:
+        """
+        Run func(*args) for each job on the process pool and return the
+        results in job order. Blocks, so call it from a worker thread.
+        """
+        futures = [self._pool(True).submit(run_timed, func, *args) for args in jobs]
+        try:
+            with stage("wait"):
+                outcomes = [future.result() for future in futures]
+            timer = STAGE_TIMER.get()
+            if timer is not None:
+                for _, seconds, rows in outcomes:
+                    timer.merge(seconds, rows)
+            return [result for result, _, _ in outcomes]
+        except BrokenProcessPool:
+            with self._lock:
+                self._process_pool = None
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
+    
+    def shutdown(self) -> None:
+        with self._lock:
+            pools = [self._thread_pool, self._process_pool]
+            self._thread_pool = self._process_pool = None
+        for pool in pools:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+    
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending": self.pending,
+                "max_pending": self.max_pending,
+                "rejected": self.rejected,
+                "threads": self.threads,
+                "processes": self.processes,
+                "process_min_bytes": self.process_min_bytes
+            }
+
+
+def available_cpus() -> int:
+    """CPUs this process may use: its affinity mask, capped by a cgroup CPU quota (container limits)"""
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = os.cpu_count() or 1
+    quota = None
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            limit, period = f.read().split()[:2]
+        if limit != "max":
+            quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                limit = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = int(f.read())
+            if limit > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+    if quota:
+        count = min(count, max(1, math.ceil(quota)))
+    return count
+
+
+EXECUTOR = OperationExecutor(
+    WORKER_THREADS,
+    available_cpus() if WORKER_PROCESSES == "auto" else int(WORKER_PROCESSES),
+    PROCESS_POOL_MIN_BYTES,
+    WORKER_MAX_PENDING
+)
+
+
+def saturated_response(error: ExecutorSaturatedError) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=f"Server is busy: {error}. Retry later.",
+        headers={"Retry-After": str(WORKER_RETRY_AFTER_SECONDS)}
+    )
+
+
+async def execute_upload(file: UploadFile, params: OperationParams) -> bytes:
+    """
+    Run process_upload on a worker, spooling large uploads for the process
+    pool. Large filter and aggregate uploads are split into chunks that are
+    processed on all worker processes (map/reduce).
+    """
+    size = file.size or 0
+    if not EXECUTOR.uses_process(size):
+        return await EXECUTOR.run(process_upload, file.file, params)
+    path = await run_in_threadpool(spool_upload, file.file)
+    try:
+        # Compressed uploads cannot be split at byte offsets, they are decompressed in one pass
+        if runs_in_parallel(params, size) and upload_compression(file.file) is None:
+            # The coordinator only waits on the chunk jobs, so it runs on a thread
+            return await EXECUTOR.run(process_upload_parallel, path, params)
+        return await EXECUTOR.run(process_upload_file, path, params, size=size)
+    finally:
+        os.unlink(path)
+
+
+def open_ndjson_body(upload: BinaryIO, params: OperationParams) -> Iterator[bytes]:
+    """
+    Parse the header and prepare the NDJSON body; returns it with the
+    upload's CSVFormat. Sorting consumes the whole stream here, so this runs
+    on a worker rather than the event loop.
+    """
+    stream, csv_format = open_csv_upload(
+        upload, params.encoding, params.delimiter, filter_pushdown(params), required_columns(params)
+    )
+    if stream.peek() is None:
+        raise ValueError("CSV file is empty")
+    return ndjson_body(stream, params), csv_format
+
+
+def ndjson_body(stream: CSVStream, params: OperationParams) -> Iterator[bytes]:
+    """The NDJSON body of an operation over a record stream"""
+    if not params.returns_rows:
+        return iter([encode_json(run_operation(stream, params)) + b"\n"])
+    if params.paged:
+        table, total = page_rows(stream, params)
+        start, stop = params.row_window
+        return iter_ndjson(table.columns, shaped_rows(table.slice(start, stop), params.shape), total=total)
+    result_stream = iter_operation_rows(stream, params)
+    return iter_ndjson(result_stream.columns, shaped_rows(result_stream, params.shape))
+
+
+def estimate_table_size(table: CSVTable) -> int:
+    """
+    Rough in-memory size of a table: a list slot per cell plus a small str
+    for every cell longer than one character (CPython shares the empty
+    string and the one-character ones)
+    """
+    size = 0
+    for column in table.data:
+        lengths = list(map(len, column))
+        shared = lengths.count(0) + lengths.count(1)
+        size += 8 * len(column) + 49 * (len(column) - shared) + sum(lengths)
+    return size
+
+
+def estimate_index_size(index) -> int:
+    """
+    Rough in-memory size of a column index: a hash index costs a dict slot
+    and an array per value plus 8 bytes per row, a sorted index a list slot
+    per key (and a float for parsed keys) plus 8 bytes per row
+    """
+    if isinstance(index, dict):
+        return sum(8 * len(rows) + 120 for rows in index.values())
+    keys, rows, unparsed = index
+    key_bytes = 8 if not keys or isinstance(keys[0], str) else 32
+    return key_bytes * len(keys) + 8 * (len(rows) + len(unparsed))
+
+
+class DatasetTooLargeError(Exception):
+    """Raised when a table does not fit in the dataset store at all"""
+
+
+@dataclass
+class Dataset:
+    """A parsed table kept server-side between requests"""
+    
+    id: str
+    table: CSVTable
+    size: int
+    created_at: float
+    last_access: float
+    parent_id: Optional[str] = None
+    csv_format: Optional[CSVFormat] = None
+    index_bytes: int = 0
+    
+    def info(self, ttl_seconds: int) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "columns": list(self.table.columns),
+            "count": len(self.table),
+            "size_bytes": self.size,
+            "parent_id": self.parent_id,
+            "csv_format": self.csv_format.info() if self.csv_format else None,
+            "indexes": self.table.index_info(),
+            "index_bytes": self.index_bytes,
+            "expires_in": max(0, int(self.last_access + ttl_seconds - time.time()))
+        }
+
+
+class DatasetStore:
+    """
+    Parsed tables addressed by id, evicted when idle longer than
+    ttl_seconds or, least recently used first, when their estimated
+    total size exceeds max_bytes. The column indexes a stored table builds
+    count towards max_bytes too.
+    """
+    
+    def __init__(self, max_bytes: int, ttl_seconds: int):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._datasets = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+    
+    def _remove(self, dataset_id: str) -> None:
+        dataset = self._datasets.pop(dataset_id)
+        self._bytes -= dataset.size + dataset.index_bytes
+    
+    def _evict_expired(self, now: float) -> None:
+        # Least recently used first, so stop at the first live dataset
+        while self._datasets:
+            dataset = next(iter(self._datasets.values()))
+            if now - dataset.last_access <= self.ttl_seconds:
+                break
+            self._remove(dataset.id)
+    
+    def add(self, table: CSVTable, parent_id: Optional[str] = None, csv_format: Optional[CSVFormat] = None) -> Dataset:
+        size = estimate_table_size(table)
+        if size > self.max_bytes:
+            raise DatasetTooLargeError(
+                f"Dataset needs about {size} bytes but the store is limited to {self.max_bytes} bytes"
+            )
+        now = time.time()
+        dataset = Dataset(uuid.uuid4().hex, table, size, now, now, parent_id, csv_format)
+        # Stored tables are queried repeatedly, so they build column indexes on first use
+        table.indexed = DATASET_INDEXES
+        table.index_budget = functools.partial(self._charge_index, dataset)
+        with self._lock:
+            self._evict_expired(now)
+            while self._datasets and self._bytes + size > self.max_bytes:
+                self._remove(next(iter(self._datasets)))
+            self._datasets[dataset.id] = dataset
+            self._bytes += size
+        return dataset
+    
+    def _charge_index(self, dataset: Dataset, size: int) -> bool:
+        """
+        Count a new index of a stored table, evicting the least recently
+        used other datasets to make room. False (the index is not kept) when
+        the dataset is gone or would not fit with it.
+        """
+        with self._lock:
+            if self._datasets.get(dataset.id) is not dataset:
+                return False
+            if dataset.size + dataset.index_bytes + size > self.max_bytes:
+                return False
+            dataset.index_bytes += size
+            self._bytes += size
+            self._datasets.move_to_end(dataset.id)
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._datasets)))
+            return True
+    
+    def get(self, dataset_id: str) -> Optional[Dataset]:
+        now = time.time()
+        with self._lock:
+            self._evict_expired(now)
+            dataset = self._datasets.get(dataset_id)
+            if dataset is not None:
+                dataset.last_access = now
+                self._datasets.move_to_end(dataset_id)
+            return dataset
+    
+    def delete(self, dataset_id: str) -> bool:
+        with self._lock:
+            if dataset_id not in self._datasets:
+                return False
+            self._remove(dataset_id)
+            return True
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._datasets.clear()
+            self._bytes = 0
+    
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"datasets": len(self._datasets), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+DATASETS = DatasetStore(DATASET_MAX_BYTES, DATASET_TTL_SECONDS)
+
+
+def load_dataset(upload: BinaryIO, encoding: str = "auto", delimiter: str = "auto") -> Dataset:
+    """Parse an upload into a table and store it with its detected format"""
+    stream, csv_format = open_csv_upload(upload, encoding, delimiter)
+    if stream.peek() is None:
+        raise ValueError("CSV file is empty")
+    return DATASETS.add(CSVTable.from_stream(stream), csv_format=csv_format)
+
+
+def run_dataset_operation(dataset: Dataset, params: OperationParams):
+    """
+    Run an operation on a stored dataset. Row results are stored as a new
+    dataset; returns the result and its dataset id (None when it does not
+    fit the store or is not a table).
+    """
+    result = apply_operation(dataset.table, params)
+    if not isinstance(result, CSVTable):
+        return result, None
+    if result is dataset.table:
+        # Views (e.g. paging through a stored result) reuse the dataset instead of storing it again
+        return result, dataset.id
+    try:
+        return result, DATASETS.add(result, parent_id=dataset.id).id
+    except DatasetTooLargeError:
+        return result, None
+
+
+def dataset_result_total(dataset: Dataset, result: CSVTable, params: OperationParams) -> int:
+    """Rows in the whole result; a top_n sort ranks every row of the dataset"""
+    return len(dataset.table) if params.top_n is not None else len(result)
+
+
+def encode_dataset_result(result, result_id: Optional[str], params: Optional[OperationParams] = None, total: int = 0) -> bytes:
+    if isinstance(result, CSVTable):
+        if params is None:
+            result = table_result(result)
+        else:
+            result = page_result(result, total, params) if params.paged else table_result(result, params.shape)
+        result["dataset_id"] = result_id
+    with stage("serialize"):
+        return encode_json(result)
+
+
+AGGREGATION_NAME = re.compile(r"[A-Za-z0-9_.-]{1,64}")
+AGGREGATION_FIELDS = ("filter_column", "group_by", "value_columns", "aggregations", "engine")
+
+
+def aggregate_chunk(upload: BinaryIO, params: OperationParams):
+    """
+    Parse one appended chunk and reduce it to a partial aggregate, like
+    run_chunk does for a byte range: (aggregator, group_columns,
+    value_columns) for typed aggregates, (column, counts, total_rows) for
+    value counts.
+    """
+    stream, _ = open_csv_upload(upload, params.encoding, params.delimiter, keep=required_columns(params))
+    if not stream.columns:
+        raise ValueError("CSV file is empty")
+    if params.typed_aggregate:
+        aggregator, group_columns, value_names = make_group_aggregator(
+            stream.columns, params.aggregate_group_by, params.value_columns, params.aggregations
+        )
+        aggregator.add_records(stream.records)
+        return aggregator, group_columns, value_names
+    return count_values(stream, params.filter_column, params.engine)
+
+
+def aggregate_chunk_file(path: str, params: OperationParams):
+    """aggregate_chunk for a spooled copy of the chunk, as run in a worker process"""
+    with open(path, "rb") as stream:
+        return aggregate_chunk(stream, params)
+
+
+class AggregationLimitError(Exception):
+    """Raised when a new aggregation state would exceed the store's limit"""
+
+
+@dataclass
+class AggregationState:
+    """The running aggregate of a file that only grows, kept under a name"""
+    
+    name: str
+    params: OperationParams
+    created_at: float
+    updated_at: float
+    chunks: int = 0
+    total_rows: int = 0
+    # Resolved column names, taken from the first chunk
+    columns: Optional[List[str]] = None
+    value_columns: Optional[List[str]] = None
+    counts: Counter = field(default_factory=Counter)
+    aggregator: Optional[GroupByAggregator] = None
+    removed: bool = False
+    lock: Any = field(default_factory=threading.Lock, repr=False)
+    
+    def merge(self, partial) -> int:
+        """Fold a partial aggregate from aggregate_chunk into the state; returns the chunk's rows"""
+        if self.params.typed_aggregate:
+            aggregator, group_columns, value_names = partial
+            if self.aggregator is None:
+                self.aggregator, self.columns, self.value_columns = aggregator, group_columns, value_names
+            else:
+                self.aggregator.merge(aggregator)
+            rows = aggregator.total_rows
+        else:
+            column, counts, rows = partial
+            # Chunks are merged in order, so keys keep their first-appearance order
+            self.counts.update(counts)
+            self.columns = self.columns or [column]
+        self.chunks += 1
+        self.total_rows += rows
+        self.updated_at = time.time()
+        return rows
+    
+    def result(self) -> Dict[str, Any]:
+        """The aggregate of every chunk so far, shaped like the aggregate result of /api/process/csv"""
+        params = self.params
+        if params.typed_aggregate:
+            if self.aggregator is None:
+                empty = GroupByAggregator([], [], params.aggregations or DEFAULT_AGGREGATIONS)
+                return empty.result(params.aggregate_group_by, params.value_columns)
+            return self.aggregator.result(self.columns, self.value_columns)
+        return {
+            "aggregation": dict(self.counts),
+            "total_rows": self.total_rows,
+            "column": self.columns[0] if self.columns else params.filter_column
+        }
+    
+    def info(self) -> Dict[str, Any]:
+        groups = len(self.aggregator.groups) if self.aggregator is not None else len(self.counts)
+        return {
+            "name": self.name,
+            "params": {name: getattr(self.params, name) for name in AGGREGATION_FIELDS},
+            "chunks": self.chunks,
+            "total_rows": self.total_rows,
+            "groups": groups,
+            "created_at": iso_time(self.created_at),
+            "updated_at": iso_time(self.updated_at)
+        }
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "params": {name: getattr(self.params, name) for name in AGGREGATION_FIELDS},
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "chunks": self.chunks,
+            "total_rows": self.total_rows,
+            "columns": self.columns,
+            "value_columns": self.value_columns,
+            "counts": self.counts,
+            "aggregator": self.aggregator.to_dict() if self.aggregator is not None else None
+        }
+    
+    @classmethod
+    def from_snapshot(cls, data: Dict[str, Any]) -> "AggregationState":
+        return cls(
+            data["name"],
+            OperationParams(operation="aggregate", **data["params"]),
+            data["created_at"],
+            data["updated_at"],
+            data["chunks"],
+            data["total_rows"],
+            data["columns"],
+            data["value_columns"],
+            Counter(data["counts"]),
+            GroupByAggregator.from_dict(data["aggregator"]) if data["aggregator"] is not None else None
+        )
+
+
+class AggregationStore:
+    """
+    Named aggregation states of growing files. An appended chunk is parsed
+    and reduced to a partial aggregate on its own, then merged into the
+    state, so an append costs the chunk plus the number of groups, never a
+    re-read of the rows before it. With a state_dir every state is written
+    to <name>.json after each change and read back on first use after a
+    restart.
+    """
+    
+    def __init__(self, state_dir: str = "", max_states: int = 64):
+        self.state_dir = state_dir
+        self.max_states = max_states
+        self._states = None
+        self._lock = threading.Lock()
+    
+    def _path(self, name: str) -> str:
+        return os.path.join(self.state_dir, f"{name}.json")
+    
+    def _loaded(self) -> Dict[str, AggregationState]:
+        """The states by name, read from their snapshots on first use; call with the lock held"""
+        if self._states is None:
+            self._states = {}
+            if self.state_dir:
+                os.makedirs(self.state_dir, exist_ok=True)
+                for file_name in sorted(os.listdir(self.state_dir)):
+                    if not file_name.endswith(".json"):
+                        continue
+                    try:
+                        with open(os.path.join(self.state_dir, file_name), "rb") as f:
+                            state = AggregationState.from_snapshot(json.load(f))
+                    except (OSError, ValueError, KeyError, TypeError):
+                        continue
+                    self._states[state.name] = state
+        return self._states
+    
+    def _save(self, state: AggregationState) -> None:
+        """Replace the state's snapshot atomically; call with the state's lock held"""
+        if not self.state_dir:
+            return
+        try:
+            # Not encode_json: orjson writes inf as null, which would not load back
+            data = json.dumps(state.snapshot(), allow_nan=False, separators=(",", ":")).encode("utf-8")
+        except ValueError as e:
+            raise ValueError(f"Aggregation '{state.name}' cannot be saved: a result is out of the float range") from e
+        partial = self._path(state.name) + ".part"
+        try:
+            with open(partial, "wb") as f:
+                f.write(data)
+            os.replace(partial, self._path(state.name))
+        except BaseException:
+            if os.path.exists(partial):
+                os.unlink(partial)
+            raise
+    
+    def create(self, name: str, params: OperationParams) -> AggregationState:
+        """Start an empty state, replacing any state of the same name"""
+        now = time.time()
+        state = AggregationState(name, params, now, now)
+        with self._lock:
+            states = self._loaded()
+            previous = states.get(name)
+            if previous is None and len(states) >= self.max_states:
+                raise AggregationLimitError(f"There are already {len(states)} aggregation states")
+            if previous is not None:
+                # An append still running on the old state must not write its snapshot
+                with previous.lock:
+                    previous.removed = True
+            states[name] = state
+            with state.lock:
+                self._save(state)
+        return state
+    
+    def get(self, name: str) -> Optional[AggregationState]:
+        with self._lock:
+            return self._loaded().get(name)
+    
+    def states(self) -> List[AggregationState]:
+        with self._lock:
+            return list(self._loaded().values())
+    
+    def append(self, state: AggregationState, partial) -> Optional[int]:
+        """
+        Merge a chunk's partial aggregate and snapshot the state; None if it
+        was replaced or deleted meanwhile. The chunk is merged into a copy
+        that replaces the state only once it is saved, so a failed merge or
+        snapshot leaves both the state and its snapshot as they were.
+        """
+        with state.lock:
+            if state.removed:
+                return None
+            updated = AggregationState.from_snapshot(state.snapshot())
+            rows = updated.merge(partial)
+            self._save(updated)
+            for name in ("updated_at", "chunks", "total_rows", "columns", "value_columns", "counts", "aggregator"):
+                setattr(state, name, getattr(updated, name))
+            return rows
+    
+    def delete(self, name: str) -> bool:
+        with self._lock:
+            state = self._loaded().pop(name, None)
+            if state is None:
+                return False
+            with state.lock:
+                state.removed = True
+                if self.state_dir and os.path.exists(self._path(name)):
+                    os.unlink(self._path(name))
+        return True
+
+
+AGGREGATIONS = AggregationStore(AGGREGATION_STATE_DIR, AGGREGATION_MAX_STATES)
+
+
+def encode_aggregation(state: AggregationState) -> bytes:
+    """Serialize a state's current aggregate together with its info"""
+    with state.lock:
+        result = state.result()
+        result["state"] = state.info()
+        with stage("serialize"):
+            return encode_json(result)
+
+
+JOB_FORMATS = {"json": "application/json", "ndjson": NDJSON_MEDIA_TYPE}
+JOB_ACTIVE = ("queued", "running")
+JOB_UPLOAD_FILE = "upload"
+JOB_RESULT_FILE = "result"
+JOB_PROGRESS_FILE = "progress.json"
+JOB_CANCEL_FILE = "cancel"
+
+
+class JobCancelledError(BaseException):
+    """
+    Raised inside a job once its cancel marker exists. A BaseException, like
+    asyncio.CancelledError, so that the in-band error handling of NDJSON
+    bodies does not turn a cancellation into a result.
+    """
+
+
+def write_job_progress(job_dir: str, progress: Dict[str, Any]) -> None:
+    """Replace the progress file atomically, so readers never see a partial write"""
+    partial = os.path.join(job_dir, JOB_PROGRESS_FILE + ".part")
+    with open(partial, "w") as f:
+        json.dump(progress, f)
+    os.replace(partial, os.path.join(job_dir, JOB_PROGRESS_FILE))
+
+
+def read_job_progress(job_dir: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(job_dir, JOB_PROGRESS_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class JobProgress:
+    """
+    Reader over a job's spooled upload that reports progress as it is
+    consumed. At most every JOB_PROGRESS_INTERVAL seconds it writes the
+    bytes read and the rows parsed so far to the job's progress file and
+    stops the job if its cancel marker exists. Both are files so that jobs
+    can run in worker processes.
+    """
+    
+    def __init__(self, stream: BinaryIO, job_dir: str, timer: StageTimer, interval: float = JOB_PROGRESS_INTERVAL):
+        self._stream = stream
+        self._job_dir = job_dir
+        self._timer = timer
+        self._interval = interval
+        self._started_at = time.time()
+        self._next_report = 0.0
+    
+    def read(self, size: int = -1) -> bytes:
+        data = self._stream.read(size)
+        now = time.monotonic()
+        if now >= self._next_report:
+            self._next_report = now + self._interval
+            self.report()
+        return data
+    
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self._stream.seek(offset, whence)
+    
+    def tell(self) -> int:
+        return self._stream.tell()
+    
+    def seekable(self) -> bool:
+        return True
+    
+    def report(self) -> None:
+        if os.path.exists(os.path.join(self._job_dir, JOB_CANCEL_FILE)):
+            raise JobCancelledError()
+        write_job_progress(self._job_dir, {
+            "started_at": self._started_at,
+            "bytes_read": self._stream.tell(),
+            "rows": self._timer.rows
+        })
+
+
+def run_job(job_dir: str, params: OperationParams, response_format: str) -> Dict[str, Any]:
+    """
+    Worker entry point of a background job: process the spooled upload like
+    /api/process/csv and write the JSON or NDJSON result to the job's
+    result file. Returns the final progress.
+    """
+    timer = StageTimer()
+    token = STAGE_TIMER.set(timer)
+    partial = os.path.join(job_dir, JOB_RESULT_FILE + ".part")
+    try:
+        with open(os.path.join(job_dir, JOB_UPLOAD_FILE), "rb") as raw, open(partial, "wb") as target:
+            upload = JobProgress(raw, job_dir, timer)
+            if response_format == "ndjson":
+                body, _ = open_ndjson_body(upload, params)
+                for chunk in body:
+                    target.write(chunk)
+            else:
+                target.write(process_upload(upload, params))
+            upload.report()
+            bytes_read = raw.tell()
+        os.replace(partial, os.path.join(job_dir, JOB_RESULT_FILE))
+        return {"bytes_read": bytes_read, "rows": timer.rows}
+    finally:
+        STAGE_TIMER.reset(token)
+        if os.path.exists(partial):
+            os.unlink(partial)
+
+
+def job_error_message(error: BaseException) -> str:
+    """The message a failed job reports, matching the HTTP errors of /api/process/csv"""
+    if isinstance(error, UnicodeDecodeError):
+        return f"Could not decode the file as {error.encoding}. Send the encoding form field to override detection."
+    if isinstance(error, DECOMPRESSION_ERRORS):
+        return f"Could not decompress the upload: {error}"
+    if isinstance(error, ValueError):
+        return str(error)
+    return f"Error processing CSV: {str(error)}"
+
+
+def iso_time(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat() if timestamp else None
+
+
+@dataclass
+class Job:
+    """A background job; its files live in a directory of its own"""
+    
+    id: str
+    directory: str
+    operation: str
+    response_format: str
+    size: int
+    created_at: float
+    status: str = "queued"
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    bytes_read: int = 0
+    rows: int = 0
+    error: Optional[str] = None
+    removed: bool = False
+    future: Any = field(default=None, repr=False)
+    lock: Any = field(default_factory=threading.Lock, repr=False)
+    
+    @property
+    def result_path(self) -> str:
+        return os.path.join(self.directory, JOB_RESULT_FILE)
+    
+    def record_progress(self, progress: Optional[Dict[str, Any]]) -> None:
+        """Apply a progress report (see read_job_progress); the caller holds the lock"""
+        if progress is not None and self.finished_at is None:
+            self.status = "running"
+            self.started_at = progress["started_at"]
+            self.bytes_read = progress["bytes_read"]
+            self.rows = progress["rows"]
+    
+    def refresh(self) -> None:
+        """
+        Pick up the progress a running worker has written. Under the lock,
+        so a report read just before the job finished cannot turn its final
+        status back into "running".
+        """
+        if self.status not in JOB_ACTIVE:
+            return
+        progress = read_job_progress(self.directory)
+        with self.lock:
+            self.record_progress(progress)
+    
+    def info(self, retention_seconds: int) -> Dict[str, Any]:
+        self.refresh()
+        percent = 100.0 if self.status == "succeeded" else min(99.9, 100.0 * self.bytes_read / self.size) if self.size else 0.0
+        info = {
+            "id": self.id,
+            "status": self.status,
+            "operation": self.operation,
+            "format": self.response_format,
+            "size_bytes": self.size,
+            "bytes_read": self.bytes_read,
+            "rows_processed": self.rows,
+            "percent": round(percent, 1),
+            "created_at": iso_time(self.created_at),
+            "started_at": iso_time(self.started_at),
+            "finished_at": iso_time(self.finished_at),
+            "error": self.error,
+            "result_url": None,
+            "expires_in": None
+        }
+        if self.status == "succeeded":
+            info["result_url"] = f"/api/jobs/{self.id}/result"
+            info["result_bytes"] = os.path.getsize(self.result_path)
+        if self.finished_at is not None:
+            info["expires_in"] = max(0, int(self.finished_at + retention_seconds - time.time()))
+        return info
+
+
+class JobManager:
+    """
+    Background jobs for uploads that take too long to process within one
+    request. The upload is spooled into a directory per job under a
+    private root, and at most `workers` jobs run at once, on worker
+    processes when use_processes is set (threads otherwise); beyond
+    max_queued waiting jobs new ones are refused. Finished jobs and their
+    files are removed retention_seconds after they finish.
+    """
+    
+    def __init__(self, workers: int, max_queued: int, retention_seconds: int, use_processes: bool):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.retention_seconds = retention_seconds
+        self.use_processes = use_processes
+        self._jobs = OrderedDict()
+        self._root = None
+        self._pool_instance = None
+        self._lock = threading.Lock()
+    
+    def _pool(self) -> Executor:
+        with self._lock:
+            if self._pool_instance is None:
+                if self.use_processes:
+                    self._pool_instance = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+                else:
+                    self._pool_instance = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="csv-job")
+            return self._pool_instance
+    
+    def _job_directory(self) -> str:
+        with self._lock:
+            if self._root is None:
+                self._root = tempfile.mkdtemp(prefix="csv-jobs-", dir=SPILL_DIR or None)
+            return tempfile.mkdtemp(prefix="job-", dir=self._root)
+    
+    def _purge_expired(self, now: float) -> None:
+        with self._lock:
+            expired = [
+                job for job in self._jobs.values()
+                if job.finished_at is not None and now - job.finished_at > self.retention_seconds
+            ]
+            for job in expired:
+                del self._jobs[job.id]
+        for job in expired:
+            shutil.rmtree(job.directory, ignore_errors=True)
+    
+    def create(self, upload: BinaryIO, params: OperationParams, response_format: str) -> Job:
+        """Spool an upload into a new job directory and queue the job. Blocks while copying."""
+        self._purge_expired(time.time())
+        with self._lock:
+            active = sum(job.status in JOB_ACTIVE for job in self._jobs.values())
+            if active >= self.workers + self.max_queued:
+                raise ExecutorSaturatedError(f"{active} jobs are already queued or running")
+        
+        directory = self._job_directory()
+        try:
+            with open(os.path.join(directory, JOB_UPLOAD_FILE), "wb") as target:
+                shutil.copyfileobj(upload, target, 1024 * 1024)
+                size = target.tell()
+        except BaseException:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        
+        job = Job(uuid.uuid4().hex, directory, params.operation, response_format, size, time.time())
+        job.future = self._pool().submit(run_job, directory, params, response_format)
+        with self._lock:
+            self._jobs[job.id] = job
+        job.future.add_done_callback(functools.partial(self._finish, job))
+        return job
+    
+    def _finish(self, job: Job, future) -> None:
+        progress = read_job_progress(job.directory)
+        with self._lock, job.lock:
+            job.record_progress(progress)
+            job.finished_at = time.time()
+            if future.cancelled():
+                job.status = "cancelled"
+            elif isinstance(future.exception(), JobCancelledError):
+                job.status = "cancelled"
+            elif future.exception() is not None:
+                job.status = "failed"
+                job.error = job_error_message(future.exception())
+            else:
+                job.status = "succeeded"
+                job.bytes_read = future.result()["bytes_read"]
+                job.rows = future.result()["rows"]
+            removed = job.removed
+        # The upload is not needed once the job has ended
+        upload = os.path.join(job.directory, JOB_UPLOAD_FILE)
+        if removed:
+            shutil.rmtree(job.directory, ignore_errors=True)
+        elif os.path.exists(upload):
+            os.unlink(upload)
+    
+    def get(self, job_id: str) -> Optional[Job]:
+        self._purge_expired(time.time())
+        with self._lock:
+            return self._jobs.get(job_id)
+    
+    def jobs(self) -> List[Job]:
+        self._purge_expired(time.time())
+        with self._lock:
+            return list(self._jobs.values())
+    
+    def cancel(self, job: Job) -> None:
+        """Cancel a queued job, or ask a running one to stop at its next progress report"""
+        if job.status not in JOB_ACTIVE:
+            return
+        if not job.future.cancel():
+            open(os.path.join(job.directory, JOB_CANCEL_FILE), "w").close()
+    
+    def delete(self, job_id: str) -> bool:
+        """Forget a job and remove its files, cancelling it first if it has not finished"""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            if job is None:
+                return False
+            job.removed = True
+            finished = job.finished_at is not None
+        if finished:
+            shutil.rmtree(job.directory, ignore_errors=True)
+        else:
+            # The done callback removes the files once the worker has let go of them
+            self.cancel(job)
+        return True
+    
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, root = self._pool_instance, self._root
+            self._pool_instance = self._root = None
+            self._jobs.clear()
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        if root is not None:
+            shutil.rmtree(root, ignore_errors=True)
+    
+    def metrics(self) -> Dict[str, int]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.refresh()
+        return dict(Counter(job.status for job in jobs))
+
+
+JOBS = JobManager(JOB_WORKERS, JOB_MAX_QUEUED, JOB_RETENTION_SECONDS, EXECUTOR.processes > 0)
+
+
+def iter_csv_bytes(columns: List[str], records: Iterable[List[str]], chunk_bytes: int = CSV_WRITE_CHUNK_BYTES) -> Iterator[bytes]:
+    """Write CSV incrementally into a small reusable buffer, yielding encoded chunks"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    records = iter(records)
+    while True:
+        batch = list(itertools.islice(records, 1024))
+        if not batch:
+            break
+        with stage("serialize"):
+            writer.writerows(batch)
+        if buffer.tell() >= chunk_bytes:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def download_filename() -> str:
+    return f"processed_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = DOWNLOAD_GZIP_LEVEL) -> Iterator[bytes]:
+    """Gzip-compress a stream of byte chunks incrementally"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Check an Accept-Encoding header for gzip (or *) with a non-zero quality"""
+    if not DOWNLOAD_GZIP:
+        return False
+    for item in (accept_encoding or "").split(","):
+        coding, _, quality = item.partition(";")
+        if coding.strip().lower() not in ("gzip", "*"):
+            continue
+        quality = quality.strip().lower()
+        try:
+            return not quality.startswith("q=") or float(quality[2:]) > 0
+        except ValueError:
+            return False
+    return False
+
+
+def csv_download(columns: List[str], records: Iterable[list], accept_encoding: Optional[str] = None) -> StreamingResponse:
+    """Stream records as a CSV attachment, gzip-encoded when the client accepts it"""
+    body = iter_csv_bytes(columns, records)
+    headers = {"Content-Disposition": f"attachment; filename={download_filename()}", "Vary": "Accept-Encoding"}
+    if accepts_gzip(accept_encoding):
+        body = gzip_chunks(body)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body, media_type="text/csv", headers=headers)
+
+
+def operation_form(
+    operation: str = Form("view"),
+    filter_column: Optional[str] = Form(None),
+    filter_value: Optional[str] = Form(None),
+    transform_column: Optional[str] = Form(None),
+    transform_operation: Optional[str] = Form(None),
+    engine: Optional[str] = Form(None),
+    group_by: Optional[str] = Form(None),
+    value_columns: Optional[str] = Form(None),
+    aggregations: Optional[str] = Form(None),
+    sort_columns: Optional[str] = Form(None),
+    sort_type: str = Form("string"),
+    descending: bool = Form(False),
+    filter_expression: Optional[str] = Form(None),
+    pipeline: Optional[str] = Form(None),
+    columns: Optional[str] = Form(None),
+    offset: int = Form(0),
+    limit: Optional[int] = Form(None),
+    top_n: Optional[int] = Form(None),
+    shape: str = Form("rows"),
+    encoding: str = Form("auto"),
+    delimiter: str = Form("auto"),
+    approximate: bool = Form(False),
+    top_k: Optional[int] = Form(None),
+    approx_error: Optional[float] = Form(None)
+) -> OperationParams:
+    """Collect the operation form fields shared by the processing endpoints"""
+    set_request_operation(operation if not pipeline else "pipeline")
+    steps = []
+    if pipeline:
+        try:
+            steps = parse_pipeline(pipeline, engine)
+        except (TypeError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return OperationParams(
+        operation="pipeline" if steps else operation,
+        filter_column=filter_column,
+        filter_value=filter_value,
+        transform_column=transform_column,
+        transform_operation=transform_operation,
+        engine=engine,
+        group_by=split_list(group_by),
+        value_columns=split_list(value_columns),
+        aggregations=split_list(aggregations),
+        sort_columns=split_list(sort_columns),
+        sort_type=sort_type,
+        descending=descending,
+        filter_expression=filter_expression,
+        columns=split_list(columns),
+        pipeline=steps,
+        offset=offset,
+        limit=limit,
+        top_n=top_n,
+        shape=shape,
+        encoding=encoding,
+        delimiter=delimiter,
+        approximate=approximate,
+        top_k=top_k,
+        approx_error=approx_error
+    )
+
+
+@app.post("/api/process/csv")
+async def process_csv(
+    file: UploadFile = File(...),
+    params: OperationParams = Depends(operation_form),
+    response_format: Optional[str] = Form(None, alias="format"),
+    accept: Optional[str] = Header(None)
+):
+    """
+    Process CSV files with various operations:
+    - view: View all rows
+    - filter: Filter rows based on column value
+    - transform: Transform column values
+    - aggregate: Aggregate data by column
+    - sort: Sort by column
+    
+    filter keeps the rows where filter_column equals filter_value, or the
+    rows matching filter_expression, a JSON tree of and/or/not over
+    conditions such as {"column": "age", "op": ">=", "value": 18}
+    (ops: =, !=, <, <=, >, >=, between, in, prefix, regex). Rows that cannot
+    match are skipped before they are parsed where possible.
+    
+    aggregate counts the values of filter_column. With group_by and/or
+    value_columns (comma-separated) it instead computes the aggregations
+    (count, sum, mean, min, max, stddev, pNN percentiles) of each numeric
+    value column per group in one streaming pass. approximate=true counts
+    filter_column in fixed memory instead: a HyperLogLog distinct count and
+    the top_k most frequent values, within approx_error.
+    
+    pipeline runs a JSON list of steps over one parse, columns selects the
+    returned columns, and offset/limit return a window of the rows with
+    count still giving the size of the whole result. top_n sorts with a
+    bounded heap and returns only the first top_n rows.
+    
+    The upload is read in chunks and decoded incrementally into a record
+    stream. Filter and aggregate consume the stream directly, the other
+    operations buffer it into a columnar CSVTable; rows are only turned
+    back into dicts when the response is built.
+    
+    Send format=ndjson (or Accept: application/x-ndjson) to stream the
+    result as newline-delimited JSON instead of one JSON document.
+    
+    JSON results are cached by the SHA-256 of the upload and the operation
+    parameters; the X-Cache header reports HIT or MISS.
+    
+    engine selects the filter/aggregate/sort kernels (auto, python, numpy,
+    arrow); it defaults to the CSV_ENGINE setting.
+    
+    Processing runs on a worker thread, or a worker process for uploads of
+    at least PROCESS_POOL_MIN_BYTES. When WORKER_MAX_PENDING jobs are already
+    in flight the request gets a 503 with a Retry-After header.
+    """
+    try:
+        validate_operation(params)
+        
+        if wants_ndjson(response_format, accept):
+            upload = detach_upload(file)
+            try:
+                body, csv_format = await EXECUTOR.run(open_ndjson_body, upload, params)
+            except BaseException:
+                upload.close()
+                raise
+            return StreamingResponse(
+                staged_iter("process", body),
+                media_type=NDJSON_MEDIA_TYPE,
+                headers=format_headers(csv_format),
+                background=BackgroundTask(upload.close)
+            )
+        
+        cache_key = None
+        if RESULT_CACHE.enabled:
+            cache_key = result_cache_key(await run_in_threadpool(hash_upload, file.file), params)
+            body, tier = RESULT_CACHE.get(cache_key)
+            if body is not None:
+                return Response(content=body, media_type="application/json", headers={"X-Cache": "HIT", "X-Cache-Tier": tier})
+        
+        # Parse, process and serialize on a worker so the event loop stays responsive
+        body = await execute_upload(file, params)
+        response = Response(content=body, media_type="application/json")
+        if cache_key is not None:
+            RESULT_CACHE.put(cache_key, body)
+            response.headers["X-Cache"] = "MISS"
+        return response
+    
+    except HTTPException:
+        raise
+    except ExecutorSaturatedError as e:
+        raise saturated_response(e)
+    except UnicodeDecodeError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Could not decode the file as {e.encoding}. Send the encoding form field to override detection."
+        )
+    except DECOMPRESSION_ERRORS as e:
+        raise HTTPException(status_code=400, detail=f"Could not decompress the upload: {e}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing CSV: {str(e)}")
+
+
+@app.get("/api/cache/metrics")
+async def cache_metrics():
+    """Result cache hit/miss counters and sizes"""
+    return RESULT_CACHE.metrics()
+
+
+@app.get("/api/workers/metrics")
+async def worker_metrics():
+    """In-flight jobs and rejections of the processing executor"""
+    return EXECUTOR.metrics()
+
+
+def get_dataset_or_404(dataset_id: str) -> Dataset:
+    dataset = DATASETS.get(dataset_id)
+    if dataset is None:
+        raise HTTPException(status_code=404, detail="Dataset not found or expired. Upload the file again.")
+    return dataset
+
+
+@app.post("/api/datasets")
+async def create_dataset(
+    file: UploadFile = File(...),
+    encoding: str = Form("auto"),
+    delimiter: str = Form("auto")
+):
+    """
+    Upload and parse a CSV once. The returned id can be used with
+    /api/datasets/{id}/process and /api/datasets/{id}/download until the
+    dataset is idle for DATASET_TTL_SECONDS or evicted to stay within
+    DATASET_MAX_BYTES.
+    """
+    try:
+        # The table must live in this process, so parsing stays on a thread
+        dataset = await EXECUTOR.run(load_dataset, file.file, encoding, delimiter)
+        return JSONResponse(content=dataset.info(DATASETS.ttl_seconds), status_code=201)
+    
+    except HTTPException:
+        raise
+    except ExecutorSaturatedError as e:
+        raise saturated_response(e)
+    except DatasetTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UnicodeDecodeError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Could not decode the file as {e.encoding}. Send the encoding form field to override detection."
+        )
+    except DECOMPRESSION_ERRORS as e:
+        raise HTTPException(status_code=400, detail=f"Could not decompress the upload: {e}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing CSV: {str(e)}")
+
+
+@app.get("/api/datasets/{dataset_id}")
+async def get_dataset(dataset_id: str):
+    """Dataset columns, row count and remaining lifetime"""
+    return get_dataset_or_404(dataset_id).info(DATASETS.ttl_seconds)
+
+
+@app.delete("/api/datasets/{dataset_id}", status_code=204)
+async def delete_dataset(dataset_id: str):
+    if not DATASETS.delete(dataset_id):
+        raise HTTPException(status_code=404, detail="Dataset not found or expired. Upload the file again.")
+    return Response(status_code=204)
+
+
+@app.post("/api/datasets/{dataset_id}/process")
+async def process_dataset(
+    dataset_id: str,
+    params: OperationParams = Depends(operation_form),
+    response_format: Optional[str] = Form(None, alias="format"),
+    accept: Optional[str] = Header(None)
+):
+    """
+    Run an operation on a stored dataset, with the same form fields and
+    result shape as /api/process/csv. Row results are stored as a new
+    dataset whose id is returned as dataset_id, so they can be downloaded
+    or processed further without another upload.
+    """
+    try:
+        validate_operation(params)
+        dataset = get_dataset_or_404(dataset_id)
+        result, result_id = await EXECUTOR.run(run_dataset_operation, dataset, params)
+        
+        if wants_ndjson(response_format, accept):
+            if not isinstance(result, CSVTable):
+                body = encode_json(result) + b"\n"
+                return Response(content=body, media_type=NDJSON_MEDIA_TYPE)
+            rows, total = shaped_rows(result, params.shape), None
+            if params.paged:
+                start, stop = params.row_window
+                rows, total = shaped_rows(result.slice(start, stop), params.shape), dataset_result_total(dataset, result, params)
+            return StreamingResponse(
+                staged_iter("serialize", iter_ndjson(result.columns, rows, total=total)),
+                media_type=NDJSON_MEDIA_TYPE,
+                headers={"X-Dataset-Id": result_id or ""}
+            )
+        total = dataset_result_total(dataset, result, params) if isinstance(result, CSVTable) else 0
+        body = await EXECUTOR.run(encode_dataset_result, result, result_id, params, total)
+        return Response(content=body, media_type="application/json")
+    
+    except HTTPException:
+        raise
+    except ExecutorSaturatedError as e:
+        raise saturated_response(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing CSV: {str(e)}")
+
+
+@app.get("/api/datasets/{dataset_id}/download")
+async def download_dataset(
+    dataset_id: str,
+    columns: Optional[str] = Query(None),
+    accept_encoding: Optional[str] = Header(None)
+):
+    """Stream a stored dataset (or a stored result) as a CSV attachment, optionally only some columns"""
+    table = get_dataset_or_404(dataset_id).table
+    try:
+        table = project_table(table, split_list(columns))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return csv_download(table.columns, zip(*table.data), accept_encoding)
+
+
+def join_input(upload: Optional[BinaryIO], dataset: Optional[Dataset], side: str, params: OperationParams):
+    """One side of a join: a stored dataset's table, or a record stream over an upload"""
+    if dataset is not None:
+        return dataset.table
+    stream, _ = open_csv_upload(upload, params.encoding, params.delimiter)
+    if not stream.columns:
+        raise ValueError(f"The {side} CSV file is empty")
+    return stream
+
+
+def open_join(
+    left_source: tuple,
+    right_source: tuple,
+    left_on: List[str],
+    right_on: List[str],
+    how: str,
+    build_side: str,
+    params: OperationParams
+) -> CSVStream:
+    """Open both join inputs (each an (upload, dataset) pair) and build the join; the probe side is still unread"""
+    left = join_input(*left_source, "left", params)
+    right = join_input(*right_source, "right", params)
+    return hash_join(left, right, left_on, right_on, how, build_side)
+
+
+def run_join(
+    left_source: tuple,
+    right_source: tuple,
+    left_on: List[str],
+    right_on: List[str],
+    how: str,
+    build_side: str,
+    params: OperationParams
+) -> bytes:
+    """Join two inputs, run the operation over the joined rows and return the serialized JSON result"""
+    stream = open_join(left_source, right_source, left_on, right_on, how, build_side, params)
+    result = run_operation(stream, params)
+    result["join"] = {"how": how, "build_side": build_side}
+    with stage("serialize"):
+        return encode_json(result)
+
+
+def open_join_body(
+    left_source: tuple,
+    right_source: tuple,
+    left_on: List[str],
+    right_on: List[str],
+    how: str,
+    build_side: str,
+    params: OperationParams
+) -> Iterator[bytes]:
+    """Build the join and prepare its NDJSON body, which probes as it is sent"""
+    return ndjson_body(open_join(left_source, right_source, left_on, right_on, how, build_side, params), params)
+
+
+def close_uploads(*uploads: Optional[BinaryIO]) -> None:
+    for upload in uploads:
+        if upload is not None:
+            upload.close()
+
+
+@app.post("/api/join")
+async def join_csv(
+    left: Optional[UploadFile] = File(None),
+    right: Optional[UploadFile] = File(None),
+    left_dataset: Optional[str] = Form(None),
+    right_dataset: Optional[str] = Form(None),
+    on: Optional[str] = Form(None),
+    left_on: Optional[str] = Form(None),
+    right_on: Optional[str] = Form(None),
+    how: str = Form("inner"),
+    params: OperationParams = Depends(operation_form),
+    response_format: Optional[str] = Form(None, alias="format"),
+    accept: Optional[str] = Header(None)
+):
+    """
+    Join two CSVs on key columns and run an operation over the joined rows.
+    Each side is an uploaded file (left, right) or a stored dataset
+    (left_dataset, right_dataset). on names key columns present on both
+    sides, or left_on/right_on name them per side (comma-separated, matched
+    case-insensitively); how is inner or left.
+    
+    The smaller side is built into a hash table and the larger one is
+    streamed through it. A streamed build side larger than
+    JOIN_MEMORY_BUDGET is joined in JOIN_SPILL_PARTITIONS hash partitions
+    through spill files instead. The joined header is every left column
+    followed by the right columns except the keys.
+    
+    The operation form fields of /api/process/csv apply to the joined rows
+    (view by default), as do columns, offset/limit, shape and format=ndjson.
+    """
+    set_request_operation("join")
+    validate_operation(params)
+    if how not in JOIN_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown join type '{how}'. Use one of: {', '.join(JOIN_TYPES)}")
+    left_keys, right_keys = split_list(left_on) or split_list(on), split_list(right_on) or split_list(on)
+    if not left_keys or not right_keys:
+        raise HTTPException(status_code=400, detail="on (or left_on and right_on) required for a join")
+    if len(left_keys) != len(right_keys):
+        raise HTTPException(status_code=400, detail="left_on and right_on must name the same number of columns")
+    
+    sources, sizes = [], []
+    for side, file, dataset_id in (("left", left, left_dataset), ("right", right, right_dataset)):
+        if (file is None) == (dataset_id is None):
+            raise HTTPException(status_code=400, detail=f"Send either a {side} file or a {side}_dataset id")
+        dataset = get_dataset_or_404(dataset_id) if dataset_id is not None else None
+        sources.append((file.file if file is not None else None, dataset))
+        sizes.append(dataset.size if dataset is not None else file.size or 0)
+    # The smaller input is held in memory, the larger one only streams past it
+    build_side = "left" if sizes[0] < sizes[1] else "right"
+    
+    try:
+        if wants_ndjson(response_format, accept):
+            uploads = [detach_upload(file) if file is not None else None for file in (left, right)]
+            sources = [(upload, dataset) for upload, (_, dataset) in zip(uploads, sources)]
+            try:
+                body = await EXECUTOR.run(open_join_body, *sources, left_keys, right_keys, how, build_side, params)
+            except BaseException:
+                close_uploads(*uploads)
+                raise
+            return StreamingResponse(
+                staged_iter("process", body),
+                media_type=NDJSON_MEDIA_TYPE,
+                headers={"X-Join-Build-Side": build_side},
+                background=BackgroundTask(close_uploads, *uploads)
+            )
+        body = await EXECUTOR.run(run_join, *sources, left_keys, right_keys, how, build_side, params)
+        return Response(content=body, media_type="application/json")
+    
+    except HTTPException:
+        raise
+    except ExecutorSaturatedError as e:
+        raise saturated_response(e)
+    except UnicodeDecodeError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Could not decode the file as {e.encoding}. Send the encoding form field to override detection."
+        )
+    except DECOMPRESSION_ERRORS as e:
+        raise HTTPException(status_code=400, detail=f"Could not decompress the upload: {e}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing CSV: {str(e)}")
+
+
+def get_aggregation_or_404(name: str) -> AggregationState:
+    state = AGGREGATIONS.get(name)
+    if state is None:
+        raise HTTPException(status_code=404, detail=f"Aggregation state '{name}' not found")
+    return state
+
+
+@app.get("/api/aggregations")
+async def list_aggregations():
+    """Every named aggregation state, without its groups"""
+    return {"aggregations": [state.info() for state in AGGREGATIONS.states()]}
+
+
+@app.put("/api/aggregations/{name}", status_code=201)
+async def create_aggregation(
+    name: str,
+    filter_column: Optional[str] = Form(None),
+    group_by: Optional[str] = Form(None),
+    value_columns: Optional[str] = Form(None),
+    aggregations: Optional[str] = Form(None),
+    engine: Optional[str] = Form(None)
+):
+    """
+    Start an empty incremental aggregation named name, with the aggregate
+    form fields of /api/process/csv (filter_column, or group_by,
+    value_columns and aggregations). An existing state of that name is
+    replaced. Chunks are then added with POST /api/aggregations/{name}/chunks.
+    """
+    if not AGGREGATION_NAME.fullmatch(name):
+        raise HTTPException(status_code=400, detail="Aggregation names are 1-64 letters, digits, '_', '-' or '.'")
+    set_request_operation("aggregate")
+    params = OperationParams(
+        operation="aggregate",
+        filter_column=filter_column,
+        group_by=split_list(group_by),
+        value_columns=split_list(value_columns),
+        aggregations=split_list(aggregations),
+        engine=engine
+    )
+    validate_operation(params)
+    try:
+        state = await run_in_threadpool(AGGREGATIONS.create, name, params)
+    except AggregationLimitError as e:
+        raise HTTPException(status_code=409, detail=f"{e}. Delete one first.")
+    return JSONResponse(content=state.info(), status_code=201)
+
+
+@app.post("/api/aggregations/{name}/chunks")
+async def append_aggregation_chunk(
+    name: str,
+    file: UploadFile = File(...),
+    encoding: str = Form("auto"),
+    delimiter: str = Form("auto")
+):
+    """
+    Add the rows of one appended chunk (a CSV with its own header line) to
+    an aggregation state. Only the chunk is parsed; its partial aggregate
+    is merged into the state, which is then snapshotted when
+    AGGREGATION_STATE_DIR is set. Returns the state's info and the rows of
+    the chunk; GET /api/aggregations/{name} returns the aggregate.
+    """
+    set_request_operation("aggregate")
+    state = get_aggregation_or_404(name)
+    params = replace(state.params, encoding=encoding, delimiter=delimiter)
+    try:
+        size = file.size or 0
+        if EXECUTOR.uses_process(size):
+            path = await run_in_threadpool(spool_upload, file.file)
+            try:
+                partial = await EXECUTOR.run(aggregate_chunk_file, path, params, size=size)
+            finally:
+                os.unlink(path)
+        else:
+            partial = await EXECUTOR.run(aggregate_chunk, file.file, params)
+        rows = await run_in_threadpool(AGGREGATIONS.append, state, partial)
+    
+    except ExecutorSaturatedError as e:
+        raise saturated_response(e)
+    except UnicodeDecodeError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Could not decode the file as {e.encoding}. Send the encoding form field to override detection."
+        )
+    except DECOMPRESSION_ERRORS as e:
+        raise HTTPException(status_code=400, detail=f"Could not decompress the upload: {e}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing CSV: {str(e)}")
+    
+    if rows is None:
+        raise HTTPException(status_code=409, detail=f"Aggregation state '{name}' was replaced or deleted during the append")
+    return dict(state.info(), chunk_rows=rows)
+
+
+@app.get("/api/aggregations/{name}")
+async def get_aggregation(name: str):
+    """The aggregate of every chunk appended so far, with the state info in its state field"""
+    state = get_aggregation_or_404(name)
+    body = await run_in_threadpool(encode_aggregation, state)
+    return Response(content=body, media_type="application/json")
+
+
+@app.delete("/api/aggregations/{name}", status_code=204)
+async def delete_aggregation(name: str):
+    if not await run_in_threadpool(AGGREGATIONS.delete, name):
+        raise HTTPException(status_code=404, detail=f"Aggregation state '{name}' not found")
+    return Response(status_code=204)
+
+
+def get_job_or_404(job_id: str) -> Job:
+    job = JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+
+@app.post("/api/jobs", status_code=202)
+async def create_job(
+    file: UploadFile = File(...),
+    params: OperationParams = Depends(operation_form),
+    response_format: str = Form("json", alias="format")
+):
+    """
+    Accept an upload for background processing and return at once. The
+    form fields are those of /api/process/csv; format selects a JSON or
+    NDJSON result. Poll GET /api/jobs/{id} for the status and progress
+    (bytes read, rows parsed, percent) and fetch the result from
+    GET /api/jobs/{id}/result once the status is succeeded. At most
+    JOB_WORKERS jobs run at once and JOB_MAX_QUEUED wait; results are kept
+    for JOB_RETENTION_SECONDS after the job finishes.
+    """
+    if response_format not in JOB_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format '{response_format}'. Use one of: {', '.join(JOB_FORMATS)}")
+    try:
+        validate_operation(params)
+        job = await run_in_threadpool(JOBS.create, file.file, params, response_format)
+    except HTTPException:
+        raise
+    except ExecutorSaturatedError as e:
+        raise saturated_response(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(
+        content=job.info(JOBS.retention_seconds),
+        status_code=202,
+        headers={"Location": f"/api/jobs/{job.id}"}
+    )
+
+
+@app.get("/api/jobs")
+async def list_jobs():
+    """Every job that has not expired, oldest first"""
+    return {"jobs": [job.info(JOBS.retention_seconds) for job in JOBS.jobs()]}
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status and progress of a job"""
+    return get_job_or_404(job_id).info(JOBS.retention_seconds)
+
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancel a queued job, or stop a running one at its next progress report"""
+    job = get_job_or_404(job_id)
+    JOBS.cancel(job)
+    return job.info(JOBS.retention_seconds)
+
+
+@app.delete("/api/jobs/{job_id}", status_code=204)
+async def delete_job(job_id: str):
+    """Cancel a job if needed and remove it with its files"""
+    if not JOBS.delete(job_id):
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return Response(status_code=204)
+
+
+@app.get("/api/jobs/{job_id}/result")
+async def download_job_result(job_id: str):
+    """Stream the result file of a finished job"""
+    job = get_job_or_404(job_id)
+    job.refresh()
+    if job.status != "succeeded":
+        detail = f"Job {job.status}: {job.error}" if job.error else f"Job is {job.status}, the result is not available"
+        raise HTTPException(status_code=409, detail=detail)
+    return FileResponse(job.result_path, media_type=JOB_FORMATS[job.response_format])
+
+
+@app.post("/api/download/csv")
+async def download_csv(data: dict, accept_encoding: Optional[str] = Header(None)):
+    """
+    Download processed CSV data. The CSV is written row by row into the
+    response (gzip-encoded when the client accepts it), never to disk.
+    An optional "columns" list sets the columns and their order (keys
+    outside it are left out); otherwise the header is every key of any
+    row, in the order they first appear, and missing cells are empty.
+    """
+    if "rows" not in data:
+        raise HTTPException(status_code=400, detail="No rows data to convert to CSV. Missing 'rows' key.")
+    rows = data["rows"]
+    if not rows or len(rows) == 0:
+        raise HTTPException(status_code=400, detail="No rows data to convert to CSV. Empty rows array.")
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise HTTPException(status_code=400, detail="Invalid data format. 'rows' must be a list of objects.")
+    
+    # Validated up front: once streaming starts the status code is already sent
+    columns = list(data.get("columns") or dict.fromkeys(itertools.chain.from_iterable(rows)))
+    records = ([row.get(column, "") for column in columns] for row in rows)
+    return csv_download(columns, records, accept_encoding)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,13 @@
 const API_URL = window.location.origin;
 
 let currentData = null;
+// Rows per page; the server returns one window of the result and its total count
+const PAGE_SIZE = 100;
+let lastRequest = null;
+// Server-side dataset for the selected file, so it is uploaded only once (null when it is too large to store)
+let datasetId = null;
+let datasetFile = null;
+let datasetFormat = null;
 
 // File upload area interactions
 const uploadArea = document.getElementById('upload-area');
@@ -21,7 +28,7 @@ uploadArea.addEventListener('drop', (e) => {
     e.preventDefault();
     uploadArea.classList.remove('dragover');
     const files = e.dataTransfer.files;
-    if (files.length > 0 && files[0].name.endsWith('.csv')) {
+    if (files.length > 0 && /\.(csv|csv\.gz|csv\.zst|zip)$/i.test(files[0].name)) {
         fileInput.files = files;
         updateFileName(files[0].name);
     }
@@ -41,6 +48,10 @@ function updateFileName(name) {
 
 // Detect column names from CSV file
 async function detectColumns(file) {
+    if (!/\.csv$/i.test(file.name)) {
+        // Compressed uploads are only decoded on the server
+        return;
+    }
     try {
         const text = await file.text();
         const lines = text.split('\n');
@@ -98,6 +109,76 @@ document.getElementById('csv-operation').addEventListener('change', (e) => {
     }
 });
 
+async function errorDetail(response, fallback) {
+    try {
+        const error = await response.json();
+        return error.detail || fallback;
+    } catch (e) {
+        return `HTTP ${response.status}: ${response.statusText}`;
+    }
+}
+
+async function ensureDataset(file) {
+    if (datasetFile === file) {
+        return datasetId;
+    }
+    const formData = new FormData();
+    formData.append('file', file);
+    const response = await fetch(`${API_URL}/api/datasets`, {
+        method: 'POST',
+        body: formData,
+        mode: 'cors',
+        credentials: 'same-origin'
+    });
+    if (response.status === 413) {
+        // Too large to keep on the server; requests upload the file to /api/process/csv instead
+        datasetId = null;
+        datasetFormat = null;
+        datasetFile = file;
+        return null;
+    }
+    if (!response.ok) {
+        throw new Error(await errorDetail(response, 'Upload failed'));
+    }
+    const dataset = await response.json();
+    datasetId = dataset.id;
+    datasetFormat = dataset.csv_format;
+    datasetFile = file;
+    return datasetId;
+}
+
+async function processDataset(file, formData) {
+    const send = async () => {
+        const id = await ensureDataset(file);
+        if (id) {
+            return fetch(`${API_URL}/api/datasets/${id}/process`, {
+                method: 'POST',
+                body: formData,
+                mode: 'cors',
+                credentials: 'same-origin'
+            });
+        }
+        // Not stored: send the file with the request, paging reruns it with another offset
+        const uploadData = new FormData();
+        formData.forEach((value, key) => uploadData.append(key, value));
+        uploadData.append('file', file);
+        return fetch(`${API_URL}/api/process/csv`, {
+            method: 'POST',
+            body: uploadData,
+            mode: 'cors',
+            credentials: 'same-origin'
+        });
+    };
+    let response = await send();
+    if (response.status === 404 && datasetId) {
+        // The dataset expired on the server, upload the file again
+        datasetId = null;
+        datasetFile = null;
+        response = await send();
+    }
+    return response;
+}
+
 async function processCSV() {
     const file = fileInput.files[0];
     
@@ -108,20 +189,23 @@ async function processCSV() {
     
     const operation = document.getElementById('csv-operation').value;
     const formData = new FormData();
-    formData.append('file', file);
     formData.append('operation', operation);
     
     // Add operation-specific parameters
     if (operation === 'filter') {
         const column = document.getElementById('filter-column').value.trim();
         const value = document.getElementById('filter-value').value.trim();
-        console.log('Filter - Column:', column, 'Value:', value);
-        if (!column || !value) {
-            alert('Please enter both column name and filter value');
+        const expression = document.getElementById('filter-expression').value.trim();
+        if (expression) {
+            // A compound expression replaces the column/value match
+            formData.append('filter_expression', expression);
+        } else if (!column || !value) {
+            alert('Please enter both column name and filter value, or an expression');
             return;
+        } else {
+            formData.append('filter_column', column);
+            formData.append('filter_value', value);
         }
-        formData.append('filter_column', column);
-        formData.append('filter_value', value);
     } else if (operation === 'transform') {
         const column = document.getElementById('transform-column').value.trim();
         const op = document.getElementById('transform-op').value;
@@ -133,21 +217,48 @@ async function processCSV() {
         formData.append('transform_operation', op);
     } else if (operation === 'aggregate') {
         const column = document.getElementById('aggregate-column').value.trim();
-        console.log('Aggregate - Column:', column);
+        const valueColumns = document.getElementById('aggregate-values').value.trim();
+        const functions = document.getElementById('aggregate-functions').value.trim();
         if (!column) {
             alert('Please enter column name');
             return;
         }
-        formData.append('filter_column', column);
+        if (valueColumns) {
+            // Comma-separated group keys and numeric columns
+            formData.append('group_by', column);
+            formData.append('value_columns', valueColumns);
+            if (functions) {
+                formData.append('aggregations', functions);
+            }
+        } else {
+            formData.append('filter_column', column);
+            if (document.getElementById('aggregate-approximate').checked) {
+                formData.append('approximate', 'true');
+            }
+        }
     } else if (operation === 'sort') {
         const column = document.getElementById('sort-column').value.trim();
         if (!column) {
             alert('Please enter column name');
             return;
         }
-        formData.append('filter_column', column);
+        // Comma-separated columns sort by several keys
+        formData.append('sort_columns', column);
+        formData.append('sort_type', document.getElementById('sort-type').value);
+        formData.append('descending', document.getElementById('sort-descending').checked);
     }
     
+    // Only the selected columns are parsed and returned
+    const columns = document.getElementById('result-columns').value.trim();
+    if (columns) {
+        formData.append('columns', columns);
+    }
+    if (operation !== 'aggregate') {
+        formData.append('limit', PAGE_SIZE);
+        formData.append('shape', 'columns');
+    }
+    lastRequest = { file, formData, operation };
+    
     const resultDiv = document.getElementById('result-section');
     resultDiv.innerHTML = '<div class="loading">Processing CSV file</div>';
     
@@ -155,25 +266,13 @@ async function processCSV() {
     processBtn.disabled = true;
     
     try {
-        const response = await fetch(`${API_URL}/api/process/csv`, {
-            method: 'POST',
-            body: formData,
-            mode: 'cors',
-            credentials: 'same-origin'
-        });
+        const response = await processDataset(file, formData);
         
         if (!response.ok) {
-            let errorMessage = 'Processing failed';
-            try {
-                const error = await response.json();
-                errorMessage = error.detail || errorMessage;
-            } catch (e) {
-                errorMessage = `HTTP ${response.status}: ${response.statusText}`;
-            }
-            throw new Error(errorMessage);
+            throw new Error(await errorDetail(response, 'Processing failed'));
         }
         
-        const data = await response.json();
+        const data = rowsFromColumns(await response.json());
         currentData = data;
         displayCSVResult(data, operation);
     } catch (error) {
@@ -191,7 +290,33 @@ function displayCSVResult(data, operation) {
     const resultDiv = document.getElementById('result-section');
     let html = '';
     
-    if (operation === 'aggregate') {
+    if (operation === 'aggregate' && data.groups) {
+        html = '<div class="success">✓ Aggregation completed successfully</div>';
+        html += '<h3>Aggregation Results</h3>';
+        html += `<p class="result-info"><strong>${data.group_count}</strong> groups from <strong>${data.total_rows}</strong> rows</p>`;
+        
+        const headers = [...data.group_by, 'rows'];
+        data.value_columns.forEach(column => {
+            data.functions.forEach(fn => headers.push(`${column} ${fn}`));
+        });
+        html += '<div class="result-table-container">';
+        html += '<table class="result-table"><thead><tr>';
+        headers.forEach(h => html += `<th>${escapeHTML(h)}</th>`);
+        html += '</tr></thead><tbody>';
+        data.groups.forEach(group => {
+            const cells = [...data.group_by.map(column => group.key[column]), group.count];
+            data.value_columns.forEach(column => {
+                data.functions.forEach(fn => {
+                    const value = group.values[column][fn];
+                    cells.push(typeof value === 'number' && !Number.isInteger(value) ? value.toFixed(4) : value);
+                });
+            });
+            html += '<tr>';
+            cells.forEach(cell => html += `<td>${escapeHTML(cell ?? '')}</td>`);
+            html += '</tr>';
+        });
+        html += '</tbody></table></div>';
+    } else if (operation === 'aggregate') {
         html = '<div class="success">✓ Aggregation completed successfully</div>';
         html += '<h3>Aggregation Results</h3>';
         html += '<div class="result-stats">';
@@ -205,19 +330,25 @@ function displayCSVResult(data, operation) {
         }
         html += '</div>';
         html += `<p class="result-info">Total rows processed: <strong>${data.total_rows}</strong></p>`;
+        if (data.approximate) {
+            html += `<p class="result-info">About <strong>${data.distinct}</strong> distinct values (±${(data.distinct_error * 100).toFixed(1)}%); `
+                + `top ${data.top.length} counts are at most ${data.count_error_bound} too high</p>`;
+        }
     } else if (data.rows && data.rows.length > 0) {
         html = '<div class="success">✓ Processing completed successfully</div>';
         html += `<h3>Results</h3>`;
-        html += `<p class="result-info">Showing <strong>${data.count}</strong> row${data.count !== 1 ? 's' : ''}</p>`;
         
-        // Create table with scrolling
+        const offset = data.offset || 0;
+        html += renderPager(offset, data.rows.length, data.count);
+        html += renderFormat(data.csv_format || datasetFormat);
+        
         const headers = data.columns || Object.keys(data.rows[0]);
         html += '<div class="result-table-container">';
         html += '<table class="result-table"><thead><tr>';
         headers.forEach(h => html += `<th>${h}</th>`);
         html += '</tr></thead><tbody>';
         
-        // Show all rows - scrolling will handle large datasets
+        // Only the current page is rendered
         data.rows.forEach(row => {
             html += '<tr>';
             headers.forEach(h => {
@@ -231,7 +362,7 @@ function displayCSVResult(data, operation) {
         
         html += '</tbody></table></div>';
         html += '<p class="result-info" style="margin-top: 12px; font-size: 13px; color: #86868B;">';
-        html += '💡 Scroll vertically and horizontally to view all data';
+        html += '💡 Scroll horizontally to view all columns; use the page buttons for more rows';
         html += '</p>';
         
         // Download button
@@ -250,26 +381,129 @@ function displayCSVResult(data, operation) {
     resultDiv.innerHTML = html;
 }
 
+// Column-oriented results send each key once; rebuild row objects for rendering
+function rowsFromColumns(data) {
+    if (data.data && !data.rows) {
+        data.rows = data.data.map(values => Object.fromEntries(data.columns.map((column, i) => [column, values[i]])));
+        delete data.data;
+    }
+    return data;
+}
+
+function renderFormat(format) {
+    if (!format) {
+        return '';
+    }
+    const delimiter = format.delimiter === '\t' ? 'tab' : format.delimiter;
+    return `<p class="result-info">Read as <strong>${format.encoding}</strong>, delimiter <strong>${delimiter}</strong></p>`;
+}
+
+function renderPager(offset, shown, count) {
+    const last = offset + shown;
+    let html = `<p class="result-info">Showing rows <strong>${offset + 1}–${last}</strong> of <strong>${count}</strong></p>`;
+    if (count > shown) {
+        html += '<div class="pager">';
+        html += `<button class="pager-button" onclick="loadPage(${Math.max(0, offset - PAGE_SIZE)})" ${offset === 0 ? 'disabled' : ''}>Previous</button>`;
+        html += `<button class="pager-button" onclick="loadPage(${last})" ${last >= count ? 'disabled' : ''}>Next</button>`;
+        html += '</div>';
+    }
+    return html;
+}
+
+async function loadPage(offset) {
+    if (!currentData || !lastRequest) {
+        return;
+    }
+    const resultDiv = document.getElementById('result-section');
+    try {
+        let response = null;
+        if (currentData.dataset_id) {
+            // Page through the stored result without running the operation again
+            const formData = new FormData();
+            formData.append('operation', 'view');
+            formData.append('offset', offset);
+            formData.append('limit', PAGE_SIZE);
+            formData.append('shape', 'columns');
+            response = await fetch(`${API_URL}/api/datasets/${currentData.dataset_id}/process`, {
+                method: 'POST',
+                body: formData,
+                mode: 'cors',
+                credentials: 'same-origin'
+            });
+        }
+        if (!response || response.status === 404) {
+            // The result was not stored (or expired), so run the request again for this page
+            const formData = new FormData();
+            lastRequest.formData.forEach((value, key) => formData.append(key, value));
+            formData.set('offset', offset);
+            response = await processDataset(lastRequest.file, formData);
+        }
+        if (!response.ok) {
+            throw new Error(await errorDetail(response, 'Loading page failed'));
+        }
+        currentData = rowsFromColumns(await response.json());
+        displayCSVResult(currentData, lastRequest.operation);
+    } catch (error) {
+        resultDiv.innerHTML = `<div class="error">Error: ${error.message}</div>`;
+    }
+}
+
+function escapeHTML(value) {
+    return String(value).replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+}
+
+function csvCell(value) {
+    const text = value === null || value === undefined ? '' : String(value);
+    return /[",\r\n]/.test(text) ? `"${text.replace(/"/g, '""')}"` : text;
+}
+
+// Run the last request again for the whole result (not just the shown page) as NDJSON and write it as CSV
+async function fetchFullResultCSV() {
+    const formData = new FormData();
+    lastRequest.formData.forEach((value, key) => {
+        if (key !== 'limit' && key !== 'offset') {
+            formData.append(key, value);
+        }
+    });
+    formData.set('format', 'ndjson');
+    formData.set('shape', 'columns');
+    const response = await processDataset(lastRequest.file, formData);
+    if (!response.ok) {
+        throw new Error(await errorDetail(response, 'Download failed'));
+    }
+    const lines = (await response.text()).split('\n').filter(line => line);
+    const csv = [JSON.parse(lines[0]).columns.map(csvCell).join(',')];
+    for (const line of lines.slice(1)) {
+        const item = JSON.parse(line);
+        if (item.error) {
+            throw new Error(item.error);
+        }
+        if (Array.isArray(item)) {
+            csv.push(item.map(csvCell).join(','));
+        }
+    }
+    return new Blob([csv.join('\r\n') + '\r\n'], { type: 'text/csv' });
+}
+
 async function downloadCSV() {
-    if (!currentData || !currentData.rows) {
+    if (!currentData || !currentData.rows || !lastRequest) {
         alert('No data to download');
         return;
     }
     
+    if (currentData.dataset_id) {
+        // The result is stored on the server and streamed back as CSV
+        const a = document.createElement('a');
+        a.href = `${API_URL}/api/datasets/${currentData.dataset_id}/download`;
+        document.body.appendChild(a);
+        a.click();
+        document.body.removeChild(a);
+        return;
+    }
+    
     try {
-        const response = await fetch(`${API_URL}/api/download/csv`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify(currentData)
-        });
-        
-        if (!response.ok) {
-            throw new Error('Download failed');
-        }
-        
-        const blob = await response.blob();
+        // currentData only holds the shown page, so the result is fetched again in full
+        const blob = await fetchFullResultCSV();
         const url = window.URL.createObjectURL(blob);
         const a = document.createElement('a');
         a.href = url;
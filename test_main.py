@@ -1,6 +1,18 @@
 import pytest
 import io
 import csv
+import codecs
+import gzip
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import zipfile
+from collections import Counter
+from typing import List
 from fastapi.testclient import TestClient
 from main import (
     app,
@@ -8,13 +20,41 @@ from main import (
     process_csv_transform,
     process_csv_aggregate,
     process_csv_sort,
-    process_csv_view
+    process_csv_view,
+    iter_text_lines,
+    iter_csv_rows,
+    read_csv_stream,
+    CSVTable,
+    ENGINES,
+    get_engine,
+    process_csv_group_aggregate,
+    process_csv_approximate_aggregate,
+    QuantileSketch,
+    NumericStats,
+    sort_stream,
+    ResultCache,
+    RESULT_CACHE,
+    DatasetStore,
+    DatasetTooLargeError,
+    DATASETS,
+    OperationExecutor,
+    read_csv_header,
+    split_csv_ranges,
+    filter_table_expression,
+    filter_stream_expression,
+    parse_filter_expression,
+    required_substrings,
+    prefilter_blocks
 )
+import main
 
 
 @pytest.fixture
 def client():
     """Create a test client for the app"""
+    # Start every test with an empty result cache
+    RESULT_CACHE.clear()
+    DATASETS.clear()
     # TestClient requires app as first positional argument
     return TestClient(app)
 
@@ -169,6 +209,1900 @@ class TestCSVProcessingFunctions:
         assert result["columns"] == []
 
 
+class TestStreamingIngest:
+    """Unit tests for the chunked, incrementally decoded read path"""
+    
+    def test_iter_text_lines_small_chunks(self):
+        """Test lines are reassembled across chunk boundaries"""
+        data = "name,city\r\nJosé,São Paulo\r\nAnn,Zürich".encode('utf-8')
+        
+        lines = list(iter_text_lines(io.BytesIO(data), chunk_size=3))
+        
+        assert lines == ["name,city\r\n", "José,São Paulo\r\n", "Ann,Zürich"]
+    
+    def test_iter_csv_rows_quoted_newline(self):
+        """Test quoted fields spanning lines and chunks are parsed as one value"""
+        data = b'name,note\nJohn,"line one\nline two"\nJane,plain\n'
+        
+        rows = list(iter_csv_rows(io.BytesIO(data)))
+        
+        assert len(rows) == 2
+        assert rows[0]["note"] == "line one\nline two"
+        assert rows[1]["name"] == "Jane"
+    
+    def test_iter_csv_rows_invalid_utf8(self):
+        """Test decoding errors surface while streaming"""
+        with pytest.raises(UnicodeDecodeError):
+            list(iter_csv_rows(io.BytesIO(b"name\n\xff\xfe\n")))
+    
+    def test_filter_and_aggregate_accept_generators(self):
+        """Test filter and aggregate consume a row stream"""
+        def rows():
+            yield {"name": "John", "age": "25"}
+            yield {"name": "Jane", "age": "30"}
+            yield {"name": "Bob", "age": "25"}
+        
+        filtered = process_csv_filter(rows(), "AGE", "25")
+        aggregated = process_csv_aggregate(rows(), "age")
+        
+        assert filtered["count"] == 2
+        assert filtered["columns"] == ["name", "age"]
+        assert aggregated["total_rows"] == 3
+        assert aggregated["aggregation"] == {"25": 2, "30": 1}
+
+
+class TestCSVTable:
+    """Unit tests for the columnar table"""
+    
+    def test_from_rows_round_trip(self):
+        """Test the header is stored once and rows convert back unchanged"""
+        rows = [
+            {"name": "John", "age": "25"},
+            {"name": "Jane", "age": "30"}
+        ]
+        
+        table = CSVTable.from_rows(rows)
+        
+        assert table.columns == ["name", "age"]
+        assert table.data == [["John", "Jane"], ["25", "30"]]
+        assert len(table) == 2
+        assert table.to_rows() == rows
+    
+    def test_numeric_column(self):
+        """Test typed numeric views turn non-numbers into NaN"""
+        table = CSVTable(["age"], [["25", "n/a", "1e3"]])
+        
+        values = table.numeric("AGE")
+        
+        assert values[0] == 25.0
+        assert values[1] != values[1]
+        assert values[2] == 1000.0
+        assert table.numeric("age") is values
+    
+    def test_ragged_records_are_normalized(self):
+        """Test short rows are padded, long rows truncated and blank lines skipped"""
+        data = b"a,b,c\n1,2\n\n4,5,6,7\n"
+        
+        table = CSVTable.from_stream(read_csv_stream(io.BytesIO(data)))
+        
+        assert table.to_rows() == [
+            {"a": "1", "b": "2", "c": ""},
+            {"a": "4", "b": "5", "c": "6"}
+        ]
+    
+    def test_operations_accept_tables(self):
+        """Test every operation runs on a table and returns row-form results"""
+        table = CSVTable(["name", "age"], [["bob", "alice", "carl"], ["25", "30", "25"]])
+        
+        assert [r["name"] for r in process_csv_filter(table, "age", "25")["rows"]] == ["bob", "carl"]
+        assert process_csv_transform(table, "name", "uppercase")["rows"][1]["name"] == "ALICE"
+        assert process_csv_aggregate(table, "age")["aggregation"] == {"25": 2, "30": 1}
+        assert [r["name"] for r in process_csv_sort(table, "name")["rows"]] == ["alice", "bob", "carl"]
+        assert process_csv_view(table)["count"] == 3
+        # Transforms return a new table and leave the source untouched
+        assert table.data[0] == ["bob", "alice", "carl"]
+
+
+class TestGroupAggregate:
+    """Unit tests for typed group-by aggregations"""
+    
+    def test_group_by_numeric_functions(self):
+        """Test count/sum/mean/min/max/stddev per group"""
+        rows = [
+            {"city": "Paris", "age": "20", "score": "1.5"},
+            {"city": "London", "age": "30", "score": "x"},
+            {"city": "paris", "age": "", "score": "2"},
+            {"city": "Paris", "age": "40", "score": "2.5"}
+        ]
+        
+        result = process_csv_group_aggregate(
+            rows, ["CITY"], ["age", "score"], ["count", "sum", "mean", "min", "max", "stddev"]
+        )
+        
+        assert result["group_by"] == ["city"]
+        assert result["total_rows"] == 4
+        assert [group["key"] for group in result["groups"]] == [{"city": "Paris"}, {"city": "London"}, {"city": "paris"}]
+        paris = result["groups"][0]
+        assert paris["count"] == 2
+        assert paris["values"]["age"] == {
+            "count": 2, "sum": 60.0, "mean": 30.0, "min": 20.0, "max": 40.0, "stddev": pytest.approx(14.1421356)
+        }
+        london = result["groups"][1]
+        assert london["values"]["score"]["count"] == 0
+        assert london["values"]["score"]["mean"] is None
+    
+    def test_multiple_group_keys(self):
+        """Test grouping on a composite key"""
+        rows = [
+            {"a": "1", "b": "x", "v": "1"},
+            {"a": "1", "b": "y", "v": "2"},
+            {"a": "1", "b": "x", "v": "3"}
+        ]
+        
+        result = process_csv_group_aggregate(rows, ["a", "b"], ["v"], ["sum"])
+        
+        assert [(g["key"], g["values"]["v"]["sum"]) for g in result["groups"]] == [
+            ({"a": "1", "b": "x"}, 4.0),
+            ({"a": "1", "b": "y"}, 2.0)
+        ]
+    
+    def test_percentiles_within_relative_error(self):
+        """Test p50/p95/p99 from the sketch stay within its relative accuracy"""
+        values = list(range(1, 10001))
+        rows = [{"g": "all", "v": str(v)} for v in values]
+        
+        result = process_csv_group_aggregate(rows, ["g"], ["v"], ["p50", "p95", "p99"])
+        
+        stats = result["groups"][0]["values"]["v"]
+        for name, exact in (("p50", 5000), ("p95", 9500), ("p99", 9900)):
+            assert stats[name] == pytest.approx(exact, rel=0.02)
+    
+    def test_sketch_memory_is_bounded(self):
+        """Test the sketch never keeps more than max_buckets buckets"""
+        sketch = QuantileSketch(max_buckets=64)
+        for i in range(1, 100000):
+            sketch.add(i * 1.37)
+            sketch.add(-i)
+        
+        assert len(sketch.positive) <= 64
+        assert len(sketch.negative) <= 64
+        assert sketch.quantile(1.0) == pytest.approx(99999 * 1.37, rel=0.02)
+    
+    def test_stats_merge_matches_single_pass(self):
+        """Test merged partial statistics equal one pass over all values"""
+        values = [random.Random(3).uniform(-50, 50) for _ in range(1000)]
+        single, left, right = NumericStats(True), NumericStats(True), NumericStats(True)
+        for v in values:
+            single.add(v)
+        for v in values[:400]:
+            left.add(v)
+        for v in values[400:]:
+            right.add(v)
+        
+        left.merge(right)
+        
+        functions = ["count", "sum", "mean", "min", "max", "stddev", "p50"]
+        merged, expected = left.result(functions), single.result(functions)
+        assert merged == pytest.approx(expected)
+    
+    def test_non_finite_values_are_skipped(self, client):
+        """Test inf and overflowing cells are skipped like text instead of breaking the stats and sketch"""
+        files = {"file": ("test.csv", "k,v\na,1\na,inf\na,1e999\nb,-Infinity\nb,2\n", "text/csv")}
+        
+        response = client.post("/api/process/csv", files=files, data={
+            "operation": "aggregate", "group_by": "k", "value_columns": "v", "aggregations": "count,sum,mean,stddev,p95"
+        })
+        
+        assert response.status_code == 200
+        groups = {group["key"]["k"]: group for group in response.json()["groups"]}
+        assert groups["a"]["count"] == 3
+        assert groups["a"]["values"]["v"] == {"count": 1, "sum": 1.0, "mean": 1.0, "stddev": None, "p95": pytest.approx(1.0, rel=0.02)}
+        assert groups["b"]["values"]["v"]["sum"] == 2.0
+    
+    def test_unknown_function(self):
+        """Test unknown aggregation names are rejected"""
+        with pytest.raises(ValueError):
+            process_csv_group_aggregate([{"a": "1"}], ["a"], ["a"], ["median"])
+    
+    def test_endpoint_group_aggregate(self, client):
+        """Test the group_by/value_columns/aggregations form fields"""
+        files = {"file": ("test.csv", create_test_csv_data(), "text/csv")}
+        data = {"operation": "aggregate", "group_by": "age", "value_columns": "age", "aggregations": "count,mean,p50"}
+        
+        response = client.post("/api/process/csv", files=files, data=data)
+        
+        assert response.status_code == 200
+        groups = response.json()["groups"]
+        assert groups[0] == {"key": {"age": "25"}, "count": 2, "values": {"age": {"count": 2, "mean": 25.0, "p50": 25.0}}}
+    
+    def test_endpoint_group_aggregate_errors(self, client):
+        """Test bad functions and unknown columns are 400s"""
+        files = {"file": ("test.csv", create_test_csv_data(), "text/csv")}
+        
+        bad_function = client.post("/api/process/csv", files=files, data={
+            "operation": "aggregate", "group_by": "city", "value_columns": "age", "aggregations": "median"
+        })
+        bad_column = client.post("/api/process/csv", files=files, data={
+            "operation": "aggregate", "group_by": "country", "value_columns": "age"
+        })
+        
+        assert bad_function.status_code == 400
+        assert bad_column.status_code == 400
+        assert "country" in bad_column.json()["detail"]
+
+
+class TestApproximateAggregate:
+    """Unit tests for the HyperLogLog and Space-Saving approximate aggregate"""
+    
+    def zipf_values(self, count: int, seed: int = 1) -> List[str]:
+        rng = random.Random(seed)
+        return [f"user{int(rng.paretovariate(1.1))}" for _ in range(count)]
+    
+    def test_distinct_count_within_error(self):
+        """Test the HyperLogLog estimate at low and high cardinality"""
+        small, large = main.HyperLogLog.for_error(0.01), main.HyperLogLog.for_error(0.01)
+        small.update(str(i % 50) for i in range(10000))
+        large.update(f"id-{i}" for i in range(200000))
+        
+        assert small.precision == 14
+        assert small.estimate() == 50
+        assert large.estimate() == pytest.approx(200000, rel=3 * large.relative_error)
+    
+    @pytest.mark.skipif(main.np is None, reason="numpy is not installed")
+    def test_vectorized_hashes_match(self, monkeypatch):
+        """Test numpy hashing and registers agree with the per-value path, including wide values"""
+        values = ["", "a", "ünïcode", "x" * (main.NUMPY_MAX_STR_WIDTH + 5)] + [f"id-{i}" for i in range(5000)]
+        vectorized, scalar = main.HyperLogLog(10), main.HyperLogLog(10)
+        hashes = main.numpy_stable_hashes(values).tolist()
+        
+        vectorized.update(values)
+        monkeypatch.setattr(main, "np", None)
+        scalar.update(values)
+        
+        assert hashes == [main.stable_hash64(value) for value in values]
+        assert vectorized.registers == scalar.registers
+    
+    def test_heavy_hitters_bound_true_counts(self):
+        """Test top values are found and every count is within its error of the truth"""
+        values = self.zipf_values(50000)
+        exact = Counter(values)
+        
+        result = process_csv_approximate_aggregate([{"user": value} for value in values], "USER", top_k=10, error=0.01)
+        
+        assert result["column"] == "user" and result["total_rows"] == 50000
+        assert [item["value"] for item in result["top"]] == [value for value, _ in exact.most_common(10)]
+        for item in result["top"]:
+            assert item["count"] - item["error"] <= exact[item["value"]] <= item["count"]
+            assert item["error"] <= result["count_error_bound"] == 500
+        assert result["distinct"] == pytest.approx(len(exact), rel=0.05)
+    
+    def test_memory_is_fixed(self):
+        """Test the counters stay at capacity whatever the cardinality"""
+        counts = main.ApproximateValueCounts(top_k=5, error=0.05)
+        counts.add_values((f"v{i}" for i in range(100000)), batch_rows=1000)
+        
+        assert len(counts.heavy.counts) == counts.heavy.capacity == 20
+        assert len(counts.distinct.registers) == 1 << 9
+    
+    def test_merge_matches_single_pass(self):
+        """Test merged chunk sketches agree with one sketch over every value"""
+        values = self.zipf_values(20000, seed=4)
+        single, left, right = (main.ApproximateValueCounts(top_k=5, error=0.02) for _ in range(3))
+        single.add_values(values)
+        left.add_values(values[:7000])
+        right.add_values(values[7000:])
+        
+        left.merge(right)
+        
+        assert left.distinct.registers == single.distinct.registers
+        assert left.heavy.total == 20000
+        assert [item["value"] for item in left.heavy.top(5)] == [item["value"] for item in single.heavy.top(5)]
+        exact = Counter(values)
+        for item in left.heavy.top(5):
+            assert item["count"] - item["error"] <= exact[item["value"]] <= item["count"]
+    
+    def test_endpoint(self, client):
+        """Test approximate=true is opt-in and validated"""
+        files = {"file": ("test.csv", create_test_csv_data(), "text/csv")}
+        
+        exact = client.post("/api/process/csv", files=files, data={"operation": "aggregate", "filter_column": "age"}).json()
+        approximate = client.post("/api/process/csv", files=files, data={
+            "operation": "aggregate", "filter_column": "age", "approximate": "true", "top_k": "1"
+        }).json()
+        typed = client.post("/api/process/csv", files=files, data={
+            "operation": "aggregate", "group_by": "city", "value_columns": "age", "approximate": "true"
+        })
+        bad_error = client.post("/api/process/csv", files=files, data={
+            "operation": "aggregate", "filter_column": "age", "approximate": "true", "approx_error": "0.9"
+        })
+        
+        assert "approximate" not in exact
+        assert approximate["aggregation"] == {"25": 2}
+        assert approximate["distinct"] == 2 and approximate["total_rows"] == 3
+        assert approximate["top"] == [{"value": "25", "count": 2, "error": 0}]
+        assert typed.status_code == 400
+        assert bad_error.status_code == 400
+
+
+class TestSort:
+    """Unit tests for typed, multi-column and external sorting"""
+    
+    def test_numeric_sort(self):
+        """Test numeric keys sort 9 before 10 and unparsable cells last"""
+        rows = [{"v": "10"}, {"v": "n/a"}, {"v": "9"}, {"v": "-1.5"}]
+        
+        ascending = process_csv_sort(rows, "v", sort_type="numeric")
+        descending = process_csv_sort(rows, "v", sort_type="numeric", descending=True)
+        
+        assert [r["v"] for r in ascending["rows"]] == ["-1.5", "9", "10", "n/a"]
+        assert [r["v"] for r in descending["rows"]] == ["10", "9", "-1.5", "n/a"]
+    
+    def test_date_sort(self):
+        """Test ISO and US dates are compared as dates"""
+        rows = [{"d": "2024-03-01"}, {"d": "12/31/2023"}, {"d": "2024-01-15T10:00:00"}]
+        
+        result = process_csv_sort(rows, "d", sort_type="date")
+        
+        assert [r["d"] for r in result["rows"]] == ["12/31/2023", "2024-01-15T10:00:00", "2024-03-01"]
+    
+    def test_multi_column_descending_is_stable(self):
+        """Test multiple keys and that ties keep their input order when descending"""
+        rows = [
+            {"a": "1", "b": "x", "id": "0"},
+            {"a": "2", "b": "x", "id": "1"},
+            {"a": "1", "b": "y", "id": "2"},
+            {"a": "1", "b": "x", "id": "3"}
+        ]
+        
+        result = process_csv_sort(rows, None, sort_columns=["A", "b"], descending=True)
+        
+        assert [r["id"] for r in result["rows"]] == ["1", "2", "0", "3"]
+    
+    @pytest.mark.parametrize("sort_type,descending", [("string", False), ("numeric", True), ("date", False)])
+    def test_external_sort_matches_in_memory(self, tmp_path, monkeypatch, sort_type, descending):
+        """Test spilled runs merge to the in-memory order and the spill directory is removed"""
+        monkeypatch.setattr(main, "SPILL_DIR", str(tmp_path))
+        rng = random.Random(11)
+        values = [str(rng.randint(0, 50)) for _ in range(2000)] + ["x", ""]
+        table = CSVTable(["v", "id"], [values, [str(i) for i in range(len(values))]])
+        
+        expected = process_csv_sort(table, "v", sort_type=sort_type, descending=descending)
+        spilled = sort_stream(table.stream(), "v", sort_type=sort_type, descending=descending, memory_budget=4096)
+        records = iter(spilled.records)
+        first = next(records)
+        
+        assert len(list(tmp_path.iterdir())) == 1
+        assert [first] + list(records) == [[r["v"], r["id"]] for r in expected["rows"]]
+        assert list(tmp_path.iterdir()) == []
+    
+    def test_endpoint_sort_options(self, client):
+        """Test the sort_type/descending/sort_columns form fields"""
+        csv_content = "name,score\nBob,9\nAlice,10\nCharlie,100\n"
+        files = {"file": ("test.csv", csv_content.encode('utf-8'), "text/csv")}
+        data = {"operation": "sort", "sort_columns": "score", "sort_type": "numeric", "descending": "true"}
+        
+        response = client.post("/api/process/csv", files=files, data=data)
+        
+        assert response.status_code == 200
+        assert [r["name"] for r in response.json()["rows"]] == ["Charlie", "Alice", "Bob"]
+    
+    def test_endpoint_invalid_sort_type(self, client):
+        """Test unknown sort types are rejected"""
+        files = {"file": ("test.csv", create_test_csv_data(), "text/csv")}
+        data = {"operation": "sort", "filter_column": "age", "sort_type": "natural"}
+        
+        response = client.post("/api/process/csv", files=files, data=data)
+        
+        assert response.status_code == 400
+
+
+class TestFilterExpressions:
+    """Tests for compound filter expressions and predicate pushdown"""
+    
+    def create_table(self) -> CSVTable:
+        return CSVTable(
+            ["name", "age", "city"],
+            [["John", "Jane", "Bob", "Ann"], ["25", "9", "10", "n/a"], ["New York", "London", "Paris", "Lisbon"]]
+        )
+    
+    def names(self, expression) -> List[str]:
+        return filter_table_expression(self.create_table(), expression, "python").column("name")
+    
+    def test_comparisons(self):
+        """Test numeric and string comparisons, ranges, lists, prefix and regex"""
+        assert self.names({"column": "age", "op": "<", "value": 10}) == ["Jane"]
+        assert self.names({"column": "age", "op": ">", "value": "2"}) == ["John", "Jane", "Ann"]
+        assert self.names({"column": "age", "op": "!=", "value": 25}) == ["Jane", "Bob"]
+        assert self.names({"column": "age", "op": "between", "value": [9, 25]}) == ["John", "Jane", "Bob"]
+        assert self.names({"column": "city", "op": "in", "value": ["Paris", "London"]}) == ["Jane", "Bob"]
+        assert self.names({"column": "CITY", "op": "prefix", "value": "L"}) == ["Jane", "Ann"]
+        assert self.names({"column": "city", "op": "regex", "value": "d.n$"}) == ["Jane"]
+    
+    def test_boolean_operators(self):
+        """Test and/or/not, and conditions on missing columns comparing an empty cell"""
+        young = {"column": "age", "op": "<=", "value": 10}
+        lisbon = {"column": "city", "op": "=", "value": "Lisbon"}
+        
+        assert self.names({"or": [young, lisbon]}) == ["Jane", "Bob", "Ann"]
+        assert self.names({"and": [{"not": young}, {"not": lisbon}]}) == ["John"]
+        assert self.names({"and": [young, {"column": "zip", "op": "=", "value": ""}]}) == ["Jane", "Bob"]
+        assert self.names({"or": [young, {"column": "zip", "op": "=", "value": "1"}]}) == ["Jane", "Bob"]
+    
+    def test_invalid_expressions(self):
+        """Test malformed expressions are rejected"""
+        for expression in (
+            "{not json",
+            [],
+            {"and": []},
+            {"column": "age", "op": "~", "value": 1},
+            {"column": "age", "op": "between", "value": 1},
+            {"column": "age", "op": "=", "value": "x", "numeric": True},
+            {"column": "age", "op": "regex", "value": "("}
+        ):
+            with pytest.raises(ValueError):
+                parse_filter_expression(expression)
+    
+    def test_required_substrings(self):
+        """Test which needles can be pushed below the parser"""
+        paris = {"column": "city", "op": "=", "value": "Paris"}
+        
+        assert required_substrings(parse_filter_expression(paris)) == [frozenset(["Paris"])]
+        assert required_substrings(parse_filter_expression(
+            {"and": [paris, {"column": "age", "op": ">", "value": 3}]}
+        )) == [frozenset(["Paris"])]
+        assert required_substrings(parse_filter_expression(
+            {"or": [paris, {"column": "name", "op": "in", "value": ["Bob", "Ann"]}]}
+        )) == [frozenset(["Paris", "Bob", "Ann"])]
+        assert required_substrings(parse_filter_expression({"not": paris})) == []
+        assert required_substrings(parse_filter_expression({"column": "city", "op": "=", "value": 'say "hi"'})) == []
+    
+    def test_prefilter_keeps_multiline_records(self):
+        """Test records with quoted line breaks are kept or dropped as a whole"""
+        blocks = ["1,a\n", '2,"multi\nline Paris"\n3,Paris\n4,"x\n', 'y"\n', "5,Paris\r\n6,Rome\r\n7,Paris"]
+        
+        assert list(prefilter_blocks(blocks, [frozenset(["Paris"])])) == [
+            '2,"multi\nline Paris"\n', "3,Paris\n", "5,Paris\r\n", "7,Paris"
+        ]
+        assert list(prefilter_blocks(["a,Paris,1\nb,Rome,2\nc,Paris,2\n"], [frozenset(["Paris"]), frozenset(["2"])])) == [
+            "c,Paris,2\n"
+        ]
+    
+    def test_prefilter_stray_quote_in_unquoted_field(self, client):
+        """Test a literal quote inside an unquoted field neither breaks the parse nor splits a later record"""
+        csv_content = 'name,height,city\nAnn,5,Paris\nJohn,5\'10",Paris\nJane,6,Rome\nBob,6,Paris\n'
+        files = {"file": ("test.csv", csv_content, "text/csv")}
+        
+        response = client.post("/api/process/csv", files=files, data={
+            "operation": "filter", "filter_column": "city", "filter_value": "Paris"
+        })
+        
+        assert response.status_code == 200
+        assert [row["name"] for row in response.json()["rows"]] == ["Ann", "John", "Bob"]
+        # A stray quote after a quoted line break throws parity off: the rest is passed through unfiltered
+        lines = ["a,1,Rome\n", 'b,"two\n', 'lines",5\'1"\n', "c,z,Rome\n", 'd,"q\n', 'r",Paris\n']
+        records = list(csv.reader(prefilter_blocks(["".join(lines)], [frozenset(["Paris"])])))
+        assert records == list(csv.reader(lines))[1:]
+    
+    def test_endpoint_filter_expression(self, client):
+        """Test filter_expression through the endpoint, with pushdown and without matches"""
+        csv_content = 'name,age,note\nJohn,25,"likes\nParis"\nJane,30,London\nBob,25,Paris\n'
+        files = {"file": ("test.csv", csv_content, "text/csv")}
+        expression = {"and": [{"column": "note", "op": "regex", "value": "Paris$"}, {"column": "age", "op": "<", "value": 30}]}
+        
+        response = client.post("/api/process/csv", files=files, data={
+            "operation": "filter", "filter_expression": json.dumps(expression)
+        })
+        no_match = client.post("/api/process/csv", files=files, data={
+            "operation": "filter", "filter_column": "name", "filter_value": "Zoe"
+        })
+        invalid = client.post("/api/process/csv", files=files, data={
+            "operation": "filter", "filter_expression": '{"column": "age"}'
+        })
+        
+        assert response.status_code == 200
+        assert [row["name"] for row in response.json()["rows"]] == ["John", "Bob"]
+        assert no_match.status_code == 200
+        assert no_match.json()["count"] == 0
+        assert invalid.status_code == 400
+
+
+class TestPipelines:
+    """Tests for multi-step pipelines"""
+    
+    csv_content = "name,age,city\nJohn,25,New York\nJane,30,london\nBob,25,Paris\nAnn,41,London\n"
+    
+    def steps(self):
+        return [
+            {"operation": "transform", "transform_column": "city", "transform_operation": "uppercase"},
+            {"operation": "filter", "filter_column": "city", "filter_value": "LONDON"},
+            {"operation": "sort", "sort_columns": "age", "sort_type": "numeric", "descending": True},
+            {"operation": "project", "columns": ["name", "city"]}
+        ]
+    
+    def test_stream_and_table_agree(self):
+        """Test the fused streaming pipeline matches the step-by-step table pipeline"""
+        params = main.OperationParams(operation="pipeline", pipeline=main.parse_pipeline(json.dumps(self.steps())))
+        streamed = main.run_operation(read_csv_stream(create_csv_file(self.csv_content)), params)
+        buffered = main.run_operation(CSVTable.from_stream(read_csv_stream(create_csv_file(self.csv_content))), params)
+        
+        assert streamed == buffered
+        assert streamed["columns"] == ["name", "city"]
+        assert streamed["rows"] == [{"name": "Ann", "city": "LONDON"}, {"name": "Jane", "city": "LONDON"}]
+    
+    def test_fused_steps_run_in_one_pass(self):
+        """Test records flow through the fused steps one at a time"""
+        pulled = []
+        
+        def records():
+            for record in [["a", "1"], ["b", "2"], ["c", "3"]]:
+                pulled.append(record[0])
+                yield record
+        
+        steps = main.parse_pipeline(json.dumps([
+            {"operation": "filter", "filter_expression": {"column": "n", "op": ">", "value": 1}},
+            {"operation": "project", "columns": "n"}
+        ]))
+        stream = main.run_pipeline_stream(main.CSVStream(["id", "n"], records()), steps)
+        
+        assert stream.columns == ["n"]
+        assert next(stream.records) == ["2"]
+        assert pulled == ["a", "b"]
+    
+    def test_endpoint_pipeline_with_aggregate(self, client):
+        """Test a pipeline ending in an aggregate, as JSON and NDJSON, and invalid pipelines"""
+        files = {"file": ("test.csv", self.csv_content, "text/csv")}
+        pipeline = json.dumps([
+            {"operation": "filter", "filter_expression": {"column": "age", "op": "<", "value": 40}},
+            {"operation": "aggregate", "group_by": "age", "value_columns": "age", "aggregations": "count"}
+        ])
+        
+        response = client.post("/api/process/csv", files=files, data={"pipeline": pipeline})
+        ndjson = client.post("/api/process/csv", files=files, data={"pipeline": pipeline, "format": "ndjson"})
+        
+        assert response.status_code == 200
+        assert ndjson.status_code == 200
+        assert ndjson.headers["x-csv-delimiter"] == ","
+        assert json.loads(ndjson.text) == {key: value for key, value in response.json().items() if key != "csv_format"}
+        for invalid in (
+            "[]",
+            "{not json",
+            json.dumps([{"operation": "aggregate", "filter_column": "age"}, {"operation": "view"}]),
+            json.dumps([{"operation": "project"}]),
+            json.dumps([{"operation": "view", "colour": "red"}]),
+            json.dumps([{"operation": "project", "columns": ["zip"]}])
+        ):
+            assert client.post("/api/process/csv", files=files, data={"pipeline": invalid}).status_code == 400
+
+
+class TestProjection:
+    """Tests for columns= projection and parsing only the required columns"""
+    
+    csv_content = "id,name,age,city\n1,John,25,New York\n2,Jane,30\n\n3,Bob,25,Paris,extra\n"
+    
+    def test_parser_keeps_only_required_columns(self):
+        """Test records hold only the kept columns, in header order, padded like full records"""
+        stream = read_csv_stream(create_csv_file(self.csv_content), keep=["CITY", "id", "zip"])
+        single = read_csv_stream(create_csv_file(self.csv_content), keep=["city"])
+        
+        assert stream.columns == ["id", "city"]
+        assert list(stream.records) == [["1", "New York"], ["2", ""], ["3", "Paris"]]
+        assert list(single.records) == [["New York"], [""], ["Paris"]]
+    
+    def test_required_columns(self):
+        """Test the columns an operation reads are kept next to the selected ones"""
+        sort = main.OperationParams(operation="sort", sort_columns=["age"], columns=["name"])
+        expression = main.OperationParams(
+            operation="filter", filter_expression=json.dumps({"not": {"column": "city", "op": "=", "value": "x"}}), columns=["id"]
+        )
+        aggregate = main.OperationParams(operation="aggregate", group_by=["city"], value_columns=["age"])
+        
+        assert main.required_columns(main.OperationParams(operation="view")) is None
+        assert main.required_columns(sort) == ["name", "age"]
+        assert main.required_columns(expression) == ["id", "city"]
+        assert main.required_columns(aggregate) == ["city", "age"]
+    
+    def test_endpoint_columns_for_every_operation(self, client):
+        """Test the JSON, NDJSON and dataset results only hold the selected columns"""
+        files = {"file": ("test.csv", self.csv_content, "text/csv")}
+        cases = [
+            ({"operation": "view"}, ["1", "2", "3"]),
+            ({"operation": "filter", "filter_column": "age", "filter_value": "25"}, ["1", "3"]),
+            ({"operation": "transform", "transform_column": "name", "transform_operation": "uppercase"}, ["1", "2", "3"]),
+            ({"operation": "sort", "sort_columns": "age,name", "sort_type": "numeric", "descending": "true"}, ["2", "1", "3"])
+        ]
+        dataset_id = client.post("/api/datasets", files=files).json()["id"]
+        
+        for data, ids in cases:
+            data = dict(data, columns="ID")
+            response = client.post("/api/process/csv", files=files, data=data)
+            ndjson = client.post("/api/process/csv", files=files, data=dict(data, format="ndjson"))
+            from_dataset = client.post(f"/api/datasets/{dataset_id}/process", data=data)
+            
+            assert response.status_code == 200
+            assert response.json()["columns"] == ["id"]
+            assert [row["id"] for row in response.json()["rows"]] == ids
+            assert [json.loads(line) for line in ndjson.text.splitlines()][1:-1] == [{"id": i} for i in ids]
+            assert from_dataset.json()["rows"] == response.json()["rows"]
+        
+        missing = client.post("/api/process/csv", files=files, data={"operation": "view", "columns": "zip"})
+        assert missing.status_code == 400
+    
+    def test_dataset_download_columns(self, client):
+        """Test a dataset download with a column selection"""
+        files = {"file": ("test.csv", self.csv_content, "text/csv")}
+        dataset_id = client.post("/api/datasets", files=files).json()["id"]
+        
+        response = client.get(f"/api/datasets/{dataset_id}/download", params={"columns": "city,name"})
+        missing = client.get(f"/api/datasets/{dataset_id}/download", params={"columns": "zip"})
+        
+        assert response.status_code == 200
+        assert response.text.splitlines() == ["city,name", "New York,John", ",Jane", "Paris,Bob"]
+        assert missing.status_code == 400
+
+
+class TestPaging:
+    """Tests for offset/limit windows and top_n sorts"""
+    
+    def create_csv(self, rows: int = 50) -> str:
+        rng = random.Random(5)
+        lines = ["id,score,city"]
+        for i in range(rows):
+            lines.append(f"{i},{rng.randint(0, 9)},{rng.choice(['Paris', 'Rome'])}")
+        return "\n".join(lines) + "\n"
+    
+    def test_top_sorted_matches_full_sort(self):
+        """Test the bounded heap keeps the same rows, ties included, as a full sort"""
+        csv_content = self.create_csv()
+        for descending in (False, True):
+            for sort_type in ("string", "numeric"):
+                table = CSVTable.from_stream(read_csv_stream(create_csv_file(csv_content)))
+                expected = main.sort_table(table, "score", "python", sort_type, descending)
+                
+                top, total = main.top_sorted(table, 7, "score", sort_type, descending)
+                streamed, streamed_total = main.top_sorted(read_csv_stream(create_csv_file(csv_content)), 7, "score", sort_type, descending)
+                
+                assert total == streamed_total == 50
+                assert top.to_rows() == streamed.to_rows() == expected.slice(0, 7).to_rows()
+    
+    def test_endpoint_windows(self, client):
+        """Test offset/limit on several operations return the window and the total count"""
+        csv_content = self.create_csv()
+        files = {"file": ("test.csv", csv_content, "text/csv")}
+        full = client.post("/api/process/csv", files=files, data={"operation": "filter", "filter_column": "city", "filter_value": "Paris"}).json()
+        sort = client.post("/api/process/csv", files=files, data={"operation": "sort", "sort_columns": "score", "sort_type": "numeric"}).json()
+        
+        paged = client.post("/api/process/csv", files=files, data={
+            "operation": "filter", "filter_column": "city", "filter_value": "Paris", "offset": 5, "limit": 10
+        }).json()
+        top = client.post("/api/process/csv", files=files, data={
+            "operation": "sort", "sort_columns": "score", "sort_type": "numeric", "top_n": 8, "offset": 2, "limit": 10
+        }).json()
+        ndjson = client.post("/api/process/csv", files=files, data={"operation": "view", "offset": 48, "format": "ndjson"})
+        
+        assert paged["count"] == full["count"]
+        assert (paged["offset"], paged["limit"]) == (5, 10)
+        assert paged["rows"] == full["rows"][5:15]
+        assert top["count"] == 50
+        assert top["rows"] == sort["rows"][2:8]
+        view = client.post("/api/process/csv", files=files, data={"operation": "view"}).json()
+        assert [json.loads(line) for line in ndjson.text.splitlines()][1:] == view["rows"][48:] + [{"count": 50}]
+    
+    def test_dataset_pages_store_the_whole_result(self, client):
+        """Test a paged dataset request stores the whole result for further pages and download"""
+        files = {"file": ("test.csv", self.create_csv(), "text/csv")}
+        dataset_id = client.post("/api/datasets", files=files).json()["id"]
+        
+        first = client.post(f"/api/datasets/{dataset_id}/process", data={
+            "operation": "sort", "sort_columns": "score", "sort_type": "numeric", "limit": 20
+        }).json()
+        second = client.post(f"/api/datasets/{first['dataset_id']}/process", data={"operation": "view", "offset": 20, "limit": 20}).json()
+        top = client.post(f"/api/datasets/{dataset_id}/process", data={"operation": "sort", "sort_columns": "score", "top_n": 3}).json()
+        
+        assert len(first["rows"]) == 20 and first["count"] == 50
+        assert client.get(f"/api/datasets/{first['dataset_id']}").json()["count"] == 50
+        assert second["rows"][0]["score"] >= first["rows"][-1]["score"]
+        assert second["dataset_id"] == first["dataset_id"]
+        assert top["count"] == 50
+        assert client.get(f"/api/datasets/{top['dataset_id']}").json()["count"] == 3
+    
+    def test_invalid_windows(self, client):
+        """Test negative windows, top_n outside sort and windows on aggregates are rejected"""
+        files = {"file": ("test.csv", self.create_csv(5), "text/csv")}
+        for data in (
+            {"operation": "view", "offset": -1},
+            {"operation": "view", "limit": -5},
+            {"operation": "view", "top_n": 3},
+            {"operation": "sort", "sort_columns": "id", "top_n": 0},
+            {"operation": "aggregate", "filter_column": "city", "limit": 2}
+        ):
+            assert client.post("/api/process/csv", files=files, data=data).status_code == 400
+
+
+class TestSerialization:
+    """Tests for the JSON serializers and the column-oriented result shape"""
+    
+    def test_serializers_agree(self, monkeypatch):
+        """Test orjson (when installed) and the stdlib produce the same JSON values"""
+        result = {"rows": [{"name": "Zoë", "note": 'say "hi"\n'}], "count": 1, "big": 2 ** 70, "mean": 2.5}
+        
+        fast = main.encode_json(result)
+        monkeypatch.setattr(main, "USE_ORJSON", False)
+        
+        assert json.loads(fast) == json.loads(main.encode_json(result)) == result
+    
+    def test_endpoint_columns_shape(self, client):
+        """Test shape=columns for JSON, NDJSON, paged and dataset results"""
+        files = {"file": ("test.csv", create_test_csv_data(), "text/csv")}
+        
+        rows = client.post("/api/process/csv", files=files, data={"operation": "view"}).json()
+        columns = client.post("/api/process/csv", files=files, data={"operation": "view", "shape": "columns"}).json()
+        page = client.post("/api/process/csv", files=files, data={"operation": "view", "shape": "columns", "offset": 1}).json()
+        ndjson = client.post("/api/process/csv", files=files, data={"operation": "view", "shape": "columns", "format": "ndjson"})
+        dataset_id = client.post("/api/datasets", files=files).json()["id"]
+        from_dataset = client.post(f"/api/datasets/{dataset_id}/process", data={"operation": "view", "shape": "columns"}).json()
+        invalid = client.post("/api/process/csv", files=files, data={"operation": "view", "shape": "wide"})
+        
+        assert columns == {
+            "columns": ["name", "age", "city"],
+            "data": [["John", "25", "New York"], ["Jane", "30", "London"], ["Bob", "25", "Paris"]],
+            "count": 3,
+            "csv_format": {"encoding": "utf-8", "delimiter": ",", "quotechar": '"'}
+        }
+        assert [dict(zip(columns["columns"], values)) for values in columns["data"]] == rows["rows"]
+        assert page["data"] == columns["data"][1:] and page["count"] == 3
+        assert [json.loads(line) for line in ndjson.text.splitlines()] == [{"columns": columns["columns"]}] + columns["data"] + [{"count": 3}]
+        assert from_dataset["data"] == columns["data"]
+        assert invalid.status_code == 400
+
+
+class TestCompressedUploads:
+    """Tests for gzip, zstd and zip uploads decompressed while they are parsed"""
+    
+    def zip_bytes(self, members) -> bytes:
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            for name, content in members.items():
+                archive.writestr(name, content)
+        return buffer.getvalue()
+    
+    def test_open_upload(self):
+        """Test compressed uploads are detected by magic bytes and read incrementally"""
+        csv_content = create_test_csv_data().encode("utf-8")
+        
+        assert main.open_upload(io.BytesIO(gzip.compress(csv_content))).read() == csv_content
+        assert main.open_upload(io.BytesIO(self.zip_bytes({"__MACOSX/._a.csv": "x", "data/a.csv": csv_content}))).read() == csv_content
+        plain = io.BytesIO(csv_content)
+        assert main.open_upload(plain) is plain and plain.tell() == 0
+        with pytest.raises(ValueError):
+            main.open_upload(io.BytesIO(self.zip_bytes({"a.csv": "a", "b.csv": "b"})))
+    
+    @pytest.mark.skipif(main.zstandard is None, reason="zstandard is not installed")
+    def test_zstd_upload(self):
+        """Test zstd uploads when the optional package is installed"""
+        csv_content = create_test_csv_data().encode("utf-8")
+        compressed = main.zstandard.ZstdCompressor().compress(csv_content)
+        
+        assert main.open_upload(io.BytesIO(compressed)).read() == csv_content
+    
+    def test_endpoints_accept_compressed_uploads(self, client):
+        """Test gzip and zip uploads give the same results as the plain file"""
+        csv_content = create_test_csv_data()
+        data = {"operation": "filter", "filter_column": "age", "filter_value": "25"}
+        expected = client.post("/api/process/csv", files={"file": ("test.csv", csv_content, "text/csv")}, data=data).json()
+        
+        for name, payload in (
+            ("test.csv.gz", gzip.compress(csv_content.encode("utf-8"))),
+            ("test.zip", self.zip_bytes({"test.csv": csv_content}))
+        ):
+            files = {"file": (name, payload, "application/octet-stream")}
+            ndjson = client.post("/api/process/csv", files=files, data=dict(data, format="ndjson"))
+            dataset = client.post("/api/datasets", files=files)
+            
+            assert client.post("/api/process/csv", files=files, data=data).json() == expected
+            assert [json.loads(line) for line in ndjson.text.splitlines()][1:-1] == expected["rows"]
+            assert dataset.json()["count"] == 3
+    
+    def test_compressed_upload_on_worker_processes(self, client, monkeypatch):
+        """Test large compressed uploads go to a worker process whole instead of being split"""
+        csv_content = create_test_csv_data()
+        files = {"file": ("test.csv.gz", gzip.compress(csv_content.encode("utf-8")), "application/gzip")}
+        data = {"operation": "aggregate", "filter_column": "age"}
+        expected = client.post("/api/process/csv", files={"file": ("test.csv", csv_content, "text/csv")}, data=data).json()
+        
+        executor = OperationExecutor(threads=1, processes=2, process_min_bytes=1, max_pending=4)
+        monkeypatch.setattr(main, "EXECUTOR", executor)
+        monkeypatch.setattr(main, "PARALLEL_PARSE_MIN_BYTES", 1)
+        monkeypatch.setattr(main, "process_upload_parallel", None)
+        try:
+            response = client.post("/api/process/csv", files=files, data=data)
+        finally:
+            executor.shutdown()
+        
+        assert response.json() == expected
+    
+    def test_corrupt_upload(self, client):
+        """Test a truncated gzip upload is rejected with a 400"""
+        payload = gzip.compress(create_test_csv_data().encode("utf-8") * 100)[:-40]
+        files = {"file": ("test.csv.gz", payload, "application/gzip")}
+        
+        response = client.post("/api/process/csv", files=files, data={"operation": "view"})
+        
+        assert response.status_code == 400
+        assert "decompress" in response.json()["detail"]
+
+
+class TestSniffing:
+    """Tests for detecting the encoding and dialect of uploads"""
+    
+    def test_detect_encoding(self):
+        """Test byte order marks, BOM-less UTF-16, UTF-8 and the Windows-1252 fallback"""
+        text = "name;city\nJosé;Zürich\n"
+        
+        assert main.detect_encoding(text.encode("utf-8")) == "utf-8"
+        assert main.detect_encoding(codecs.BOM_UTF8 + text.encode("utf-8")) == "utf-8-sig"
+        assert main.detect_encoding(text.encode("utf-16")) == "utf-16"
+        assert main.detect_encoding(text.encode("utf-16-le")) == "utf-16-le"
+        assert main.detect_encoding(text.encode("utf-16-be")) == "utf-16-be"
+        assert main.detect_encoding(text.encode("cp1252")) == "cp1252"
+        assert main.detect_encoding("é".encode("utf-8")[:1] + b"".join([b"a"] * 3)) == "cp1252"
+        # A multi-byte character cut at the end of the sample is still UTF-8
+        assert main.detect_encoding("abcé".encode("utf-8")[:-1]) == "utf-8"
+    
+    def test_sniff_upload(self):
+        """Test delimiters and quote characters are guessed and overrides are applied"""
+        semicolons = io.BytesIO('id;name\n1;"Smith; John"\n2;Jane\n'.encode("cp1252"))
+        tabs = io.BytesIO("a\tb\n1\t2\n3\t4\n".encode("utf-16"))
+        
+        csv_format, stream = main.sniff_upload(semicolons, sample_bytes=8)
+        assert csv_format == main.CSVFormat("utf-8", ";", '"')
+        assert stream.read(4) + stream.read() == semicolons.getvalue()
+        csv_format, _ = main.sniff_upload(tabs)
+        assert csv_format == main.CSVFormat("utf-16", "\t", '"')
+        assert not csv_format.splittable
+        csv_format, _ = main.sniff_upload(io.BytesIO(b"a|b\n"), encoding="latin-1", delimiter="pipe")
+        assert csv_format == main.CSVFormat("latin-1", "|", '"')
+        with pytest.raises(ValueError):
+            main.sniff_upload(io.BytesIO(b"a,b\n"), encoding="klingon")
+        with pytest.raises(ValueError):
+            main.sniff_upload(io.BytesIO(b"a,b\n"), delimiter=";;")
+    
+    def test_endpoints_report_format(self, client):
+        """Test Excel-style exports are parsed and their format reported in JSON, NDJSON and datasets"""
+        content = "name;age;city\nJosé;25;Zürich\nJane;30;London\n"
+        expected = [{"name": "José", "age": "25", "city": "Zürich"}, {"name": "Jane", "age": "30", "city": "London"}]
+        detected = {"encoding": "cp1252", "delimiter": ";", "quotechar": '"'}
+        
+        for payload in (content.encode("cp1252"), codecs.BOM_UTF16_LE + content.encode("utf-16-le")):
+            files = {"file": ("test.csv", payload, "text/csv")}
+            result = client.post("/api/process/csv", files=files, data={"operation": "view"}).json()
+            ndjson = client.post("/api/process/csv", files=files, data={"operation": "view", "format": "ndjson"})
+            dataset = client.post("/api/datasets", files=files).json()
+            
+            assert result["rows"] == expected
+            assert [json.loads(line) for line in ndjson.text.splitlines()][1:-1] == expected
+            assert ndjson.headers["x-csv-delimiter"] == ";"
+            assert dataset["count"] == 2 and dataset["csv_format"] == result["csv_format"]
+        assert result["csv_format"] == dict(detected, encoding="utf-16")
+        
+        files = {"file": ("test.csv", content.encode("cp1252"), "text/csv")}
+        assert client.post("/api/process/csv", files=files, data={"operation": "view"}).json()["csv_format"] == detected
+        forced = client.post("/api/process/csv", files=files, data={"operation": "view", "delimiter": ",", "encoding": "latin-1"}).json()
+        assert forced["csv_format"]["delimiter"] == "," and forced["rows"][0] == {"name;age;city": "José;25;Zürich"}
+        for data in ({"delimiter": "two"}, {"encoding": "klingon"}):
+            assert client.post("/api/process/csv", files=files, data=dict(data, operation="view")).status_code == 400
+    
+    def test_parallel_upload_uses_detected_format(self, client, monkeypatch):
+        """Test split parsing uses the detected delimiter and UTF-16 uploads are parsed whole"""
+        content = "name;age\n" + "".join(f"n{i};{i % 7}\n" for i in range(500))
+        data = {"operation": "aggregate", "filter_column": "age"}
+        expected = client.post("/api/process/csv", files={"file": ("test.csv", content, "text/csv")}, data=data).json()
+        
+        executor = OperationExecutor(threads=1, processes=2, process_min_bytes=1, max_pending=4)
+        monkeypatch.setattr(main, "EXECUTOR", executor)
+        monkeypatch.setattr(main, "PARALLEL_PARSE_MIN_BYTES", 1)
+        monkeypatch.setattr(main, "PARSE_CHUNK_BYTES", 1024)
+        try:
+            results = [
+                client.post("/api/process/csv", files={"file": ("test.csv", payload, "text/csv")}, data=data).json()
+                for payload in (content.encode("utf-8"), content.encode("utf-16"))
+            ]
+        finally:
+            executor.shutdown()
+        
+        assert results[0] == expected
+        assert results[1]["csv_format"]["encoding"] == "utf-16"
+        assert results[1]["aggregation"] == expected["aggregation"]
+
+
+class TestMetrics:
+    """Tests for the stage timer, Server-Timing and the Prometheus /metrics endpoint"""
+    
+    def test_stage_timer_is_exclusive(self, monkeypatch):
+        """Test a nested stage is subtracted from the enclosing one"""
+        clock = iter([0.0, 1.0, 3.0, 6.0])
+        monkeypatch.setattr(main.time, "perf_counter", lambda: next(clock))
+        timer = main.StageTimer()
+        
+        timer.enter("parse")
+        timer.enter("read")
+        timer.exit()
+        timer.exit()
+        timer.merge({"parse": 0.5}, 10)
+        
+        assert timer.seconds["parse"] == 1.0 + 3.0 + 0.5
+        assert timer.seconds["read"] == 2.0
+        assert timer.rows == 10
+        assert timer.server_timing(7.0).startswith("read;dur=2000.0, parse;dur=4500.0")
+    
+    def test_histogram_render(self):
+        """Test histograms render cumulative buckets, sum and count with escaped labels"""
+        metric = main.Metric("test_seconds", "histogram", "Test", ("route",), (0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            metric.observe(('/a"b',), value)
+        
+        lines = metric.render()
+        
+        assert lines[2:] == [
+            'test_seconds_bucket{route="/a\\"b",le="0.1"} 1',
+            'test_seconds_bucket{route="/a\\"b",le="1.0"} 2',
+            'test_seconds_bucket{route="/a\\"b",le="+Inf"} 3',
+            'test_seconds_sum{route="/a\\"b"} 5.55',
+            'test_seconds_count{route="/a\\"b"} 3'
+        ]
+    
+    def test_server_timing_and_metrics(self, client):
+        """Test a processed upload reports its stages and is counted in /metrics"""
+        files = {"file": ("test.csv", create_test_csv_data(), "text/csv")}
+        before = main.ROWS_TOTAL.values.get(("sort",), 0)
+        
+        response = client.post("/api/process/csv", files=files, data={"operation": "sort", "sort_columns": "age"})
+        metrics = client.get("/metrics")
+        
+        stages = [part.split(";")[0] for part in response.headers["server-timing"].split(", ")]
+        assert {"upload", "parse", "process", "serialize", "total"} <= set(stages)
+        assert metrics.headers["content-type"].startswith("text/plain")
+        assert 'csv_requests_total{route="/api/process/csv",method="POST",status="200",operation="sort"}' in metrics.text
+        assert 'csv_stage_duration_seconds_count{stage="parse",operation="sort"}' in metrics.text
+        assert "csv_jobs_in_flight 0" in metrics.text
+        assert main.ROWS_TOTAL.values[("sort",)] == before + 3
+    
+    def test_unknown_operation_label(self, client):
+        """Test operations outside the known set share one label instead of adding series"""
+        files = {"file": ("test.csv", create_test_csv_data(), "text/csv")}
+        
+        for index in range(3):
+            client.post("/api/process/csv", files=files, data={"operation": f"evil{index}"})
+        metrics = client.get("/metrics").text
+        
+        assert "evil" not in metrics
+        assert 'operation="other"' in metrics
+    
+    def test_worker_process_stages_are_merged(self, client, monkeypatch):
+        """Test stages timed in a worker process are reported for the request"""
+        executor = OperationExecutor(threads=1, processes=1, process_min_bytes=1, max_pending=4)
+        monkeypatch.setattr(main, "EXECUTOR", executor)
+        files = {"file": ("test.csv", create_test_csv_data(), "text/csv")}
+        
+        try:
+            response = client.post("/api/process/csv", files=files, data={"operation": "view"})
+        finally:
+            executor.shutdown()
+        
+        assert response.status_code == 200
+        assert "parse;dur=" in response.headers["server-timing"]
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    """A thread-based job manager for the test"""
+    manager = main.JobManager(workers=1, max_queued=1, retention_seconds=60, use_processes=False)
+    monkeypatch.setattr(main, "JOBS", manager)
+    yield manager
+    manager.shutdown()
+
+
+def wait_for_job(client, job_id: str, timeout: float = 30) -> dict:
+    deadline = time.monotonic() + timeout
+    while True:
+        info = client.get(f"/api/jobs/{job_id}").json()
+        if info["status"] not in ("queued", "running") or time.monotonic() > deadline:
+            return info
+        time.sleep(0.02)
+
+
+class TestJobs:
+    """Tests for the background job API"""
+    
+    def test_job_lifecycle(self, client, jobs):
+        """Test a job is accepted at once, reports progress and serves the same result as /api/process/csv"""
+        files = {"file": ("test.csv", create_test_csv_data(), "text/csv")}
+        data = {"operation": "filter", "filter_column": "age", "filter_value": "25"}
+        expected = client.post("/api/process/csv", files=files, data=data).json()
+        
+        created = client.post("/api/jobs", files=files, data=data)
+        info = wait_for_job(client, created.json()["id"])
+        result = client.get(info["result_url"])
+        
+        assert created.status_code == 202
+        assert created.headers["location"] == f"/api/jobs/{info['id']}"
+        assert info["status"] == "succeeded" and info["percent"] == 100.0
+        # Filter pushdown skips the line without "25" before it is parsed
+        assert info["rows_processed"] == 2 and info["bytes_read"] == info["size_bytes"]
+        assert info["result_bytes"] == len(result.content)
+        assert result.headers["content-type"] == "application/json"
+        assert result.json() == expected
+        assert [job["id"] for job in client.get("/api/jobs").json()["jobs"]] == [info["id"]]
+        
+        directory = jobs.get(info["id"]).directory
+        assert sorted(os.listdir(directory)) == ["progress.json", "result"]
+        assert client.delete(f"/api/jobs/{info['id']}").status_code == 204
+        assert not os.path.exists(directory)
+        assert client.get(f"/api/jobs/{info['id']}").status_code == 404
+    
+    def test_refresh_does_not_undo_finish(self, monkeypatch):
+        """Test a progress report read while the job finishes leaves the final status alone"""
+        job = main.Job("id", "/nonexistent", "view", "json", 10, time.time(), status="running")
+        
+        def finish_while_reading(directory):
+            # The worker's done callback runs between reading the report and applying it
+            job.finished_at, job.status = time.time(), "succeeded"
+            return {"started_at": 1.0, "bytes_read": 5, "rows": 2}
+        
+        monkeypatch.setattr(main, "read_job_progress", finish_while_reading)
+        job.refresh()
+        
+        assert job.status == "succeeded" and job.bytes_read == 0
+    
+    def test_ndjson_job(self, client, jobs):
+        """Test format=ndjson stores an NDJSON result"""
+        files = {"file": ("test.csv", create_test_csv_data(), "text/csv")}
+        
+        info = wait_for_job(client, client.post("/api/jobs", files=files, data={"operation": "view", "format": "ndjson"}).json()["id"])
+        result = client.get(info["result_url"])
+        
+        assert result.headers["content-type"] == "application/x-ndjson"
+        assert [json.loads(line) for line in result.text.splitlines()][-1] == {"count": 3}
+    
+    def test_failed_and_invalid_jobs(self, client, jobs):
+        """Test processing errors fail the job and invalid requests are rejected up front"""
+        info = wait_for_job(client, client.post("/api/jobs", files={"file": ("test.csv", b"", "text/csv")}).json()["id"])
+        result = client.get(f"/api/jobs/{info['id']}/result")
+        
+        assert info["status"] == "failed"
+        assert info["error"] == "CSV file is empty"
+        assert result.status_code == 409 and "CSV file is empty" in result.json()["detail"]
+        files = {"file": ("test.csv", create_test_csv_data(), "text/csv")}
+        assert client.post("/api/jobs", files=files, data={"format": "xml"}).status_code == 400
+        assert client.post("/api/jobs", files=files, data={"operation": "filter"}).status_code == 400
+        assert client.get("/api/jobs/missing").status_code == 404
+    
+    def test_cancel_limits_and_retention(self, client, jobs, monkeypatch):
+        """Test cancelling queued and running jobs, the queue bound and removal after the retention time"""
+        release = threading.Event()
+        
+        def blocked_upload(stream, params):
+            release.wait(10)
+            return b"{}"
+        
+        monkeypatch.setattr(main, "process_upload", blocked_upload)
+        files = {"file": ("test.csv", create_test_csv_data(), "text/csv")}
+        running = client.post("/api/jobs", files=files).json()["id"]
+        queued = client.post("/api/jobs", files=files).json()["id"]
+        
+        assert client.post("/api/jobs", files=files).status_code == 503
+        assert client.post(f"/api/jobs/{queued}/cancel").json()["status"] == "cancelled"
+        client.post(f"/api/jobs/{running}/cancel")
+        release.set()
+        assert wait_for_job(client, running)["status"] == "cancelled"
+        assert client.get(f"/api/jobs/{running}/result").status_code == 409
+        
+        jobs.retention_seconds = 0
+        time.sleep(0.01)
+        assert client.get(f"/api/jobs/{running}").status_code == 404
+        assert client.get("/api/jobs").json() == {"jobs": []}
+    
+    def test_job_on_worker_process(self, client, monkeypatch):
+        """Test jobs run on a worker process report their progress and result"""
+        manager = main.JobManager(workers=1, max_queued=1, retention_seconds=60, use_processes=True)
+        monkeypatch.setattr(main, "JOBS", manager)
+        files = {"file": ("test.csv", create_test_csv_data(), "text/csv")}
+        data = {"operation": "aggregate", "filter_column": "city"}
+        expected = client.post("/api/process/csv", files=files, data=data).json()
+        
+        try:
+            info = wait_for_job(client, client.post("/api/jobs", files=files, data=data).json()["id"])
+            result = client.get(info["result_url"]).json()
+        finally:
+            manager.shutdown()
+        
+        assert info["status"] == "succeeded" and info["rows_processed"] == 3
+        assert result == expected
+
+
+class TestResultCache:
+    """Unit tests for the content-addressed result cache"""
+    
+    def test_repeated_upload_hits(self, client):
+        """Test the second identical request is served from the cache"""
+        files = {"file": ("test.csv", create_test_csv_data(), "text/csv")}
+        data = {"operation": "aggregate", "filter_column": "city"}
+        
+        first = client.post("/api/process/csv", files=files, data=data)
+        second = client.post("/api/process/csv", files=files, data=dict(data, engine="python"))
+        other = client.post("/api/process/csv", files=files, data={"operation": "aggregate", "filter_column": "age"})
+        
+        assert first.headers["x-cache"] == "MISS"
+        assert second.headers["x-cache"] == "HIT"
+        assert second.headers["x-cache-tier"] == "memory"
+        assert second.json() == first.json()
+        assert other.headers["x-cache"] == "MISS"
+        
+        metrics = client.get("/api/cache/metrics").json()
+        assert metrics["hits"] == 1
+        assert metrics["misses"] == 2
+        assert metrics["hit_ratio"] == pytest.approx(1 / 3)
+    
+    def test_errors_are_not_cached(self, client):
+        """Test failed requests never populate the cache"""
+        files = {"file": ("test.csv", b"name,age\n", "text/csv")}
+        
+        client.post("/api/process/csv", files=files, data={"operation": "view"})
+        
+        assert client.get("/api/cache/metrics").json()["stores"] == 0
+    
+    def test_size_based_eviction(self):
+        """Test least recently used entries are evicted once the byte limit is exceeded"""
+        cache = ResultCache(max_bytes=10)
+        cache.put("a", b"aaaa")
+        cache.put("b", b"bbbb")
+        cache.get("a")
+        cache.put("c", b"cccc")
+        
+        assert cache.get("b") == (None, None)
+        assert cache.get("a") == (b"aaaa", "memory")
+        assert cache.metrics()["memory_bytes"] == 8
+        assert cache.metrics()["evictions_memory"] == 1
+    
+    def test_disk_tier(self, tmp_path):
+        """Test entries survive in the disk tier and are bounded by its byte limit"""
+        cache = ResultCache(max_bytes=4, disk_dir=str(tmp_path), disk_max_bytes=8)
+        cache.put("a", b"aaaa")
+        cache.put("b", b"bbbb")
+        cache.put("c", b"cccc")
+        
+        restarted = ResultCache(max_bytes=4, disk_dir=str(tmp_path), disk_max_bytes=8)
+        
+        assert restarted.get("a") == (None, None)
+        assert restarted.get("b") == (b"bbbb", "disk")
+        assert restarted.get("b") == (b"bbbb", "memory")
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["b.json", "c.json"]
+
+
+class TestDatasets:
+    """Tests for uploading a CSV once and processing it by dataset id"""
+    
+    def upload(self, client, content=None) -> str:
+        files = {"file": ("test.csv", content or create_test_csv_data(), "text/csv")}
+        response = client.post("/api/datasets", files=files)
+        assert response.status_code == 201
+        return response.json()["id"]
+    
+    def test_create_and_get(self, client):
+        """Test the upload is parsed once and described by id"""
+        dataset_id = self.upload(client)
+        
+        response = client.get(f"/api/datasets/{dataset_id}")
+        
+        assert response.status_code == 200
+        assert response.json()["columns"] == ["name", "age", "city"]
+        assert response.json()["count"] == 3
+    
+    def test_process_matches_upload_endpoint(self, client):
+        """Test each operation returns the same result as /api/process/csv"""
+        dataset_id = self.upload(client)
+        files = {"file": ("test.csv", create_test_csv_data(), "text/csv")}
+        
+        for data in (
+            {"operation": "view"},
+            {"operation": "filter", "filter_column": "age", "filter_value": "25"},
+            {"operation": "transform", "transform_column": "name", "transform_operation": "uppercase"},
+            {"operation": "aggregate", "filter_column": "city"},
+            {"operation": "sort", "filter_column": "age", "sort_type": "numeric", "descending": "true"}
+        ):
+            expected = client.post("/api/process/csv", files=files, data=data).json()
+            expected.pop("csv_format")
+            result = client.post(f"/api/datasets/{dataset_id}/process", data=data).json()
+            result.pop("dataset_id", None)
+            assert result == expected
+    
+    def test_chained_result_and_download(self, client):
+        """Test row results become datasets that can be processed and downloaded"""
+        dataset_id = self.upload(client)
+        
+        filtered = client.post(
+            f"/api/datasets/{dataset_id}/process",
+            data={"operation": "filter", "filter_column": "age", "filter_value": "25"}
+        ).json()
+        sorted_result = client.post(
+            f"/api/datasets/{filtered['dataset_id']}/process",
+            data={"operation": "sort", "filter_column": "name"}
+        ).json()
+        response = client.get(f"/api/datasets/{sorted_result['dataset_id']}/download")
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        assert "attachment" in response.headers["content-disposition"]
+        assert response.text == "name,age,city\r\nBob,25,Paris\r\nJohn,25,New York\r\n"
+    
+    def test_unknown_and_deleted(self, client):
+        """Test unknown or deleted ids return 404"""
+        dataset_id = self.upload(client)
+        
+        assert client.delete(f"/api/datasets/{dataset_id}").status_code == 204
+        assert client.get(f"/api/datasets/{dataset_id}").status_code == 404
+        assert client.post(f"/api/datasets/{dataset_id}/process", data={"operation": "view"}).status_code == 404
+        assert client.get("/api/datasets/missing/download").status_code == 404
+    
+    def test_empty_upload(self, client):
+        """Test an empty CSV is rejected"""
+        response = client.post("/api/datasets", files={"file": ("test.csv", b"", "text/csv")})
+        
+        assert response.status_code == 400
+    
+    def test_store_eviction_and_ttl(self, monkeypatch):
+        """Test least recently used datasets are evicted by size and idle ones by age"""
+        table = CSVTable(["a"], [["x" * 7] * 10])
+        store = DatasetStore(max_bytes=2 * main.estimate_table_size(table), ttl_seconds=60)
+        first = store.add(table)
+        second = store.add(table)
+        store.get(first.id)
+        third = store.add(table)
+        
+        assert store.get(second.id) is None
+        assert store.get(first.id) is not None
+        
+        now = main.time.time()
+        monkeypatch.setattr(main.time, "time", lambda: now + 61)
+        assert store.get(third.id) is None
+        assert store.metrics()["datasets"] == 0
+        
+        with pytest.raises(DatasetTooLargeError):
+            DatasetStore(max_bytes=10, ttl_seconds=60).add(table)
+    
+    def test_upload_near_max_file_size_is_stored(self, client, monkeypatch):
+        """Test a file just under the deployed MAX_FILE_SIZE fits the deployed DATASET_MAX_BYTES"""
+        with open(os.path.join(os.path.dirname(__file__), "k8s", "configmap.yaml")) as f:
+            config = dict(re.findall(r'^\s+(\w+): "(\d+)"', f.read(), re.MULTILINE))
+        max_file_size = int(config["MAX_FILE_SIZE"])
+        monkeypatch.setattr(main, "DATASETS", DatasetStore(int(config["DATASET_MAX_BYTES"]), ttl_seconds=60))
+        
+        for header, row in (
+            ("a,b,c,d,e,f,g,h,i,j\n", "1,2,3,4,5,6,7,8,9,0\n"),
+            ("name,age,city,email\n", "Person Name,42,Springfield,person.name@example.com\n")
+        ):
+            rows = (max_file_size - len(header)) // len(row)
+            content = (header + row * rows).encode()
+            response = client.post("/api/datasets", files={"file": ("big.csv", content, "text/csv")})
+        
+            assert response.status_code == 201
+            assert response.json()["count"] == rows
+
+
+class TestDatasetIndexes:
+    """Tests for the lazy hash and sorted column indexes of stored tables"""
+    
+    def create_tables(self):
+        rng = random.Random(11)
+        values = ["10", "9", "2.5", "-1", "", "abc", "1e3", "nan", "10.0", "b", "B", "a", "ab"]
+        columns = [[rng.choice(values) for _ in range(400)] for _ in range(2)]
+        plain = CSVTable(["value", "other"], columns)
+        indexed = CSVTable(["value", "other"], columns)
+        indexed.indexed = True
+        return plain, indexed
+    
+    def test_filters_match_scans(self):
+        """Test every indexed filter gives the rows, in order, of a scan"""
+        plain, indexed = self.create_tables()
+        expressions = [
+            {"column": "value", "op": op, "value": value}
+            for op in ("=", "<", "<=", ">", ">=", "prefix", "!=")
+            for value in ("10", 10, 2.5, "", "a", "zz", -5)
+            if not (op == "prefix" and not isinstance(value, str))
+        ] + [
+            {"column": "value", "op": "between", "value": [-1, 10]},
+            {"column": "value", "op": "between", "value": ["a", "b"]},
+            {"column": "value", "op": "in", "value": ["b", "abc", "missing"]},
+            {"column": "value", "op": "in", "value": [10, 9]},
+            {"and": [{"column": "other", "op": "regex", "value": "^[ab]"}, {"column": "value", "op": ">=", "value": 0}]},
+            {"or": [{"column": "value", "op": "=", "value": "B"}, {"column": "other", "op": "<", "value": 3}]},
+            {"not": {"column": "value", "op": "=", "value": "b"}}
+        ]
+        
+        for expression in expressions:
+            expected = filter_table_expression(plain, expression, "python")
+            assert filter_table_expression(indexed, expression, "python").data == expected.data, expression
+        for value in ("10", "", "missing"):
+            assert main.filter_table(indexed, "VALUE", value).data == main.filter_table(plain, "value", value).data
+        assert {"column": "value", "index": "hash"} in indexed.index_info()
+        assert {"column": "value", "index": "sorted", "sort_type": "numeric"} in indexed.index_info()
+    
+    def test_sorts_match_sort_table(self):
+        """Test index-based sorts and top_n keep sort_table's order, ties and unparsed cells"""
+        plain, indexed = self.create_tables()
+        
+        for sort_type in ("string", "numeric", "date"):
+            for descending in (False, True):
+                expected = main.sort_table(plain, "value", "python", sort_type, descending)
+                assert main.sort_table(indexed, "value", "python", sort_type, descending).data == expected.data
+                top, total = main.top_sorted(indexed, 25, "value", sort_type, descending)
+                assert top.data == expected.slice(0, 25).data and total == 400
+    
+    def test_datasets_are_indexed(self, client):
+        """Test stored datasets build indexes on first use and report them"""
+        files = {"file": ("test.csv", create_test_csv_data(), "text/csv")}
+        dataset_id = client.post("/api/datasets", files=files).json()["id"]
+        
+        for value in ("25", "30", "99"):
+            client.post(f"/api/datasets/{dataset_id}/process", data={"operation": "filter", "filter_column": "age", "filter_value": value})
+        sorted_result = client.post(f"/api/datasets/{dataset_id}/process", data={"operation": "sort", "sort_columns": "city"}).json()
+        info = client.get(f"/api/datasets/{dataset_id}").json()
+        
+        assert [row["city"] for row in sorted_result["rows"]] == ["London", "New York", "Paris"]
+        assert info["indexes"] == [
+            {"column": "age", "index": "hash"},
+            {"column": "city", "index": "sorted", "sort_type": "string"}
+        ]
+
+    
+    def test_indexes_count_towards_store_size(self, monkeypatch):
+        """Test built indexes are charged to the store, evict idle datasets and are not kept when too big"""
+        monkeypatch.setattr(main, "DATASET_INDEXES", True)
+        _, table = self.create_tables()
+        size = main.estimate_table_size(table)
+        index_size = main.estimate_index_size(table.hash_index(0))
+        store = main.DatasetStore(max_bytes=2 * size + index_size // 2, ttl_seconds=60)
+        idle = store.add(CSVTable(table.columns, table.data))
+        dataset = store.add(CSVTable(table.columns, table.data))
+        
+        dataset.table.hash_index(0)
+        
+        assert dataset.index_bytes == index_size
+        assert store.get(idle.id) is None
+        assert store.metrics()["bytes"] == size + index_size
+        # An index that does not fit next to its table is built for the query but not kept
+        store.max_bytes = size + index_size + 10
+        sorted_table = main.sort_table(dataset.table, "other", "python")
+        assert sorted_table.data == main.sort_table(CSVTable(table.columns, table.data), "other", "python").data
+        assert dataset.table.index_info() == [{"column": "value", "index": "hash"}]
+        store.delete(dataset.id)
+        assert store.metrics()["bytes"] == 0
+
+    
+    def test_concurrent_index_builds_are_charged_once(self):
+        """Test an index another request finished first is reused instead of charged again"""
+        _, table = self.create_tables()
+        charges = []
+        table.index_budget = lambda size: charges.append(size) or True
+        
+        def build():
+            # Another request builds and caches the same index meanwhile
+            first.append(table.cached_index(("hash-index", 0), lambda: {"x": [1]}))
+            return {"y": [2]}
+        
+        first = []
+        index = table.cached_index(("hash-index", 0), build)
+        
+        assert index is first[0] and table.hash_index(0) is first[0]
+        assert len(charges) == 1
+
+
+@pytest.fixture
+def aggregations(monkeypatch, tmp_path):
+    """An aggregation store snapshotting into a temporary directory"""
+    store = main.AggregationStore(str(tmp_path / "states"), max_states=2)
+    monkeypatch.setattr(main, "AGGREGATIONS", store)
+    return store
+
+
+class TestAggregationStates:
+    """Tests for incremental aggregation over appended chunks"""
+    
+    def chunks(self):
+        rng = random.Random(5)
+        lines = [f"{rng.choice(['Paris', 'Rome', 'Oslo'])},{rng.randint(1, 90)}" for _ in range(300)]
+        # Later chunks may name and order their columns differently
+        return (
+            "city,age\n" + "\n".join(lines[:100]) + "\n",
+            "City,Age\n" + "\n".join(lines[100:250]) + "\n",
+            "age,city\n" + "\n".join(",".join(reversed(line.split(","))) for line in lines[250:]) + "\n"
+        ), "city,age\n" + "\n".join(lines) + "\n"
+    
+    def append(self, client, name, content):
+        response = client.post(f"/api/aggregations/{name}/chunks", files={"file": ("chunk.csv", content, "text/csv")})
+        assert response.status_code == 200
+        return response.json()
+    
+    def test_value_counts_match_one_pass(self, client, aggregations):
+        """Test counts merged chunk by chunk equal counting the whole file"""
+        chunks, whole = self.chunks()
+        created = client.put("/api/aggregations/cities", data={"filter_column": "CITY"})
+        appended = [self.append(client, "cities", chunk) for chunk in chunks]
+        result = client.get("/api/aggregations/cities").json()
+        expected = client.post("/api/process/csv", files={"file": ("all.csv", whole, "text/csv")},
+                               data={"operation": "aggregate", "filter_column": "city"}).json()
+        
+        assert created.status_code == 201 and created.json()["chunks"] == 0
+        assert [info["chunk_rows"] for info in appended] == [100, 150, 50]
+        assert appended[-1]["chunks"] == 3 and appended[-1]["total_rows"] == 300
+        assert result["state"]["groups"] == 3
+        assert {key: result[key] for key in ("aggregation", "total_rows", "column")} == {
+            key: expected[key] for key in ("aggregation", "total_rows", "column")
+        }
+    
+    def test_typed_aggregate_matches_one_pass(self, client, aggregations):
+        """Test group statistics and percentiles merged per chunk equal one pass"""
+        chunks, whole = self.chunks()
+        fields = {"group_by": "city", "value_columns": "age", "aggregations": "count,sum,mean,min,max,stddev,p50"}
+        client.put("/api/aggregations/ages", data=fields)
+        empty = client.get("/api/aggregations/ages").json()
+        for chunk in chunks:
+            self.append(client, "ages", chunk)
+        
+        result = client.get("/api/aggregations/ages").json()
+        expected = process_csv_group_aggregate(read_csv_stream(create_csv_file(whole)), ["city"], ["age"], fields["aggregations"].split(","))
+        
+        assert empty["groups"] == [] and empty["total_rows"] == 0
+        assert result["total_rows"] == expected["total_rows"] == 300
+        assert [group["key"] for group in result["groups"]] == [group["key"] for group in expected["groups"]]
+        for mine, theirs in zip(result["groups"], expected["groups"]):
+            assert mine["count"] == theirs["count"]
+            assert mine["values"]["age"] == pytest.approx(theirs["values"]["age"])
+    
+    def test_snapshots_survive_restart(self, client, aggregations, monkeypatch):
+        """Test a new store picks the states up from their snapshots and keeps appending"""
+        chunks, _ = self.chunks()
+        client.put("/api/aggregations/ages", data={"group_by": "city", "value_columns": "age", "aggregations": "mean,p50"})
+        client.put("/api/aggregations/cities", data={"filter_column": "city"})
+        for name in ("ages", "cities"):
+            self.append(client, name, chunks[0])
+        before = {name: client.get(f"/api/aggregations/{name}").json() for name in ("ages", "cities")}
+        
+        monkeypatch.setattr(main, "AGGREGATIONS", main.AggregationStore(aggregations.state_dir))
+        after = {name: client.get(f"/api/aggregations/{name}").json() for name in ("ages", "cities")}
+        appended = self.append(client, "cities", chunks[1])
+        
+        assert after == before
+        assert appended["chunks"] == 2 and appended["total_rows"] == 250
+        assert sorted(os.listdir(aggregations.state_dir)) == ["ages.json", "cities.json"]
+    
+    def test_failed_snapshot_undoes_append(self, client, aggregations, monkeypatch):
+        """Test an append whose snapshot cannot be written leaves the state as it was"""
+        client.put("/api/aggregations/sums", data={"group_by": "city", "value_columns": "age", "aggregations": "count,sum"})
+        self.append(client, "sums", "city,age\nParis,1\nRome,2\n")
+        before = client.get("/api/aggregations/sums").json()
+        
+        def full_disk(source, target):
+            raise OSError("No space left on device")
+        
+        with monkeypatch.context() as patch:
+            patch.setattr(main.os, "replace", full_disk)
+            failed = client.post("/api/aggregations/sums/chunks", files={"file": ("chunk.csv", "city,age\nParis,5\n", "text/csv")})
+        
+        assert failed.status_code == 500
+        assert client.get("/api/aggregations/sums").json() == before
+        assert sorted(os.listdir(aggregations.state_dir)) == ["sums.json"]
+        assert self.append(client, "sums", "city,age\nParis,3\n")["chunks"] == 2
+    
+    def test_overflow_is_rejected_and_survives_restart(self, client, aggregations, monkeypatch):
+        """Test a sum beyond the float range is refused rather than snapshotted as null, before and after a restart"""
+        client.put("/api/aggregations/sums", data={"group_by": "k", "value_columns": "v", "aggregations": "count,sum"})
+        self.append(client, "sums", "k,v\na,1e308\n")
+        before = client.get("/api/aggregations/sums").json()
+        
+        overflow = client.post("/api/aggregations/sums/chunks", files={"file": ("chunk.csv", "k,v\na,1e308\n", "text/csv")})
+        monkeypatch.setattr(main, "AGGREGATIONS", main.AggregationStore(aggregations.state_dir))
+        restarted = client.get("/api/aggregations/sums").json()
+        appended = self.append(client, "sums", "k,v\nb,2\n")
+        
+        assert overflow.status_code == 400 and "out of the float range" in overflow.json()["detail"]
+        assert restarted == before
+        assert appended["chunks"] == 2 and appended["total_rows"] == 2
+        assert client.get("/api/aggregations/sums").json()["groups"][1]["values"]["v"] == {"count": 1, "sum": 2.0}
+    
+    def test_failed_merge_leaves_state(self, aggregations, monkeypatch):
+        """Test an exception part way through a merge does not leave a half-merged state"""
+        params = main.OperationParams(operation="aggregate", group_by=["k"], value_columns=["v"], aggregations=["sum"])
+        state = aggregations.create("sums", params)
+        aggregations.append(state, main.aggregate_chunk(create_csv_file("k,v\na,1\n"), params))
+        before = state.result()
+        
+        def failing_merge(self, other):
+            self.total_rows += other.total_rows
+            raise RuntimeError("merge failed")
+        
+        monkeypatch.setattr(main.GroupByAggregator, "merge", failing_merge)
+        with pytest.raises(RuntimeError):
+            aggregations.append(state, main.aggregate_chunk(create_csv_file("k,v\nb,2\n"), params))
+        
+        assert state.result() == before and state.chunks == 1 and state.total_rows == 1
+    
+    def test_replace_and_delete(self, client, aggregations):
+        """Test PUT resets a state and DELETE removes it with its snapshot"""
+        chunks, _ = self.chunks()
+        client.put("/api/aggregations/cities", data={"filter_column": "city"})
+        self.append(client, "cities", chunks[0])
+        client.put("/api/aggregations/cities", data={"filter_column": "age"})
+        
+        reset = client.get("/api/aggregations/cities").json()
+        
+        assert reset["aggregation"] == {} and reset["column"] == "age"
+        assert [state["name"] for state in client.get("/api/aggregations").json()["aggregations"]] == ["cities"]
+        assert client.delete("/api/aggregations/cities").status_code == 204
+        assert client.get("/api/aggregations/cities").status_code == 404
+        assert os.listdir(aggregations.state_dir) == []
+    
+    def test_errors(self, client, aggregations):
+        """Test bad names, parameters, chunks and the state limit"""
+        files = {"file": ("chunk.csv", create_test_csv_data(), "text/csv")}
+        client.put("/api/aggregations/ages", data={"group_by": "city", "value_columns": "age"})
+        
+        assert client.put("/api/aggregations/bad name", data={"filter_column": "city"}).status_code == 400
+        assert client.put("/api/aggregations/none", data={}).status_code == 400
+        assert client.put("/api/aggregations/bad", data={"group_by": "city", "aggregations": "median"}).status_code == 400
+        assert client.post("/api/aggregations/missing/chunks", files=files).status_code == 404
+        assert client.post("/api/aggregations/ages/chunks", files={"file": ("empty.csv", b"", "text/csv")}).status_code == 400
+        missing_column = client.post("/api/aggregations/ages/chunks", files={"file": ("chunk.csv", "name,age\nJo,3\n", "text/csv")})
+        assert missing_column.status_code == 400 and "city" in missing_column.json()["detail"]
+        assert client.put("/api/aggregations/second", data={"filter_column": "city"}).status_code == 201
+        assert client.put("/api/aggregations/third", data={"filter_column": "city"}).status_code == 409
+        assert client.get("/api/aggregations/ages").json()["state"]["chunks"] == 0
+
+
+class TestJoin:
+    """Tests for hash joins of two uploads or datasets"""
+    
+    PEOPLE = "name,age,city\nJohn,25,New York\nJane,30,London\nBob,25,Paris\nAnn,41,Lima\n"
+    CITIES = "City,Country,Name\nParis,France,Paris\nLondon,UK,London\nNew York,USA,NYC\nParis,Texas,Paris TX\n"
+    
+    def join(self, client, data, left=PEOPLE, right=CITIES):
+        files = {"left": ("people.csv", left, "text/csv"), "right": ("cities.csv", right, "text/csv")}
+        return client.post("/api/join", files=files, data=data)
+    
+    def test_inner_and_left_join(self, client):
+        """Test keys match case-insensitively named columns and clashing right names get a suffix"""
+        inner = self.join(client, {"on": "city"}).json()
+        left = self.join(client, {"on": "city", "how": "left"}).json()
+        
+        assert inner["columns"] == ["name", "age", "city", "Country", "Name_right"]
+        # The people file is smaller, so it is the build side and rows follow the cities file
+        assert inner["join"] == {"how": "inner", "build_side": "left"}
+        assert [(row["name"], row["Country"]) for row in inner["rows"]] == [
+            ("Bob", "France"), ("Jane", "UK"), ("John", "USA"), ("Bob", "Texas")
+        ]
+        assert left["count"] == 5
+        assert left["rows"][-1] == {"name": "Ann", "age": "41", "city": "Lima", "Country": "", "Name_right": ""}
+    
+    def test_smaller_side_is_built(self, client):
+        """Test the build side follows the input sizes"""
+        towns = "".join(f"Town{i},Nowhere,T{i}\n" for i in range(50))
+        parisians = "".join(f"P{i},{i},Paris\n" for i in range(50))
+        
+        large_right = self.join(client, {"on": "city"}, self.PEOPLE, self.CITIES + towns).json()
+        large_left = self.join(client, {"on": "city"}, self.PEOPLE + parisians, self.CITIES).json()
+        
+        assert large_right["join"]["build_side"] == "left" and large_right["count"] == 4
+        assert large_left["join"]["build_side"] == "right" and large_left["count"] == 4 + 2 * 50
+        assert [row["name"] for row in large_left["rows"][:4]] == ["John", "Jane", "Bob", "Bob"]
+    
+    def test_build_side_and_spilling_keep_the_rows(self, monkeypatch, tmp_path):
+        """Test either build side, a stored table and a partitioned spill all give the same rows"""
+        monkeypatch.setattr(main, "SPILL_DIR", str(tmp_path))
+        rng = random.Random(9)
+        left = CSVTable(["k", "a"], [[str(rng.randrange(300)) for _ in range(2000)], [str(i) for i in range(2000)]])
+        right = CSVTable(["K", "b"], [[str(rng.randrange(400)) for _ in range(1500)], [str(i) for i in range(1500)]])
+        for how in ("inner", "left"):
+            expected = list(main.hash_join(left.stream(), right.stream(), ["k"], ["k"], how).records)
+            for build_side in ("left", "right"):
+                built = main.hash_join(left.stream(), right.stream(), ["k"], ["k"], how, build_side)
+                from_table = main.hash_join(left, right, ["k"], ["k"], how, build_side)
+                spilled = main.hash_join(
+                    left.stream(), right.stream(), ["k"], ["k"], how, build_side, memory_budget=1000, partitions=4
+                )
+                
+                rows = list(built.records)
+                assert sorted(rows) == sorted(expected)
+                assert list(from_table.records) == rows
+                assert sorted(spilled.records) == sorted(expected)
+        
+        assert len(expected) > len(left)
+        assert os.listdir(tmp_path) == []
+    
+    def test_datasets_and_operations(self, client):
+        """Test joining stored datasets on several keys and aggregating the joined rows"""
+        ids = [
+            client.post("/api/datasets", files={"file": ("f.csv", content, "text/csv")}).json()["id"]
+            for content in ("a,b,v\n1,x,10\n1,y,20\n2,x,30\n", "A,B,w\n1,x,p\n2,x,q\n2,x,r\n")
+        ]
+        
+        joined = client.post("/api/join", data={"left_dataset": ids[0], "right_dataset": ids[1], "on": "a,b"}).json()
+        counts = client.post("/api/join", data={
+            "left_dataset": ids[0], "right_dataset": ids[1], "on": "a,b", "operation": "aggregate", "filter_column": "a"
+        }).json()
+        
+        assert joined["columns"] == ["a", "b", "v", "w"]
+        assert [row["w"] for row in joined["rows"]] == ["p", "q", "r"]
+        assert counts["aggregation"] == {"1": 1, "2": 2}
+    
+    def test_dataset_key_index_follows_dataset_indexes(self, client, monkeypatch):
+        """Test a single-key join caches its build index only on indexed datasets"""
+        content = "city,n\nParis,1\nRome,2\n"
+        for enabled in (True, False):
+            monkeypatch.setattr(main, "DATASET_INDEXES", enabled)
+            dataset_id = client.post("/api/datasets", files={"file": ("f.csv", content, "text/csv")}).json()["id"]
+            
+            joined = client.post("/api/join", data={"left_dataset": dataset_id, "right_dataset": dataset_id, "on": "city"}).json()
+            info = client.get(f"/api/datasets/{dataset_id}").json()
+            
+            assert joined["count"] == 2
+            assert info["indexes"] == ([{"column": "city", "index": "hash"}] if enabled else [])
+    
+    def test_ndjson_and_paging(self, client):
+        """Test format=ndjson streams the joined rows and limit pages them"""
+        response = self.join(client, {"on": "city", "format": "ndjson"})
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        paged = self.join(client, {"on": "city", "limit": "1", "offset": "1"}).json()
+        
+        assert response.headers["x-join-build-side"] in ("left", "right")
+        assert lines[0] == {"columns": ["name", "age", "city", "Country", "Name_right"]}
+        assert lines[-1] == {"count": 4}
+        assert paged["count"] == 4 and [row["name"] for row in paged["rows"]] == ["Jane"]
+    
+    def test_errors(self, client):
+        """Test missing keys, inputs and columns are 400s and unknown datasets 404s"""
+        both = {"left": ("a.csv", self.PEOPLE, "text/csv"), "right": ("b.csv", self.CITIES, "text/csv")}
+        
+        assert self.join(client, {}).status_code == 400
+        assert self.join(client, {"on": "city", "how": "outer"}).status_code == 400
+        assert self.join(client, {"left_on": "city,name", "right_on": "city"}).status_code == 400
+        missing = self.join(client, {"on": "country"})
+        assert missing.status_code == 400 and "left input: country" in missing.json()["detail"]
+        assert client.post("/api/join", files={"left": both["left"]}, data={"on": "city"}).status_code == 400
+        assert client.post("/api/join", files=both, data={"on": "city", "left_dataset": "x"}).status_code == 400
+        assert client.post("/api/join", files={"left": both["left"]}, data={"on": "city", "right_dataset": "nope"}).status_code == 404
+
+
+class TestExecutor:
+    """Tests for dispatching processing to worker threads and processes"""
+    
+    def test_saturated_returns_503(self, client, monkeypatch):
+        """Test requests are rejected with Retry-After when no worker slot is free"""
+        monkeypatch.setattr(main, "EXECUTOR", OperationExecutor(threads=1, processes=0, process_min_bytes=1, max_pending=0))
+        files = {"file": ("test.csv", create_test_csv_data(), "text/csv")}
+        
+        response = client.post("/api/process/csv", files=files, data={"operation": "view"})
+        
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == str(main.WORKER_RETRY_AFTER_SECONDS)
+        assert main.EXECUTOR.metrics()["rejected"] == 1
+    
+    def test_large_upload_uses_process_pool(self, client, monkeypatch):
+        """Test uploads above the size threshold give the same results from a worker process"""
+        executor = OperationExecutor(threads=1, processes=1, process_min_bytes=1, max_pending=4)
+        monkeypatch.setattr(main, "EXECUTOR", executor)
+        files = {"file": ("test.csv", create_test_csv_data(), "text/csv")}
+        data = {"operation": "filter", "filter_column": "age", "filter_value": "25"}
+        
+        try:
+            response = client.post("/api/process/csv", files=files, data=data)
+            invalid = client.post(
+                "/api/process/csv",
+                files={"file": ("test.csv", b"name\n\xff\xfe\n", "text/csv")},
+                data={"operation": "view", "encoding": "utf-8"}
+            )
+        finally:
+            executor.shutdown()
+        
+        assert response.status_code == 200
+        assert [row["name"] for row in response.json()["rows"]] == ["John", "Bob"]
+        assert invalid.status_code == 400
+        assert executor.metrics()["pending"] == 0
+
+
+class TestParallelParsing:
+    """Tests for splitting uploads at record boundaries and map/reduce over chunks"""
+    
+    def create_quoted_csv(self) -> bytes:
+        rng = random.Random(3)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["id", "note", "group"])
+        for i in range(300):
+            note = rng.choice(["plain", "with, comma", "line\nbreak", 'say "hi"\n\nend', ""])
+            writer.writerow([i, note, rng.choice("abc")])
+        return buffer.getvalue().encode("utf-8")
+    
+    def test_read_csv_header(self):
+        """Test the header may span lines inside quotes and blank leading lines are skipped"""
+        stream = io.BytesIO(b'\n"first\nname",age\nJohn,25\n')
+        
+        header, offset = read_csv_header(stream)
+        
+        assert header == ["first\nname", "age"]
+        assert stream.getvalue()[offset:] == b"John,25\n"
+        assert read_csv_header(io.BytesIO(b"\n\n")) == (None, 2)
+    
+    def test_ranges_end_on_record_boundaries(self):
+        """Test parsing every range separately gives the same records as one pass"""
+        payload = self.create_quoted_csv()
+        stream = io.BytesIO(payload)
+        header, offset = read_csv_header(stream)
+        
+        ranges = split_csv_ranges(stream, offset, len(payload), chunk_bytes=97, block_size=64)
+        
+        assert len(ranges) > 10
+        assert ranges[0][0] == offset and ranges[-1][1] == len(payload)
+        assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+        chunked = [record for start, end in ranges
+                   for record in csv.reader(io.StringIO(payload[start:end].decode("utf-8"), newline=""))]
+        assert chunked == list(csv.reader(io.StringIO(payload.decode("utf-8"), newline="")))[1:]
+    
+    def test_stray_quote_falls_back_to_one_pass(self, client, monkeypatch):
+        """Test a literal quote in an unquoted field stops the split instead of cutting a quoted record"""
+        quoted = self.create_quoted_csv()
+        header, _, body = quoted.partition(b"\n")
+        payload = header + b"\n" + b'0,5\'10",a\n' + body
+        offset = len(header) + 1
+        
+        for numpy_module in (main.np, None):
+            monkeypatch.setattr(main, "np", numpy_module)
+            assert split_csv_ranges(io.BytesIO(payload), offset, len(payload), chunk_bytes=97, block_size=64) is None
+            assert split_csv_ranges(io.BytesIO(quoted), offset, len(quoted), chunk_bytes=97, block_size=64)
+        
+        files = {"file": ("test.csv", payload, "text/csv")}
+        data = {"operation": "aggregate", "filter_column": "note"}
+        RESULT_CACHE.max_bytes, cache_size = 0, RESULT_CACHE.max_bytes
+        try:
+            expected = client.post("/api/process/csv", files=files, data=data).json()
+            executor = OperationExecutor(threads=1, processes=1, process_min_bytes=1, max_pending=4)
+            monkeypatch.setattr(main, "EXECUTOR", executor)
+            monkeypatch.setattr(main, "PARALLEL_PARSE_MIN_BYTES", 1)
+            monkeypatch.setattr(main, "PARSE_CHUNK_BYTES", 512)
+            try:
+                parallel = client.post("/api/process/csv", files=files, data=data).json()
+            finally:
+                executor.shutdown()
+        finally:
+            RESULT_CACHE.max_bytes = cache_size
+        
+        assert parallel["aggregation"] == expected["aggregation"]
+        assert expected["aggregation"]["5'10\""] == 1
+    
+    def test_endpoint_map_reduce_matches_serial(self, client, monkeypatch):
+        """Test filter and aggregate over chunks on several processes match the serial results"""
+        payload = self.create_quoted_csv()
+        files = {"file": ("test.csv", payload, "text/csv")}
+        cases = [
+            {"operation": "filter", "filter_column": "group", "filter_value": "b"},
+            {"operation": "filter", "filter_column": "group", "filter_value": "b", "columns": "note,ID"},
+            {"operation": "aggregate", "filter_column": "note"},
+            {"operation": "aggregate", "filter_column": "group", "approximate": "true"},
+            {"operation": "aggregate", "group_by": "group", "value_columns": "id", "aggregations": "count,sum,min,max"}
+        ]
+        RESULT_CACHE.max_bytes, cache_size = 0, RESULT_CACHE.max_bytes
+        try:
+            expected = [client.post("/api/process/csv", files=files, data=data).json() for data in cases]
+            
+            executor = OperationExecutor(threads=1, processes=2, process_min_bytes=1, max_pending=4)
+            monkeypatch.setattr(main, "EXECUTOR", executor)
+            monkeypatch.setattr(main, "PARALLEL_PARSE_MIN_BYTES", 1)
+            monkeypatch.setattr(main, "PARSE_CHUNK_BYTES", 512)
+            calls = []
+            parallel = main.process_upload_parallel
+            monkeypatch.setattr(main, "process_upload_parallel", lambda *args: calls.append(args) or parallel(*args))
+            try:
+                results = [client.post("/api/process/csv", files=files, data=data).json() for data in cases]
+            finally:
+                executor.shutdown()
+        finally:
+            RESULT_CACHE.max_bytes = cache_size
+        
+        assert len(calls) == len(cases)
+        assert results == expected
+        assert results[0]["count"] > 0
+        assert results[1]["columns"] == ["note", "id"]
+
+
+def create_engine_test_table() -> CSVTable:
+    """Create a table with duplicates, empty cells, unicode and one long value"""
+    rng = random.Random(7)
+    values = ["a", "B", "b", "", "é", "Zoë", "10", "9", "x" * 80, "ñandú", "a "]
+    names = [rng.choice(values) for _ in range(500)]
+    ids = [str(i) for i in range(500)]
+    return CSVTable(["id", "Name"], [ids, names])
+
+
+@pytest.mark.parametrize("engine", sorted(ENGINES))
+class TestEngines:
+    """Every installed engine must return exactly what the python engine returns"""
+    
+    def test_filter_matches_python(self, engine):
+        """Test filtering tables and streams"""
+        table = create_engine_test_table()
+        
+        for value in ["a", "", "x" * 80, "missing"]:
+            expected = process_csv_filter(table, "name", value, "python")
+            assert process_csv_filter(table, "name", value, engine) == expected
+            assert process_csv_filter(table.stream(), "name", value, engine) == expected
+    
+    def test_filter_expression_matches_python(self, engine, monkeypatch):
+        """Test compound expressions on tables and batched streams"""
+        monkeypatch.setattr(main, "ENGINE_BATCH_ROWS", 64)
+        table = create_engine_test_table()
+        expressions = [
+            {"and": [{"column": "id", "op": ">=", "value": 100}, {"not": {"column": "name", "op": "in", "value": ["a", "B"]}}]},
+            {"or": [
+                {"column": "name", "op": "prefix", "value": "x"},
+                {"column": "name", "op": "regex", "value": "^[Zñ]"},
+                {"column": "id", "op": "between", "value": [10, 20]}
+            ]},
+            {"column": "name", "op": "<", "value": "b"},
+            {"column": "name", "op": "between", "value": ["B", "a"]},
+            {"column": "name", "op": "!=", "value": 9, "numeric": True},
+            {"column": "id", "op": "in", "value": [3, 30, 300]},
+            {"column": "missing", "op": "=", "value": ""}
+        ]
+        
+        for expression in expressions:
+            expected = filter_table_expression(table, expression, "python").data
+            assert filter_table_expression(table, expression, engine).data == expected
+            assert CSVTable.from_stream(filter_stream_expression(table.stream(), expression, engine)).data == expected
+    
+    def test_aggregate_matches_python(self, engine, monkeypatch):
+        """Test counts and their first-appearance order, including across batches"""
+        monkeypatch.setattr(main, "ENGINE_BATCH_ROWS", 64)
+        table = create_engine_test_table()
+        expected = process_csv_aggregate(table, "name", "python")
+        
+        for source in (table, table.stream()):
+            result = process_csv_aggregate(source, "name", engine)
+            assert result == expected
+            assert list(result["aggregation"]) == list(expected["aggregation"])
+    
+    def test_sort_matches_python(self, engine):
+        """Test sorting is stable and uses the same string order"""
+        table = create_engine_test_table()
+        
+        assert process_csv_sort(table, "name", engine) == process_csv_sort(table, "name", "python")
+    
+    def test_endpoint_engine(self, client, engine):
+        """Test the engine form field"""
+        files = {"file": ("test.csv", create_test_csv_data(), "text/csv")}
+        data = {"operation": "aggregate", "filter_column": "city", "engine": engine}
+        
+        response = client.post("/api/process/csv", files=files, data=data)
+        
+        assert response.status_code == 200
+        assert response.json()["aggregation"] == {"New York": 1, "London": 1, "Paris": 1}
+
+
+class TestEngineSelection:
+    """Unit tests for engine selection"""
+    
+    def test_auto_prefers_vectorized(self):
+        """Test auto picks a vectorized engine whenever one is installed"""
+        assert get_engine("auto").vectorized == (len(ENGINES) > 1)
+    
+    def test_unknown_engine(self, client):
+        """Test unknown engines are rejected with a 400"""
+        files = {"file": ("test.csv", create_test_csv_data(), "text/csv")}
+        data = {"operation": "view", "engine": "gpu"}
+        
+        response = client.post("/api/process/csv", files=files, data=data)
+        
+        assert response.status_code == 400
+        assert "engine" in response.json()["detail"].lower()
+
+
 class TestAPIEndpoints:
     """Unit tests for API endpoints"""
     
@@ -300,6 +2234,57 @@ class TestAPIEndpoints:
         # This tests the error handling
         assert response.status_code in [200, 400, 500]
     
+    def test_process_csv_invalid_encoding(self, client):
+        """Test uploads that do not decode with the given encoding are rejected while streaming"""
+        files = {"file": ("test.csv", b"name,age\n\xff\xfe,25\n", "text/csv")}
+        data = {"operation": "aggregate", "filter_column": "name", "encoding": "utf-8"}
+        
+        response = client.post("/api/process/csv", files=files, data=data)
+        
+        assert response.status_code == 400
+        assert "encoding" in response.json()["detail"].lower()
+    
+    def test_process_csv_ndjson_filter(self, client):
+        """Test streamed NDJSON output for a filter"""
+        files = {"file": ("test.csv", create_test_csv_data(), "text/csv")}
+        data = {"operation": "filter", "filter_column": "age", "filter_value": "25", "format": "ndjson"}
+        
+        response = client.post("/api/process/csv", files=files, data=data)
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert lines[0] == {"columns": ["name", "age", "city"]}
+        assert [row["name"] for row in lines[1:-1]] == ["John", "Bob"]
+        assert lines[-1] == {"count": 2}
+    
+    def test_process_csv_ndjson_accept_header_large_file(self, client):
+        """Test the Accept header opts in and spooled-to-disk uploads stream fully"""
+        csv_content = "id,name\n" + "".join(f"{i},user{i}\n" for i in range(100000))
+        files = {"file": ("test.csv", csv_content.encode('utf-8'), "text/csv")}
+        data = {"operation": "transform", "transform_column": "name", "transform_operation": "uppercase"}
+        
+        response = client.post(
+            "/api/process/csv", files=files, data=data, headers={"Accept": "application/x-ndjson"}
+        )
+        
+        assert response.status_code == 200
+        lines = response.text.splitlines()
+        assert len(lines) == 100002
+        assert json.loads(lines[1]) == {"id": "0", "name": "USER0"}
+        assert json.loads(lines[-1]) == {"count": 100000}
+    
+    def test_process_csv_ndjson_aggregate(self, client):
+        """Test aggregate emits a single NDJSON line"""
+        files = {"file": ("test.csv", create_test_csv_data(), "text/csv")}
+        data = {"operation": "aggregate", "filter_column": "city", "format": "ndjson"}
+        
+        response = client.post("/api/process/csv", files=files, data=data)
+        
+        lines = response.text.splitlines()
+        assert len(lines) == 1
+        assert json.loads(lines[0])["total_rows"] == 3
+    
     def test_download_csv_success(self, client):
         """Test downloading processed CSV"""
         data = {
@@ -324,6 +2309,36 @@ class TestAPIEndpoints:
         assert response.status_code == 400
         assert "no rows" in response.json()["detail"].lower()
     
+    def test_download_csv_leaves_no_temp_files(self, client, monkeypatch, tmp_path):
+        """Test the download is streamed without writing temporary files"""
+        monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+        data = {"rows": [{"name": "John", "age": "25"}, {"name": "Jane", "age": "30"}]}
+        
+        response = client.post("/api/download/csv", json=data, headers={"Accept-Encoding": "identity"})
+        
+        assert response.status_code == 200
+        assert response.text == "name,age\r\nJohn,25\r\nJane,30\r\n"
+        assert list(tmp_path.iterdir()) == []
+    
+    def test_download_csv_gzip(self, client):
+        """Test the download is gzip-encoded only when the client accepts it"""
+        data = {"rows": [{"name": "John", "age": "25"}, {"age": "30", "city": "London"}], "columns": ["age", "name"]}
+        
+        compressed = client.post("/api/download/csv", json=data, headers={"Accept-Encoding": "gzip"})
+        plain = client.post("/api/download/csv", json=data, headers={"Accept-Encoding": "gzip;q=0, identity"})
+        
+        assert compressed.headers["content-encoding"] == "gzip"
+        assert "content-encoding" not in plain.headers
+        assert compressed.text == plain.text == "age,name\r\n25,John\r\n30,\r\n"
+    
+    def test_download_csv_header_covers_every_row(self, client):
+        """Test keys missing from the first row still get a column, in first-seen order"""
+        data = {"rows": [{"name": "John"}, {"age": "30", "name": "Jane"}, {"city": "Oslo"}]}
+        
+        response = client.post("/api/download/csv", json=data, headers={"Accept-Encoding": "identity"})
+        
+        assert response.text == "name,age,city\r\nJohn,,\r\nJane,30,\r\n,,Oslo\r\n"
+    
     def test_download_csv_missing_rows(self, client):
         """Test downloading CSV with missing rows key"""
         data = {}